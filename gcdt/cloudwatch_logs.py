@@ -6,11 +6,21 @@ botocore docs: http://botocore.readthedocs.io/en/latest/reference/services/logs.
 
 from __future__ import unicode_literals, print_function
 
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import maya
 from .gcdt_logging import getLogger
 
 from .utils import GracefulExit
 
+try:
+    import queue
+except ImportError:  # python2
+    import Queue as queue
+
 
 log = getLogger(__name__)
 
@@ -53,6 +63,224 @@ def put_retention_policy(awsclient, log_group_name, retention_in_days):
     )
 
 
+# pages buffered per time slice in concurrent mode
+SLICE_QUEUE_SIZE = 2
+
+
+def _filter_log_events_request(log_group_name, start_ts, end_ts=None,
+                               log_stream_names=None, filter_pattern=None):
+    request = {
+        'logGroupName': log_group_name,
+        'startTime': start_ts
+    }
+    if end_ts:
+        request['endTime'] = end_ts
+    if log_stream_names:
+        request['logStreamNames'] = log_stream_names
+    if filter_pattern:
+        request['filterPattern'] = filter_pattern
+    return request
+
+
+def _iter_log_event_pages(client_logs, request):
+    # pages of log events ({'timestamp', 'message', 'eventId'})
+    request = dict(request)
+    while True:
+        response = client_logs.filter_log_events(**request)
+        yield [{'timestamp': e['timestamp'], 'message': e['message'],
+                'eventId': e.get('eventId'),
+                'logStreamName': e.get('logStreamName')}
+               for e in response['events']]
+        if 'nextToken' not in response:
+            break
+        request['nextToken'] = response['nextToken']
+
+
+def iter_log_events(awsclient, log_group_name, start_ts, end_ts=None,
+                    log_stream_names=None, filter_pattern=None):
+    """Generator for log events. Events are yielded as the pages arrive.
+
+    :param log_group_name: log group name
+    :param start_ts: timestamp
+    :param end_ts: timestamp
+    :param log_stream_names: only events from these log streams
+    :param filter_pattern: CloudWatch Logs filter pattern
+    :return: log entries {'timestamp', 'message', 'eventId', 'logStreamName'}
+    """
+    client_logs = awsclient.get_client('logs')
+    request = _filter_log_events_request(log_group_name, start_ts, end_ts,
+                                         log_stream_names, filter_pattern)
+    for page in _iter_log_event_pages(client_logs, request):
+        for event in page:
+            yield event
+
+
+def _split_time_range(start_ts, end_ts, slices):
+    # list of (start, end) covering [start_ts, end_ts] without overlap
+    total = max(end_ts - start_ts + 1, 1)
+    slices = min(slices, total)
+    bounds = [start_ts + total * i // slices for i in range(slices + 1)]
+    return [(bounds[i], bounds[i + 1] - 1) for i in range(slices)]
+
+
+def _put(out, item, stop):
+    # put unless the consumer stopped; False if stopped
+    while not stop.is_set():
+        try:
+            out.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _fetch_slice(client_logs, request, out, stop):
+    try:
+        for page in _iter_log_event_pages(client_logs, request):
+            if not _put(out, page, stop):
+                return
+    except Exception as e:
+        _put(out, e, stop)
+    _put(out, None, stop)
+
+
+def iter_log_events_concurrent(awsclient, log_group_name, start_ts, end_ts,
+                               log_stream_names=None, filter_pattern=None,
+                               slices=4):
+    """Generator for log events. The time range is split into slices which
+    are fetched concurrently. The events are yielded in timestamp order.
+
+    Only a few pages per slice are buffered so memory usage is bounded.
+
+    :param log_group_name: log group name
+    :param start_ts: timestamp
+    :param end_ts: timestamp
+    :param log_stream_names: only events from these log streams
+    :param filter_pattern: CloudWatch Logs filter pattern
+    :param slices: number of time slices
+    :return: log entries {'timestamp', 'message', 'eventId', 'logStreamName'}
+    """
+    client_logs = awsclient.get_client('logs')
+    ranges = _split_time_range(start_ts, end_ts, slices)
+    queues = [queue.Queue(maxsize=SLICE_QUEUE_SIZE) for _ in ranges]
+    stop = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=len(ranges))
+    try:
+        for (slice_start, slice_end), out in zip(ranges, queues):
+            request = _filter_log_events_request(
+                log_group_name, slice_start, slice_end, log_stream_names,
+                filter_pattern)
+            executor.submit(_fetch_slice, client_logs, request, out, stop)
+        # slices do not overlap so we output one after the other
+        for out in queues:
+            while True:
+                try:
+                    # timeout so signals are handled (python2)
+                    page = out.get(timeout=1)
+                except queue.Empty:
+                    continue
+                if page is None:
+                    break
+                if isinstance(page, Exception):
+                    raise page
+                for event in page:
+                    yield event
+    finally:
+        stop.set()
+        executor.shutdown(wait=True)
+
+
+class LogTail(object):
+    """Continuously fetch new log events of a log group (tail mode).
+
+    Log events can arrive up to lag_window seconds late. Timestamps older
+    than that are fully seen and never queried again. Polls fetch the
+    events from the newest event on, every lag_window / 2 seconds a poll
+    sweeps the whole lag window for late events. Events fetched again are
+    dropped using the eventIds of the events in the lag window (so events
+    which share a millisecond are not lost). The poll interval grows while
+    no events arrive and drops back to the minimum as soon as there are new
+    events.
+
+    The lag window (in seconds) can be changed using the environment
+    variable GCDT_LOGS_TAIL_LAG_WINDOW.
+    """
+    POLL_INTERVAL_MIN = 0.5
+    POLL_INTERVAL_MAX = 5
+    POLL_BACKOFF = 1.5
+
+    def __init__(self, awsclient, log_group_name, start_ts,
+                 log_stream_names=None, filter_pattern=None,
+                 lag_window=None):
+        """
+        :param log_group_name: log group name
+        :param start_ts: timestamp
+        :param log_stream_names: only events from these log streams
+        :param filter_pattern: CloudWatch Logs filter pattern
+        :param lag_window: tolerate events which arrive up to lag_window
+            seconds late
+        """
+        self._client = awsclient.get_client('logs')
+        self._log_group_name = log_group_name
+        self._start_ts = start_ts
+        self._log_stream_names = log_stream_names
+        self._filter_pattern = filter_pattern
+        if lag_window is None:
+            lag_window = float(os.getenv('GCDT_LOGS_TAIL_LAG_WINDOW', 10))
+        self._lag_window = int(lag_window * 1000)
+        self._newest_ts = None
+        self._last_sweep = None
+        self._seen = {}  # eventId -> timestamp
+        self.interval = self.POLL_INTERVAL_MIN
+
+    def _query_start(self, now):
+        if self._last_sweep is None:
+            self._last_sweep = now
+            return self._start_ts
+        # late events arrive within the lag window so the timestamps before
+        # are fully seen and their eventIds are not needed anymore
+        fully_seen = max(self._start_ts, now - self._lag_window)
+        self._seen = dict([(event_id, timestamp) for event_id, timestamp
+                           in self._seen.items() if timestamp >= fully_seen])
+        if now - self._last_sweep >= self._lag_window // 2:
+            self._last_sweep = now
+            return fully_seen
+        return max(fully_seen, self._newest_ts or 0)
+
+    def poll(self):
+        """Fetch the new log events.
+
+        :return: list of log entries which were not returned before
+        """
+        request = _filter_log_events_request(
+            self._log_group_name, self._query_start(int(time.time() * 1000)),
+            log_stream_names=self._log_stream_names,
+            filter_pattern=self._filter_pattern)
+        events = []
+        for page in _iter_log_event_pages(self._client, request):
+            for event in page:
+                if event['eventId'] in self._seen:
+                    continue
+                self._seen[event['eventId']] = event['timestamp']
+                events.append(event)
+        events.sort(key=lambda e: e['timestamp'])
+        if events:
+            self._newest_ts = max(self._newest_ts or 0,
+                                  events[-1]['timestamp'])
+            self.interval = self.POLL_INTERVAL_MIN
+        else:
+            self.interval = min(self.interval * self.POLL_BACKOFF,
+                                self.POLL_INTERVAL_MAX)
+        return events
+
+    def follow(self):
+        """Generator for new log events (stop with Ctrl-C)."""
+        while True:
+            for event in self.poll():
+                yield event
+            time.sleep(self.interval)
+
+
 def filter_log_events(awsclient, log_group_name, start_ts, end_ts=None):
     """
     Note: this is used to retrieve logs in ramuda.
@@ -62,27 +290,9 @@ def filter_log_events(awsclient, log_group_name, start_ts, end_ts=None):
     :param end_ts: timestamp
     :return: list of log entries
     """
-    client_logs = awsclient.get_client('logs')
-    logs = []
-    next_token = None
-    while True:
-        request = {
-            'logGroupName': log_group_name,
-            'startTime': start_ts
-        }
-        if end_ts:
-            request['endTime'] = end_ts
-        if next_token:
-            request['nextToken'] = next_token
-        response = client_logs.filter_log_events(**request)
-        logs.extend(
-            [{'timestamp': e['timestamp'], 'message': e['message']}
-             for e in response['events']]
-        )
-        if 'nextToken' not in response:
-            break
-        next_token = response['nextToken']
-    return logs
+    return [{'timestamp': e['timestamp'], 'message': e['message']}
+            for e in iter_log_events(awsclient, log_group_name, start_ts,
+                                     end_ts)]
 
 
 # these functions we need so we can test a log group lifecycle
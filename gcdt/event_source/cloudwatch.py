@@ -15,6 +15,7 @@
 from __future__ import unicode_literals, print_function
 
 from . import base
+from ..gcdt_pagination import find_item
 import logging
 import uuid
 
@@ -34,13 +35,9 @@ class CloudWatchEventSource(base.EventSource):
         return self.get_rule()
 
     def get_rule(self):
-        response = self._events.list_rules(NamePrefix=self._name)
-        LOG.debug(response)
-        if 'Rules' in response:
-            for r in response['Rules']:
-                if r['Name'] == self._name:
-                    return r
-        return None
+        return find_item(self._events, 'list_rules', 'Rules',
+                         lambda r: r['Name'] == self._name,
+                         NamePrefix=self._name)
 
     def add(self, lambda_arn):
         lambda_name = base.get_lambda_name(lambda_arn)
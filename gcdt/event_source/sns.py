@@ -15,6 +15,7 @@
 from __future__ import unicode_literals, print_function
 
 from . import base
+from ..gcdt_pagination import find_item
 import logging
 
 from botocore.exceptions import ClientError
@@ -34,13 +35,10 @@ class SNSEventSource(base.EventSource):
 
     def exists(self, lambda_arn):
         try:
-            response = self._sns.list_subscriptions_by_topic(
-                TopicArn=self.arn
-            )
-            LOG.debug(response)
-            for subscription in response['Subscriptions']:
-                if subscription['Endpoint'] == lambda_arn:
-                    return subscription
+            return find_item(self._sns, 'list_subscriptions_by_topic',
+                             'Subscriptions',
+                             lambda s: s['Endpoint'] == lambda_arn,
+                             TopicArn=self.arn)
         except Exception:
             LOG.exception('Unable to find event source %s', self.arn)
         return None
@@ -4,18 +4,172 @@ This module abstracts the botocore session and clients
 to provide a simpler interface.
 """
 from __future__ import unicode_literals, print_function
+import logging
+import threading
+
 from botocore.exceptions import ClientError  # used in plugins
 
+from .gcdt_metrics import ApiMetrics
+from .gcdt_ratelimit import RetryPolicy
+
+log = logging.getLogger(__name__)
+
+# clients are created by a small pool while gcdt initializes
+PREWARM_WORKERS = 4
+PREWARM_TIMEOUT = 10  # seconds
+
+# settings for the botocore clients (see botocore.config.Config)
+# the default connection pool (10) is too small for concurrent operations
+DEFAULT_CLIENT_CONFIG = {
+    'max_pool_connections': 32,
+    'connect_timeout': 10,
+    'read_timeout': 60
+}
+
+
+def get_client_config(**kwargs):
+    """botocore config shared by all clients of an AWSClient.
+
+    :param kwargs: overrides for DEFAULT_CLIENT_CONFIG
+    :return: botocore.config.Config
+    """
+    from botocore.config import Config
+    settings = dict(DEFAULT_CLIENT_CONFIG)
+    settings.update(kwargs)
+    return Config(**settings)
+
 
 class AWSClient(object):
     # note this is heavily inspired by TypedAWSClient:
     # https://github.com/awslabs/chalice/blob/master/chalice/awsclient.py
-    def __init__(self, session):
+    def __init__(self, session, transfer_config=None, client_config=None):
+        """
+        :param session: botocore session
+        :param transfer_config: s3.TransferConfig used for S3 uploads
+        :param client_config: botocore.config.Config used for all clients
+            (defaults to get_client_config())
+        """
         self._session = session
+        # telemetry of the API calls (needs to be registered before
+        # the clients are created)
+        self.metrics = ApiMetrics()
+        self.metrics.register(session)
+        # rate limiting and retries of throttled requests for all clients
+        self.retry_policy = RetryPolicy()
+        self._sessions = {}  # profile -> botocore session
         self._client_cache = {}
+        self._client_config = client_config
+        # botocore sessions are not thread-safe so clients are created
+        # one at a time. Once created the clients can be shared by threads.
+        self._lock = threading.RLock()
+        self._transfer_config = transfer_config
+        self._uploader = None
+        self._account_id = None
+        self._prewarm_futures = []
+
+    def _get_session(self, profile_name):
+        if profile_name is None:
+            return self._session
+        if profile_name not in self._sessions:
+            import botocore.session
+            self._sessions[profile_name] = botocore.session.Session(
+                profile=profile_name)
+            self.metrics.register(self._sessions[profile_name])
+        return self._sessions[profile_name]
+
+    def get_client(self, service_name, region_name=None, profile_name=None):
+        """Client for the AWS service (one client per service, region and
+        profile which is shared by all threads).
+
+        :param service_name: e.g. 'lambda'
+        :param region_name: defaults to the region of the session
+        :param profile_name: defaults to the profile of the session
+        :return: botocore client
+        """
+        key = (service_name, region_name, profile_name)
+        client = self._client_cache.get(key)
+        if client is None:
+            with self._lock:
+                if key not in self._client_cache:
+                    if self._client_config is None:
+                        self._client_config = get_client_config()
+                    session = self._get_session(profile_name)
+                    client = session.create_client(
+                        service_name, region_name=region_name,
+                        config=self._client_config)
+                    self.retry_policy.install(session, client)
+                    self._client_cache[key] = client
+                client = self._client_cache[key]
+        return client
+
+    def prewarm(self, service_names):
+        """Create clients in the background so the service models are loaded
+        while gcdt initializes (the clients are requested by the commands).
+        Use wait_for_prewarm to make sure the clients are created.
+
+        :param service_names: list of service names
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        def _create_client(service_name):
+            try:
+                self.get_client(service_name)
+            except Exception as e:
+                # get_client reports the problem when the client is used
+                log.debug('prewarming \'%s\' client failed: %s',
+                          service_name, str(e))
+
+        service_names = sorted(set(service_names), key=service_names.index)
+        if not service_names:
+            return
+        executor = ThreadPoolExecutor(
+            max_workers=min(PREWARM_WORKERS, len(service_names)))
+        self._prewarm_futures = [executor.submit(_create_client, name)
+                                 for name in service_names]
+        # the threads exit when the clients are created
+        executor.shutdown(wait=False)
+
+    def wait_for_prewarm(self, timeout=PREWARM_TIMEOUT):
+        """Wait until the clients of prewarm are created.
+
+        :param timeout: seconds
+        :return: True if all clients are created
+        """
+        from concurrent.futures import wait
+        futures, self._prewarm_futures = self._prewarm_futures, []
+        not_done = wait(futures, timeout=timeout).not_done
+        if not_done:
+            log.debug('prewarming clients did not finish within %ss',
+                      timeout)
+        return not not_done
+
+    def get_credentials(self):
+        """Credentials of the botocore session (None if not configured)."""
+        return self._session.get_credentials()
+
+    def get_profile(self):
+        """Name of the AWS profile (None if no profile is configured)."""
+        return self._session.profile
+
+    def get_account_id(self):
+        """Id of the AWS account of the credentials (looked up once)."""
+        if self._account_id is None:
+            self._account_id = self.get_client('sts').get_caller_identity()[
+                'Account']
+        return self._account_id
+
+    def get_uploader(self):
+        """S3 uploader shared by all S3 uploads (see s3.S3Uploader)."""
+        with self._lock:
+            if self._uploader is None:
+                from .s3 import S3Uploader
+                self._uploader = S3Uploader(self.get_client('s3'),
+                                            self._transfer_config)
+        return self._uploader
 
-    def get_client(self, service_name):
-        if service_name not in self._client_cache:
-            self._client_cache[service_name] = self._session.create_client(
-                service_name)
-        return self._client_cache[service_name]
+    def close(self):
+        """Shut down the S3 uploader (waits for running uploads)."""
+        with self._lock:
+            uploader = self._uploader
+        if uploader is not None:
+            uploader.shutdown()
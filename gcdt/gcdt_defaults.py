@@ -20,20 +20,36 @@ hardcoded values.
 
 # note: as a convention this does NOT go into config!
 DEFAULT_CONFIG = {
+    'gcdt': {
+        'non_config_commands': ['cleanup-artifacts'],
+        'prewarm_clients': ['s3']
+    },
+    'kumo': {
+        'non_config_commands': ['deploy-all'],  # reads config of multiple stacks
+        'prewarm_clients': ['cloudformation', 's3']
+    },
     'ramuda': {
         'settings_file': 'settings.json',
         'runtime': ['python2.7', 'python3.6', 'nodejs4.3', 'nodejs6.10'],
         'python_bundle_venv_dir': '.gcdt/venv',
         'keep': False,
-        'non_config_commands': ['logs', 'invoke']  # this command does not require config
+        'non_config_commands': ['logs', 'invoke'],  # this command does not require config
+        'prewarm_clients': ['lambda', 's3', 'logs']
     },
     'tenkai': {
         'settings_file': 'settings.json',
         'stack_output_file': 'stack_output.yml',
-        'log_group': '/var/log/messages'  # conf from baseami (glomex specific)
+        'log_group': '/var/log/messages',  # conf from baseami (glomex specific)
+        'prewarm_clients': ['codedeploy', 's3']
+    },
+    'yugen': {
+        'prewarm_clients': ['apigateway', 'lambda']
     }
 }
 
+# clients used by the credentials check of every tool
+PREWARM_CLIENTS = ['sts']
+
 
 # note this config is used in the config_reader to "overlay" the
 # gcdt_defaults of gcdt.
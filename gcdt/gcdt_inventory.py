@@ -0,0 +1,363 @@
+# -*- coding: utf-8 -*-
+"""Local inventory of the deployed resources (stacks, lambda functions and
+aliases, REST APIs and API keys).
+
+The inventory is an SQLite database in the project's `.gcdt` folder. It is
+opt-in: set GCDT_INVENTORY_TTL (seconds) to use it. List commands refresh the
+inventory (only the changed resources are written) and read from it until
+the TTL expires. Lookups read from the inventory and fall back to live calls
+if the resource is not found or the inventory is stale.
+
+Resources are stored in the shape of the list call (results of get /
+describe / create calls are converted) and come back from the inventory like
+from a live call (including datetimes).
+"""
+from __future__ import unicode_literals, print_function
+import datetime
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from dateutil.parser import parse as parse_datetime
+
+from .gcdt_logging import getLogger
+from .gcdt_pagination import iter_items
+
+log = getLogger(__name__)
+
+
+INVENTORY_FILE = os.path.join('.gcdt', 'inventory.sqlite')
+
+ACTIVE_STACK_STATUS = [
+    'CREATE_IN_PROGRESS', 'CREATE_COMPLETE', 'ROLLBACK_IN_PROGRESS',
+    'ROLLBACK_COMPLETE', 'DELETE_IN_PROGRESS', 'DELETE_FAILED',
+    'UPDATE_IN_PROGRESS', 'UPDATE_COMPLETE_CLEANUP_IN_PROGRESS',
+    'UPDATE_COMPLETE', 'UPDATE_ROLLBACK_IN_PROGRESS',
+    'UPDATE_ROLLBACK_FAILED',
+    'UPDATE_ROLLBACK_COMPLETE_CLEANUP_IN_PROGRESS',
+    'UPDATE_ROLLBACK_COMPLETE',
+]
+
+# kind -> (service, operation, result key, id field, name field, parameters)
+# aliases are listed per function (the function name is the 'parent')
+KINDS = {
+    'stack': ('cloudformation', 'list_stacks', 'StackSummaries',
+              'StackName', 'StackName',
+              {'StackStatusFilter': ACTIVE_STACK_STATUS}),
+    'function': ('lambda', 'list_functions', 'Functions',
+                 'FunctionName', 'FunctionName', {}),
+    'alias': ('lambda', 'list_aliases', 'Aliases', 'Name', 'Name', {}),
+    'rest_api': ('apigateway', 'get_rest_apis', 'items', 'id', 'name', {}),
+    'api_key': ('apigateway', 'get_api_keys', 'items', 'id', 'name', {})
+}
+
+# describe_stacks returns Stacks, list_stacks StackSummaries
+STACK_SUMMARY_FIELDS = [
+    'StackId', 'StackName', 'TemplateDescription', 'CreationTime',
+    'LastUpdatedTime', 'DeletionTime', 'StackStatus', 'StackStatusReason',
+    'ParentId', 'RootId', 'DriftInformation'
+]
+
+_SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS resources (
+        scope TEXT, kind TEXT, id TEXT, name TEXT, data TEXT,
+        PRIMARY KEY (scope, kind, id))''',
+    '''CREATE INDEX IF NOT EXISTS resources_name
+        ON resources (scope, kind, name)''',
+    '''CREATE TABLE IF NOT EXISTS refreshes (
+        scope TEXT, kind TEXT, timestamp REAL,
+        PRIMARY KEY (scope, kind))'''
+]
+
+_lock = threading.Lock()
+_inventory = {}  # filename -> Inventory
+
+
+def _json_default(value):
+    if isinstance(value, datetime.datetime):
+        return {'__datetime__': value.isoformat()}
+    raise TypeError('%r is not JSON serializable' % value)
+
+
+def _json_object_hook(obj):
+    if '__datetime__' in obj:
+        return parse_datetime(obj['__datetime__'])
+    return obj
+
+
+def _dumps(item):
+    return json.dumps(item, sort_keys=True, default=_json_default)
+
+
+def _loads(data):
+    return json.loads(data, object_hook=_json_object_hook)
+
+
+class Inventory(object):
+    """SQLite store of the resources per scope (account / region) and kind.
+
+    A new connection is used per operation so the inventory can be shared by
+    threads (e.g. deploy-all).
+    """
+    def __init__(self, filename=INVENTORY_FILE, ttl=0):
+        self.filename = filename
+        self.ttl = ttl
+        folder = os.path.dirname(filename) or '.'
+        try:
+            os.makedirs(folder)
+        except OSError:
+            if not os.path.isdir(folder):
+                raise
+        conn = self._connect()
+        try:
+            with conn:
+                for statement in _SCHEMA:
+                    conn.execute(statement)
+        finally:
+            conn.close()
+
+    def _connect(self):
+        # the connection context manager commits / rolls back
+        return sqlite3.connect(self.filename, timeout=30)
+
+    def is_fresh(self, scope, kind):
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                'SELECT timestamp FROM refreshes WHERE scope=? AND kind=?',
+                (scope, kind)).fetchone()
+        finally:
+            conn.close()
+        return row is not None and row[0] + self.ttl > time.time()
+
+    def get_items(self, scope, kind):
+        """All resources of a kind (ordered by name).
+
+        :param scope:
+        :param kind:
+        :return: list of items
+        """
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                'SELECT data FROM resources WHERE scope=? AND kind=? '
+                'ORDER BY name, id', (scope, kind)).fetchall()
+        finally:
+            conn.close()
+        return [_loads(row[0]) for row in rows]
+
+    def find_items(self, scope, kind, name):
+        """Resources of a kind with the given name.
+
+        :param scope:
+        :param kind:
+        :param name:
+        :return: list of items
+        """
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                'SELECT data FROM resources WHERE scope=? AND kind=? '
+                'AND name=? ORDER BY id', (scope, kind, name)).fetchall()
+        finally:
+            conn.close()
+        return [_loads(row[0]) for row in rows]
+
+    def update(self, scope, kind, items):
+        """Replace the resources of a kind with the result of a list call.
+        Only the changes are written.
+
+        :param scope:
+        :param kind:
+        :param items: list of (id, name, item)
+        :return: tuple (added / changed, removed)
+        """
+        conn = self._connect()
+        try:
+            with conn:
+                current = dict(conn.execute(
+                    'SELECT id, data FROM resources WHERE scope=? AND kind=?',
+                    (scope, kind)).fetchall())
+                changed = []
+                for id_, name, item in items:
+                    data = _dumps(item)
+                    if current.pop(id_, None) != data:
+                        changed.append((scope, kind, id_, name, data))
+                conn.executemany(
+                    'INSERT OR REPLACE INTO resources VALUES (?, ?, ?, ?, ?)',
+                    changed)
+                conn.executemany(
+                    'DELETE FROM resources WHERE scope=? AND kind=? AND id=?',
+                    [(scope, kind, id_) for id_ in current])
+                conn.execute(
+                    'INSERT OR REPLACE INTO refreshes VALUES (?, ?, ?)',
+                    (scope, kind, time.time()))
+        finally:
+            conn.close()
+        return len(changed), len(current)
+
+    def put(self, scope, kind, id_, name, item):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO resources VALUES (?, ?, ?, ?, ?)',
+                    (scope, kind, id_, name, _dumps(item)))
+        finally:
+            conn.close()
+
+    def remove(self, scope, kind, id_):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    'DELETE FROM resources WHERE scope=? AND kind=? AND id=?',
+                    (scope, kind, id_))
+        finally:
+            conn.close()
+
+
+def _get_ttl():
+    try:
+        return int(os.getenv('GCDT_INVENTORY_TTL', 0))
+    except ValueError:
+        return 0
+
+
+def get_inventory(filename=INVENTORY_FILE):
+    """The inventory of this process.
+
+    :param filename:
+    :return: Inventory or None if the inventory is not used
+    """
+    ttl = _get_ttl()
+    if not ttl:
+        return None
+    with _lock:
+        inventory = _inventory.get(filename)
+        if inventory is None or inventory.ttl != ttl:
+            try:
+                inventory = Inventory(filename, ttl)
+            except (sqlite3.Error, OSError) as e:
+                log.debug('inventory not available: %s', e)
+                return None
+            _inventory[filename] = inventory
+        return inventory
+
+
+def reset_inventory():
+    """Forget the inventory of this process (e.g. for testing)."""
+    with _lock:
+        _inventory.clear()
+
+
+def _get_scope(awsclient, kind, parent=None):
+    # resource names are unique per account and region
+    client = awsclient.get_client(KINDS[kind][0])
+    scope = '%s:%s' % (awsclient.get_account_id(), client.meta.region_name)
+    if parent:
+        scope = '%s:%s' % (scope, parent)
+    return scope
+
+
+def list_resources(awsclient, kind, parent=None, refresh=False):
+    """Iterate the resources of a kind. The resources are read from the
+    inventory if it is fresh, otherwise they are listed (lazily) and the
+    inventory is refreshed when the listing is complete.
+
+    :param awsclient:
+    :param kind: e.g. 'function'
+    :param parent: function name for 'alias'
+    :param refresh: list the resources even if the inventory is fresh
+    :return: generator of items
+    """
+    inventory = get_inventory()
+    service, operation, result_key, id_field, name_field, params = \
+        KINDS[kind]
+    if inventory is not None:
+        scope = _get_scope(awsclient, kind, parent)
+        if not refresh and inventory.is_fresh(scope, kind):
+            for item in inventory.get_items(scope, kind):
+                yield item
+            return
+    params = dict(params)
+    if parent:
+        params['FunctionName'] = parent
+    client = awsclient.get_client(service)
+    items = []
+    for item in iter_items(client, operation, result_key, **params):
+        if inventory is not None:
+            items.append((item[id_field], item[name_field], item))
+        yield item
+    if inventory is not None:
+        changed, removed = inventory.update(scope, kind, items)
+        log.debug('inventory %s: %d changed, %d removed', kind, changed,
+                  removed)
+
+
+def find_resources(awsclient, kind, name, parent=None):
+    """Look up resources by name in the inventory.
+
+    :param awsclient:
+    :param kind: e.g. 'function'
+    :param name:
+    :param parent: function name for 'alias'
+    :return: list of items, None if the resource is not in the inventory or
+        the inventory is not used or stale (use a live call then)
+    """
+    inventory = get_inventory()
+    if inventory is None:
+        return None
+    scope = _get_scope(awsclient, kind, parent)
+    if not inventory.is_fresh(scope, kind):
+        return None
+    return inventory.find_items(scope, kind, name) or None
+
+
+def _normalize(kind, item):
+    # convert the item to the shape of the list call
+    item = dict(item)
+    item.pop('ResponseMetadata', None)
+    if kind == 'stack':
+        if 'Description' in item:
+            item['TemplateDescription'] = item['Description']
+        item = dict((k, v) for k, v in item.items()
+                    if k in STACK_SUMMARY_FIELDS)
+    elif kind == 'api_key':
+        # get_api_keys does not return the key value (create_api_key does)
+        item.pop('value', None)
+    return item
+
+
+def put_resource(awsclient, kind, item, parent=None):
+    """Add or update a resource in the inventory (e.g. the result of a live
+    lookup or a create call).
+
+    :param awsclient:
+    :param kind: e.g. 'function'
+    :param item: resource as returned by the list call or by the get /
+        describe / create call (converted to the shape of the list call)
+    :param parent: function name for 'alias'
+    """
+    inventory = get_inventory()
+    if inventory is not None:
+        id_field, name_field = KINDS[kind][3:5]
+        inventory.put(_get_scope(awsclient, kind, parent), kind,
+                      item[id_field], item[name_field],
+                      _normalize(kind, item))
+
+
+def remove_resource(awsclient, kind, id_, parent=None):
+    """Remove a resource from the inventory (e.g. after a delete call).
+
+    :param awsclient:
+    :param kind: e.g. 'function'
+    :param id_: id of the resource (the name for stacks, functions and
+        aliases)
+    :param parent: function name for 'alias'
+    """
+    inventory = get_inventory()
+    if inventory is not None:
+        inventory.remove(_get_scope(awsclient, kind, parent), kind, id_)
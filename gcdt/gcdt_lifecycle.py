@@ -7,7 +7,6 @@ import signal
 import sys
 from logging.config import dictConfig
 
-import botocore.session
 import os
 from docopt import docopt
 
@@ -16,12 +15,13 @@ from . import gcdt_signals
 from .gcdt_awsclient import AWSClient
 from .gcdt_cmd_dispatcher import cmd, get_command
 from .gcdt_logging import logging_config
+from .gcdt_metrics import report_api_metrics
 from .gcdt_plugins import load_plugins
 from .gcdt_signals import check_hook_mechanism_is_intact, \
     check_register_present
 from .utils import get_context, check_gcdt_update, are_credentials_still_valid, \
     get_env
-from .gcdt_defaults import DEFAULT_CONFIG
+from .gcdt_defaults import DEFAULT_CONFIG, PREWARM_CLIENTS
 
 log = logging.getLogger(__name__)
 
@@ -43,17 +43,38 @@ def _load_hooks(path):
     return module
 
 
+def _report_api_metrics(awsclient, context, metrics_file):
+    # awsclient might not be instrumented (e.g. in tests)
+    metrics = getattr(awsclient, 'metrics', None)
+    if metrics is not None:
+        report_api_metrics(metrics, context, metrics_file)
+
+
+def _wait_for_prewarm(awsclient):
+    # awsclient might not prewarm clients (e.g. in tests)
+    wait_for_prewarm = getattr(awsclient, 'wait_for_prewarm', None)
+    if wait_for_prewarm is not None:
+        wait_for_prewarm()
+
+
 # lifecycle implementation adapted from
 # https://github.com/finklabs/aws-deploy/blob/master/aws_deploy/tool.py
-def lifecycle(awsclient, env, tool, command, arguments):
+def lifecycle(awsclient, env, tool, command, arguments, metrics_file=None,
+              verbose=False):
     """Tool lifecycle which provides hooks into the different stages of the
     command execution. See signals for hook details.
+
+    :param metrics_file: write the API call metrics to this JSON file
+    :param verbose: debug messages are enabled ('-v')
     """
     log.debug('### init')
     load_plugins()
     context = get_context(awsclient, env, tool, command, arguments)
     # every tool needs a awsclient so we provide this via the context
     context['_awsclient'] = awsclient
+    # global options (not part of '_arguments'), e.g. for child processes
+    context['_verbose'] = verbose
+    context['_metrics_file'] = metrics_file
     log.debug('### context:')
     log.debug(context)
     if 'error' in context:
@@ -129,6 +150,8 @@ def lifecycle(awsclient, env, tool, command, arguments):
         return 1
 
     ## dispatch command providing context and config (= tooldata)
+    # the commands use the clients created in the background (see main)
+    _wait_for_prewarm(awsclient)
     gcdt_signals.command_init.send((context, config))
     log.debug('### command_init')
     try:
@@ -146,13 +169,15 @@ def lifecycle(awsclient, env, tool, command, arguments):
     if exit_code:
         if 'error' not in context or context['error'] == '':
             context['error'] = '\'%s\' command failed with exit code 1' % command
+        _report_api_metrics(awsclient, context, metrics_file)
         gcdt_signals.error.send((context, config))
         return 1
 
     gcdt_signals.command_finalized.send((context, config))
     log.debug('### command_finalized')
 
-    # TODO reporting (in case you want to get a summary / output to the user)
+    # summary of the AWS API calls (also available to plugins via context)
+    _report_api_metrics(awsclient, context, metrics_file)
 
     gcdt_signals.finalized.send(context)
     log.debug('### finalized')
@@ -178,6 +203,7 @@ def main(doc, tool, dispatch_only=None):
         command = get_command(arguments)
         # DEBUG mode (if requested)
         verbose = arguments.pop('--verbose', False)
+        metrics_file = arguments.pop('--metrics-file', None)
         if verbose:
             logging_config['loggers']['gcdt']['level'] = 'DEBUG'
         dictConfig(logging_config)
@@ -197,8 +223,17 @@ def main(doc, tool, dispatch_only=None):
                 log.error('\'ENV\' environment variable not set!')
                 return 1
 
+            import botocore.session
             awsclient = AWSClient(botocore.session.get_session())
-            return lifecycle(awsclient, env, tool, command, arguments)
+            # create the clients while plugins, config and lookups are loaded
+            awsclient.prewarm(
+                PREWARM_CLIENTS +
+                DEFAULT_CONFIG.get(tool, {}).get('prewarm_clients', []))
+            try:
+                return lifecycle(awsclient, env, tool, command, arguments,
+                                 metrics_file=metrics_file, verbose=verbose)
+            finally:
+                awsclient.close()
     except GracefulExit as e:
         log.info('Received %s signal - exiting command \'%s %s\'',
                  str(e), tool, command)
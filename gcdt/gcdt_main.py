@@ -8,9 +8,6 @@ import sys
 from . import utils
 from . import gcdt_lifecycle
 from .gcdt_cmd_dispatcher import cmd
-from banana.router import Router
-#from banana.routes import run
-from whaaaaat import color_print as cp
 
 
 GCDT_GENERATOR_GROUP = 'gcdtgen10'
@@ -20,8 +17,13 @@ DOC = '''Usage:
         gcdt version
         gcdt list
         gcdt generate <generator>
+        gcdt cleanup-artifacts <bucket> [--keep=<keep>] [--workers=<workers>] [--dry-run] [-v]
 
--h --help           show this
+-h --help               show this
+-v --verbose            show debug messages
+--keep=<keep>           number of bundles to keep per lambda function / template (default: 10)
+--workers=<workers>     max. number of concurrent delete requests (default: 4)
+--dry-run               only show which artifacts would be deleted
 '''
 
 
@@ -32,6 +34,9 @@ def version_cmd():
 
 @cmd(spec=['generate', '<generator>'])
 def generate_cmd(generator):
+    from banana.router import Router
+    #from banana.routes import run
+    from whaaaaat import color_print as cp
     insight = None
     env = {}
     router = Router(env, insight, group=GCDT_GENERATOR_GROUP)
@@ -45,12 +50,33 @@ def generate_cmd(generator):
 
 @cmd(spec=['list'])
 def list_cmd():
+    from banana.router import Router
     router = Router(None, {}, group=GCDT_GENERATOR_GROUP)
     print('Installed gcdt generators:')
     for g in router.generators:
         print('  - %s' % g)
 
 
+@cmd(spec=['cleanup-artifacts', '<bucket>', '--keep', '--workers',
+           '--dry-run'])
+def cleanup_artifacts_cmd(bucket, keep, workers, dry_run, **tooldata):
+    from .s3 import cleanup_artifacts
+    context = tooldata.get('context')
+    awsclient = context['_awsclient']
+    keep = int(keep) if keep else 10
+    if keep < 1:
+        print('--keep must be at least 1')
+        return 1
+    deleted, errors = cleanup_artifacts(
+        awsclient, bucket, keep=keep, workers=int(workers or 4),
+        dry_run=dry_run)
+    if dry_run:
+        print('%d artifacts would be deleted' % deleted)
+    else:
+        print('deleted %d artifacts (%d errors)' % (deleted, errors))
+    return 1 if errors else 0
+
+
 def main():
     sys.exit(gcdt_lifecycle.main(DOC, 'gcdt',
                                  dispatch_only=['version', 'generate', 'list']))
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""Telemetry of the AWS API calls made by a gcdt command.
+
+ApiMetrics hooks into the events of the botocore session and records per
+service and operation the number of calls, errors, retries, throttling errors,
+latencies and bytes transferred. The report is printed at the end of the
+command, can be written to a JSON file (`--metrics-file`) and is provided to
+plugins as `context['api_metrics']`.
+"""
+from __future__ import unicode_literals, print_function
+import io
+import json
+import math
+import threading
+import time
+
+try:
+    from urllib.parse import urlencode
+except ImportError:
+    from urllib import urlencode
+
+from .gcdt_logging import getLogger
+
+log = getLogger(__name__)
+
+
+# error codes AWS services use for throttled requests
+THROTTLING_ERROR_CODES = [
+    'Throttling', 'ThrottlingException', 'ThrottledException',
+    'RequestThrottledException', 'TooManyRequestsException',
+    'ProvisionedThroughputExceededException', 'RequestLimitExceeded',
+    'BandwidthLimitExceeded', 'SlowDown', 'RequestThrottled'
+]
+
+PERCENTILES = [50, 90, 99]
+
+# key in the botocore request context
+_START_KEY = 'gcdt_metrics_start'
+
+
+def _percentile(sorted_values, percent):
+    """Nearest-rank percentile of sorted values."""
+    if not sorted_values:
+        return 0
+    rank = int(math.ceil(percent / 100.0 * len(sorted_values)))
+    return sorted_values[max(rank, 1) - 1]
+
+
+def _body_size(body):
+    """Size of a request body (bytes, text or file-like object)."""
+    if body is None:
+        return 0
+    if isinstance(body, bytes):
+        return len(body)
+    if isinstance(body, dict):
+        # query protocol: parameters are sent form encoded
+        return len(urlencode(body))
+    if hasattr(body, 'encode'):
+        return len(body.encode('utf-8'))
+    if hasattr(body, 'seek') and hasattr(body, 'tell'):
+        try:
+            position = body.tell()
+            body.seek(0, io.SEEK_END)
+            size = body.tell() - position
+            body.seek(position)
+            return size
+        except (IOError, OSError, ValueError):
+            return 0
+    return 0
+
+
+def _error_code(parsed):
+    if parsed and isinstance(parsed, dict):
+        return parsed.get('Error', {}).get('Code')
+
+
+class _OperationMetrics(object):
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.throttles = 0
+        self.durations = []
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+
+class ApiMetrics(object):
+    def __init__(self):
+        self._operations = {}  # (service, operation) -> _OperationMetrics
+        self._lock = threading.Lock()  # clients are used by worker threads
+
+    def register(self, session):
+        """Register the event handlers on a botocore session (before the
+        clients are created).
+
+        :param session: botocore session
+        """
+        session.register('before-call.*.*', self._before_call,
+                         'gcdt-metrics-before-call')
+        session.register('after-call.*.*', self._after_call,
+                         'gcdt-metrics-after-call')
+        session.register('needs-retry.*.*', self._needs_retry,
+                         'gcdt-metrics-needs-retry')
+
+    def _get(self, model):
+        # note: the caller holds the lock
+        key = (model.service_model.endpoint_prefix, model.name)
+        if key not in self._operations:
+            self._operations[key] = _OperationMetrics()
+        return self._operations[key]
+
+    def _before_call(self, model, params, context=None, **kwargs):
+        if context is not None:
+            context[_START_KEY] = time.time()
+        size = _body_size(params.get('body'))
+        with self._lock:
+            self._get(model).bytes_sent += size
+
+    def _after_call(self, model, http_response, parsed, context=None,
+                    **kwargs):
+        duration = None
+        if context is not None and _START_KEY in context:
+            duration = time.time() - context.pop(_START_KEY)
+        received = 0
+        headers = getattr(http_response, 'headers', None) or {}
+        if 'content-length' in headers:
+            received = int(headers['content-length'])
+        retries = 0
+        if isinstance(parsed, dict):
+            retries = parsed.get('ResponseMetadata', {}).get(
+                'RetryAttempts', 0)
+        with self._lock:
+            metrics = self._get(model)
+            metrics.calls += 1
+            metrics.retries += retries
+            metrics.bytes_received += received
+            if _error_code(parsed):
+                metrics.errors += 1
+            if duration is not None:
+                metrics.durations.append(duration)
+
+    def _needs_retry(self, operation, response=None, **kwargs):
+        # called for every attempt (botocore decides about retries later)
+        if response and _error_code(response[1]) in THROTTLING_ERROR_CODES:
+            with self._lock:
+                self._get(operation).throttles += 1
+
+    def report(self):
+        """Assemble the metrics report.
+
+        :return: {'operations': [...], 'total': {...}}, operations sorted by
+            total time
+        """
+        operations = []
+        with self._lock:
+            items = [(key, m, sorted(m.durations))
+                     for key, m in self._operations.items()]
+        for (service, operation), m, durations in items:
+            entry = {
+                'service': service,
+                'operation': operation,
+                'calls': m.calls,
+                'errors': m.errors,
+                'retries': m.retries,
+                'throttles': m.throttles,
+                'total_time': round(sum(durations), 3),
+                'bytes_sent': m.bytes_sent,
+                'bytes_received': m.bytes_received
+            }
+            for percent in PERCENTILES:
+                entry['p%d' % percent] = round(
+                    _percentile(durations, percent), 3)
+            operations.append(entry)
+        operations.sort(key=lambda e: (-e['total_time'], e['service'],
+                                       e['operation']))
+        total = {}
+        for key in ['calls', 'errors', 'retries', 'throttles', 'bytes_sent',
+                    'bytes_received']:
+            total[key] = sum([e[key] for e in operations])
+        total['total_time'] = round(
+            sum([e['total_time'] for e in operations]), 3)
+        return {'operations': operations, 'total': total}
+
+    def format_summary(self, report=None):
+        """Summary table of the AWS API calls.
+
+        :param report: report (defaults to the current report)
+        :return: table as text
+        """
+        from tabulate import tabulate
+        if report is None:
+            report = self.report()
+        table = [[e['service'], e['operation'], e['calls'], e['errors'],
+                  e['retries'], e['throttles'], '%.2fs' % e['total_time'],
+                  '%.3fs' % e['p50'], '%.3fs' % e['p90'], '%.3fs' % e['p99'],
+                  e['bytes_sent'], e['bytes_received']]
+                 for e in report['operations']]
+        total = report['total']
+        table.append(['total', '', total['calls'], total['errors'],
+                      total['retries'], total['throttles'],
+                      '%.2fs' % total['total_time'], '', '', '',
+                      total['bytes_sent'], total['bytes_received']])
+        return tabulate(table, headers=[
+            'Service', 'Operation', 'Calls', 'Errors', 'Retries',
+            'Throttles', 'Total', 'p50', 'p90', 'p99', 'Sent', 'Received'])
+
+
+def report_api_metrics(metrics, context, metrics_file=None):
+    """Provide the metrics report to plugins (context['api_metrics']), print
+    the summary and write the report to the metrics file.
+
+    :param metrics: ApiMetrics
+    :param context: gcdt context
+    :param metrics_file: path of the JSON report (optional)
+    """
+    report = metrics.report()
+    context['api_metrics'] = report
+    if report['total']['calls']:
+        print('AWS API calls:')
+        print(metrics.format_summary(report))
+    if metrics_file:
+        with open(metrics_file, 'w') as mfile:
+            json.dump(dict(report, tool=context.get('tool'),
+                           command=context.get('command')),
+                      mfile, indent=2, sort_keys=True)
+        log.info('API call metrics written to \'%s\'', metrics_file)
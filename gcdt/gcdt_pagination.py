@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""Lazy iteration over paginated AWS list / describe calls.
+
+The pages are requested while the items are consumed so a lookup which stops
+at the first match does not fetch the remaining pages. Server side filters
+(e.g. 'Prefix', 'NamePrefix', 'StackStatusFilter') are passed to the
+operation.
+"""
+from __future__ import unicode_literals, print_function
+
+
+# operations botocore has no paginator for
+# operation name -> (request token, response token)
+TOKENS = {
+    'list_rules': ('NextToken', 'NextToken'),
+    'list_targets_by_rule': ('NextToken', 'NextToken'),
+    'list_versions_by_function': ('Marker', 'NextMarker'),
+    'list_aliases': ('Marker', 'NextMarker')
+}
+
+
+def _iter_token_pages(client, operation_name, request_token, response_token,
+                      **kwargs):
+    request = dict(kwargs)
+    while True:
+        response = getattr(client, operation_name)(**request)
+        yield response
+        token = response.get(response_token)
+        if not token:
+            break
+        request[request_token] = token
+
+
+def iter_pages(client, operation_name, **kwargs):
+    """Lazily iterate the pages (responses) of a paginated operation.
+
+    :param client: botocore client
+    :param operation_name: e.g. 'list_functions'
+    :param kwargs: request parameters
+    :return: generator of responses
+    """
+    if client.can_paginate(operation_name):
+        for page in client.get_paginator(operation_name).paginate(**kwargs):
+            yield page
+    elif operation_name in TOKENS:
+        request_token, response_token = TOKENS[operation_name]
+        for page in _iter_token_pages(client, operation_name, request_token,
+                                      response_token, **kwargs):
+            yield page
+    else:
+        yield getattr(client, operation_name)(**kwargs)
+
+
+def iter_items(client, operation_name, result_key, **kwargs):
+    """Lazily iterate the items of a paginated operation.
+
+    :param client: botocore client
+    :param operation_name: e.g. 'list_functions'
+    :param result_key: key of the items in the response, e.g. 'Functions'
+    :param kwargs: request parameters
+    :return: generator of items
+    """
+    for page in iter_pages(client, operation_name, **kwargs):
+        for item in page.get(result_key, []):
+            yield item
+
+
+def find_item(client, operation_name, result_key, predicate, **kwargs):
+    """First item of a paginated operation matching the predicate (no more
+    pages are requested after the match).
+
+    :param client: botocore client
+    :param operation_name: e.g. 'get_rest_apis'
+    :param result_key: key of the items in the response, e.g. 'items'
+    :param predicate: function(item) -> bool
+    :param kwargs: request parameters
+    :return: item or None
+    """
+    for item in iter_items(client, operation_name, result_key, **kwargs):
+        if predicate(item):
+            return item
@@ -1,9 +1,13 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals, print_function
 
+import hashlib
+import importlib
+import json
 import logging
-
-import pkg_resources
+import os
+import sys
+from functools import reduce
 
 from gcdt.gcdt_signals import check_hook_mechanism_is_intact, \
     check_register_present
@@ -14,6 +18,90 @@ log = logging.getLogger(__name__)
 # TODO we have all plugins in one single repo so we need a mechanism to filter
 # the ones we want to use!
 
+# entry points of installed plugins are scanned once per process
+# group -> list of entry points
+_registry = {}
+
+# the entry points can be persisted so pkg_resources does not need to scan
+# the installed distributions on every gcdt invocation. The snapshot is only
+# used if GCDT_PLUGIN_SNAPSHOT is set.
+PLUGIN_SNAPSHOT_FILE = os.path.join(
+    os.path.expanduser('~'), '.gcdt', 'plugin_snapshot.json')
+
+
+class _Dist(object):
+    def __init__(self, project_name, version):
+        self.project_name = project_name
+        self.version = version
+
+
+class _SnapshotEntryPoint(object):
+    """Entry point restored from the plugin snapshot."""
+    def __init__(self, name, module_name, attrs, project_name, version):
+        self.name = name
+        self.module_name = module_name
+        self.attrs = attrs
+        self.dist = _Dist(project_name, version)
+
+    def load(self):
+        module = importlib.import_module(self.module_name)
+        return reduce(getattr, self.attrs, module)
+
+
+def _to_snapshot(entry_points):
+    return [{'name': ep.name, 'module_name': ep.module_name,
+             'attrs': list(ep.attrs), 'project_name': ep.dist.project_name,
+             'version': ep.dist.version} for ep in entry_points]
+
+
+def _get_fingerprint():
+    # installing or removing a distribution changes the mtime of its folder
+    # in sys.path (e.g. site-packages)
+    mtimes = [(p, os.path.getmtime(p)) for p in sys.path if os.path.isdir(p)]
+    return hashlib.sha1(json.dumps(
+        [sys.executable, mtimes]).encode('utf-8')).hexdigest()
+
+
+def _scan_entry_points(group):
+    import pkg_resources
+    return list(pkg_resources.iter_entry_points(group, name=None))
+
+
+def _get_entry_points_from_snapshot(group):
+    from .utils import read_json_cache, write_json_cache
+    snapshot = read_json_cache(PLUGIN_SNAPSHOT_FILE)
+    fingerprint = _get_fingerprint()
+    entry = snapshot.get(sys.executable, {})
+    if entry.get('fingerprint') != fingerprint:
+        entry = {'fingerprint': fingerprint, 'groups': {}}
+    if group in entry['groups']:
+        return [_SnapshotEntryPoint(**ep) for ep in entry['groups'][group]]
+    entry_points = _scan_entry_points(group)
+    entry['groups'][group] = _to_snapshot(entry_points)
+    snapshot[sys.executable] = entry
+    write_json_cache(PLUGIN_SNAPSHOT_FILE, snapshot)
+    return entry_points
+
+
+def get_entry_points(group='gcdt10'):
+    """Entry points of the installed plugins (scanned once per process).
+
+    :param group: entry point group
+    :return: list of entry points
+    """
+    if group not in _registry:
+        if os.getenv('GCDT_PLUGIN_SNAPSHOT'):
+            _registry[group] = _get_entry_points_from_snapshot(group)
+        else:
+            _registry[group] = _scan_entry_points(group)
+    return _registry[group]
+
+
+def reset_plugin_registry():
+    """Scan the entry points again on next use (e.g. after installing a
+    plugin)."""
+    _registry.clear()
+
 
 def load_plugins(group='gcdt10'):
     """Load and register installed gcdt plugins.
@@ -21,7 +109,7 @@ def load_plugins(group='gcdt10'):
     # on using entrypoints:
     # http://stackoverflow.com/questions/774824/explain-python-entry-points
     # TODO: make sure we do not have conflicting generators installed!
-    for ep in pkg_resources.iter_entry_points(group, name=None):
+    for ep in get_entry_points(group):
         plugin = ep.load()  # load the plugin
         if check_hook_mechanism_is_intact(plugin):
             if check_register_present(plugin):
@@ -34,7 +122,7 @@ def get_plugin_versions(group='gcdt10'):
     """Load and register installed gcdt plugins.
     """
     versions = {}
-    for ep in pkg_resources.iter_entry_points(group, name=None):
+    for ep in get_entry_points(group):
         versions[ep.dist.project_name] = ep.dist.version
 
     return versions
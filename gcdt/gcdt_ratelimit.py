@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+"""Adaptive rate limiting and retry budget for the AWS API calls.
+
+Many gcdt jobs running against one account are throttled at the same time.
+Instead of retrying in lockstep every client of an AWSClient gets:
+
+* a per-service RateLimiter (token bucket). It is unlimited until the service
+  throttles, then the rate is halved (multiplicative decrease) and slowly
+  increased again while requests succeed (additive increase).
+* retries with full jitter backoff (botocore still decides which errors are
+  retryable and the max. number of attempts).
+* a RetryBudget shared by all clients so a throttled account does not turn
+  into a retry storm (successful requests refill the budget).
+"""
+from __future__ import unicode_literals, print_function
+import random
+import threading
+import time
+from collections import deque
+
+from . import GcdtError
+from .gcdt_logging import getLogger
+from .gcdt_metrics import THROTTLING_ERROR_CODES
+
+log = getLogger(__name__)
+
+
+# rate limiter (requests per second)
+MIN_RATE = 0.5
+RATE_DECREASE = 0.5  # factor on throttling
+RATE_INCREASE = 0.5  # requests per second per second without throttling
+
+# retries
+BACKOFF_BASE = 0.5  # seconds
+BACKOFF_MAX = 20  # seconds
+
+# retry budget (shared by all clients)
+RETRY_BUDGET_CAPACITY = 500
+RETRY_COST = 5
+RETRY_REFUND = 1
+
+
+class RetryHandlerError(GcdtError):
+    fmt = 'Can not replace the botocore retry handler of {service}'
+
+
+def _error_code(response):
+    # response: (http_response, parsed) or None
+    if response is not None and isinstance(response[1], dict):
+        return response[1].get('Error', {}).get('Code')
+
+
+def _is_throttled(response):
+    return _error_code(response) in THROTTLING_ERROR_CODES
+
+
+def _get_service_event_name(service_model):
+    # botocore >= 1.8 names the events of a service by the service id
+    # (e.g. 'api-gateway'), older versions use the endpoint prefix
+    service_id = getattr(service_model, 'service_id', None)
+    if service_id is not None:
+        return service_id.hyphenize()
+    return service_model.endpoint_prefix
+
+
+def _noop(**kwargs):
+    pass
+
+
+def _is_registered(events, event_name, unique_id):
+    # botocore has no lookup by unique_id but it refuses to register a
+    # counted handler under a unique_id which is registered without counter
+    try:
+        events.register(event_name, _noop, unique_id=unique_id,
+                        unique_id_uses_count=True)
+    except ValueError:
+        return True
+    events.unregister(event_name, unique_id=unique_id,
+                      unique_id_uses_count=True)
+    return False
+
+
+def _unregister(events, event_name, unique_id):
+    """Unregister a handler by unique_id (botocore silently ignores an
+    unknown unique_id).
+
+    :return: True if a handler was removed
+    """
+    registered = _is_registered(events, event_name, unique_id)
+    events.unregister(event_name, unique_id=unique_id)
+    return registered and not _is_registered(events, event_name, unique_id)
+
+
+def backoff_delay(attempts, base=BACKOFF_BASE, max_delay=BACKOFF_MAX):
+    """Exponential backoff with full jitter.
+
+    :param attempts: number of attempts so far (1 after the first request)
+    :return: delay in seconds
+    """
+    return random.uniform(0, min(max_delay, base * 2 ** attempts))
+
+
+class RateLimiter(object):
+    def __init__(self, min_rate=MIN_RATE, decrease=RATE_DECREASE,
+                 increase=RATE_INCREASE):
+        """Adaptive token bucket for the requests to one service.
+
+        :param min_rate: the rate never drops below (requests per second)
+        :param decrease: rate factor on throttling
+        :param increase: rate increase per second without throttling
+        """
+        self._min_rate = min_rate
+        self._decrease = decrease
+        self._increase = increase
+        self._lock = threading.Lock()
+        self.rate = None  # unlimited until the service throttles
+        self._max_rate = None  # rate (measured) when throttled
+        self._tokens = 0.0
+        self._last_refill = None
+        self._last_update = None
+        self._sent = deque()  # timestamps of the requests of the last second
+
+    def _measured_rate(self, now):
+        while self._sent and self._sent[0] < now - 1.0:
+            self._sent.popleft()
+        return float(len(self._sent))
+
+    def _refill(self, now):
+        if self._last_refill is not None:
+            self._tokens = min(max(self.rate, 1.0), self._tokens +
+                               (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def acquire(self):
+        """Wait until the request can be sent."""
+        while True:
+            with self._lock:
+                now = time.time()
+                if self.rate is None:
+                    self._sent.append(now)
+                    return
+                self._refill(now)
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    self._sent.append(now)
+                    return
+                wait = (1.0 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def on_throttle(self):
+        """The service throttled a request: decrease the rate."""
+        with self._lock:
+            now = time.time()
+            measured = self._measured_rate(now)
+            current = self.rate if self.rate is not None else measured
+            self._max_rate = max(measured, current, self._min_rate)
+            self.rate = max(self._min_rate, current * self._decrease)
+            self._tokens = min(self._tokens, 1.0)
+            self._last_refill = now
+            self._last_update = now
+            log.debug('throttled, rate limited to %.2f requests/s', self.rate)
+
+    def on_success(self):
+        """A request succeeded: increase the rate."""
+        with self._lock:
+            if self.rate is None:
+                return
+            now = time.time()
+            self._refill(now)
+            self.rate += (now - self._last_update) * self._increase
+            self._last_update = now
+            if self.rate > 2 * self._max_rate:
+                # well beyond the rate we have been throttled at
+                self.rate = None
+                log.debug('rate limit lifted')
+
+
+class RetryBudget(object):
+    def __init__(self, capacity=RETRY_BUDGET_CAPACITY, cost=RETRY_COST,
+                 refund=RETRY_REFUND):
+        """Retries are only allowed while the budget lasts.
+
+        :param capacity: initial (and max.) budget
+        :param cost: a retry costs this much
+        :param refund: a successful request refills this much
+        """
+        self._capacity = capacity
+        self._cost = cost
+        self._refund = refund
+        self._lock = threading.Lock()
+        self.available = capacity
+
+    def withdraw(self):
+        """Take the cost of a retry from the budget.
+
+        :return: True if the retry is allowed
+        """
+        with self._lock:
+            if self.available < self._cost:
+                return False
+            self.available -= self._cost
+            return True
+
+    def refund(self):
+        with self._lock:
+            self.available = min(self._capacity,
+                                 self.available + self._refund)
+
+
+class RetryPolicy(object):
+    def __init__(self, budget=None):
+        """Rate limiters, retry budget and backoff for the clients of an
+        AWSClient.
+
+        :param budget: RetryBudget (shared by all clients)
+        """
+        self.budget = budget or RetryBudget()
+        self._limiters = {}  # endpoint prefix -> RateLimiter
+        self._default_handlers = {}  # endpoint prefix -> botocore handler
+        self._lock = threading.Lock()
+
+    def get_limiter(self, endpoint_prefix):
+        with self._lock:
+            if endpoint_prefix not in self._limiters:
+                self._limiters[endpoint_prefix] = RateLimiter()
+            return self._limiters[endpoint_prefix]
+
+    def _get_default_handler(self, session, endpoint_prefix):
+        # the retry handler botocore registers for the service
+        with self._lock:
+            if endpoint_prefix not in self._default_handlers:
+                from botocore import retryhandler, translate
+                config = session.get_component('data_loader').load_data(
+                    '_retry')
+                retry_config = translate.build_retry_config(
+                    endpoint_prefix, config.get('retry', {}),
+                    config.get('definitions', {}))
+                self._default_handlers[endpoint_prefix] = \
+                    retryhandler.create_retry_handler(retry_config,
+                                                      endpoint_prefix)
+            return self._default_handlers[endpoint_prefix]
+
+    def install(self, session, client):
+        """Replace the retry handling of a botocore client.
+
+        :param session: botocore session the client was created from
+        :param client: botocore client
+        """
+        endpoint_prefix = client.meta.service_model.endpoint_prefix
+        event_name = _get_service_event_name(client.meta.service_model)
+        limiter = self.get_limiter(endpoint_prefix)
+
+        def _before_request(**kwargs):
+            # request-created is emitted for every attempt
+            limiter.acquire()
+
+        def _needs_retry(attempts, response=None, caught_exception=None,
+                         **kwargs):
+            if _is_throttled(response):
+                limiter.on_throttle()
+            elif response is not None and not _error_code(response):
+                limiter.on_success()
+                self.budget.refund()
+            default_handler = self._get_default_handler(
+                session, endpoint_prefix)
+            if default_handler(attempts=attempts, response=response,
+                               caught_exception=caught_exception,
+                               **kwargs) is None:
+                return None  # not retryable or out of attempts
+            if not self.budget.withdraw():
+                log.debug('retry budget exhausted, no retry for %s',
+                          endpoint_prefix)
+                return None
+            return backoff_delay(attempts)
+
+        # the botocore retry handler would retry beyond the budget
+        retry_event = 'needs-retry.%s' % event_name
+        if not _unregister(client.meta.events, retry_event,
+                           'retry-config-%s' % event_name):
+            raise RetryHandlerError(service=event_name)
+        client.meta.events.register(
+            retry_event, _needs_retry,
+            unique_id='gcdt-retry-%s' % event_name)
+        client.meta.events.register_first(
+            'request-created.%s' % event_name, _before_request,
+            unique_id='gcdt-ratelimit-%s' % event_name)
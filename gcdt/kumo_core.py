@@ -14,8 +14,11 @@ import six
 from clint.textui import colored
 from tabulate import tabulate
 
+from .gcdt_inventory import list_resources, find_resources, put_resource, \
+    remove_resource
 from .utils import get_env
 from .s3 import upload_file_to_s3
+from .servicediscovery import invalidate_outputs_for_stack
 from .gcdt_signals import check_hook_mechanism_is_intact, \
     check_register_present
 from gcdt.utils import GracefulExit, json2table, dict_merge, dict_selective_merge
@@ -197,10 +200,49 @@ def _get_stack_id(awsclient, stackname):
 
 def _get_stack_events_last_timestamp(awsclient, stackname):
     # we need to get the last event since updatedTime is when the update stated
+    # note: describe_stack_events returns the most recent event first
     client = awsclient.get_client('cloudformation')
     stack_id = _get_stack_id(awsclient, stackname)
     response = client.describe_stack_events(StackName=stack_id)
-    return response['StackEvents'][-1]['Timestamp']
+    return response['StackEvents'][0]['Timestamp']
+
+
+# adaptive polling for stack events (seconds)
+POLL_INTERVAL_MIN = 2
+POLL_INTERVAL_MAX = 20
+POLL_INTERVAL_BACKOFF = 1.5
+
+
+def _get_new_stack_events(client, stack_id, seen_events, last_event=None):
+    """Retrieve the stack events we have not seen so far.
+
+    describe_stack_events returns the events in reverse chronological order
+    so we only page (NextToken) until we hit an event we have already seen
+    (or an event which is older than last_event).
+
+    :param client: cloudformation client
+    :param stack_id:
+    :param seen_events: set of EventIds we already processed (updated in place)
+    :param last_event: timestamp of the last event before the operation
+    :return: list of new events in chronological order
+    """
+    new_events = []
+    request = {'StackName': stack_id}
+    done = False
+    while not done:
+        response = client.describe_stack_events(**request)
+        for event in response['StackEvents']:
+            if event['EventId'] in seen_events or \
+                    (last_event and event['Timestamp'] <= last_event):
+                done = True
+                break
+            new_events.append(event)
+        if 'NextToken' in response and response['NextToken']:
+            request['NextToken'] = response['NextToken']
+        else:
+            done = True
+    seen_events.update([e['EventId'] for e in new_events])
+    return new_events[::-1]
 
 
 def _poll_stack_events(awsclient, stackname, last_event=None):
@@ -230,42 +272,48 @@ def _poll_stack_events(awsclient, stackname, last_event=None):
                         'DELETE_COMPLETE',
                         'UPDATE_COMPLETE']
 
-    seen_events = []
-    # print len(seen_events)
+    seen_events = set()
     client = awsclient.get_client('cloudformation')
     status = ''
+    interval = POLL_INTERVAL_MIN
     # for the delete command we need the stack_id
     stack_id = _get_stack_id(awsclient, stackname)
     print('%-50s %-25s %-50s %-25s\n' % ('Resource Status', 'Resource ID',
                                          'Reason', 'Timestamp'))
     while status not in finished_statuses:
-        response = client.describe_stack_events(StackName=stack_id)
-        for event in response['StackEvents'][::-1]:
-            if event['EventId'] not in seen_events and \
-                    (not last_event or event['Timestamp'] > last_event):
-                seen_events.append(event['EventId'])
-                resource_status = event['ResourceStatus']
-                resource_id = event['LogicalResourceId']
-                # this is not always present
-                try:
-                    reason = event['ResourceStatusReason']
-                except KeyError:
-                    reason = ''
-                timestamp = str(event['Timestamp'])
-                message = '%-50s %-25s %-50s %-25s\n' % (
-                    resource_status, resource_id,
-                    reason, timestamp)
-                if resource_status in failed_statuses:
-                    print(colored.red(message))
-                elif resource_status in warning_statuses:
-                    print(colored.yellow(message))
-                elif resource_status in success_statuses:
-                    print(colored.green(message))
-                else:
-                    print(message)
-                if event['LogicalResourceId'] == stackname:
-                    status = event['ResourceStatus']
-        time.sleep(5)
+        events = _get_new_stack_events(client, stack_id, seen_events,
+                                       last_event)
+        for event in events:
+            resource_status = event['ResourceStatus']
+            resource_id = event['LogicalResourceId']
+            # this is not always present
+            try:
+                reason = event['ResourceStatusReason']
+            except KeyError:
+                reason = ''
+            timestamp = str(event['Timestamp'])
+            message = '%-50s %-25s %-50s %-25s\n' % (
+                resource_status, resource_id,
+                reason, timestamp)
+            if resource_status in failed_statuses:
+                print(colored.red(message))
+            elif resource_status in warning_statuses:
+                print(colored.yellow(message))
+            elif resource_status in success_statuses:
+                print(colored.green(message))
+            else:
+                print(message)
+            if event['LogicalResourceId'] == stackname:
+                status = event['ResourceStatus']
+        if status in finished_statuses:
+            break
+        # poll fast while things happen, back off during long running
+        # resource operations
+        if events:
+            interval = POLL_INTERVAL_MIN
+        else:
+            interval = min(interval * POLL_INTERVAL_BACKOFF, POLL_INTERVAL_MAX)
+        time.sleep(interval)
     exit_code = 0
     if status not in success_statuses:
         exit_code = 1
@@ -304,6 +352,8 @@ def _generate_parameters(conf):
 
 def stack_exists(awsclient, stackName):
     # TODO handle failure based on API call limit
+    if find_resources(awsclient, 'stack', stackName):
+        return True
     client = awsclient.get_client('cloudformation')
     try:
         response = client.describe_stacks(
@@ -312,8 +362,11 @@ def stack_exists(awsclient, stackName):
     except GracefulExit:
         raise
     except Exception:
+        remove_resource(awsclient, 'stack', stackName)
         return False
     else:
+        if response.get('Stacks'):
+            put_resource(awsclient, 'stack', response['Stacks'][0])
         return True
 
 
@@ -433,6 +486,7 @@ def _create_stack(awsclient, conf, cloudformation, parameters):
     response = client_cf.create_stack(**request)
 
     exit_code = _poll_stack_events(awsclient, stackname)
+    invalidate_outputs_for_stack(awsclient, stackname)
     _call_hook(awsclient, conf, stackname, parameters, cloudformation,
                hook='post_create_hook',
                message='CloudFormation is done, now executing post create hook...')
@@ -482,6 +536,7 @@ def _update_stack(awsclient, conf, cloudformation, parameters,
         response = client_cf.update_stack(**request)
 
         exit_code = _poll_stack_events(awsclient, stackname, last_event)
+        invalidate_outputs_for_stack(awsclient, stackname)
         _call_hook(awsclient, conf, stackname, parameters, cloudformation,
                    hook='post_update_hook',
                    message='CloudFormation is done, now executing post update hook...')
@@ -515,6 +570,8 @@ def delete_stack(awsclient, conf, feedback=True):
     dict_selective_merge(request, conf['stack'], ['StackName', 'RoleARN'])
 
     response = client_cf.delete_stack(**request)
+    invalidate_outputs_for_stack(awsclient, stackname)
+    remove_resource(awsclient, 'stack', stackname)
 
     if feedback:
         return _poll_stack_events(awsclient, stackname, last_event)
@@ -526,21 +583,9 @@ def list_stacks(awsclient):
     :param awsclient:
     :return:
     """
-    client_cf = awsclient.get_client('cloudformation')
-    response = client_cf.list_stacks(
-        StackStatusFilter=[
-            'CREATE_IN_PROGRESS', 'CREATE_COMPLETE', 'ROLLBACK_IN_PROGRESS',
-            'ROLLBACK_COMPLETE', 'DELETE_IN_PROGRESS', 'DELETE_FAILED',
-            'UPDATE_IN_PROGRESS', 'UPDATE_COMPLETE_CLEANUP_IN_PROGRESS',
-            'UPDATE_COMPLETE', 'UPDATE_ROLLBACK_IN_PROGRESS',
-            'UPDATE_ROLLBACK_FAILED',
-            'UPDATE_ROLLBACK_COMPLETE_CLEANUP_IN_PROGRESS',
-            'UPDATE_ROLLBACK_COMPLETE',
-        ]
-    )
     result = {}
     stack_sum = 0
-    for summary in response['StackSummaries']:
+    for summary in list_resources(awsclient, 'stack'):
         result['StackName'] = summary["StackName"]
         result['CreationTime'] = summary['CreationTime']
         result['StackStatus'] = summary['StackStatus']
@@ -14,36 +14,34 @@ import time
 from tempfile import NamedTemporaryFile
 
 from clint.textui import colored
-from pyspin.spin import Default, Spinner
-from tabulate import tabulate
 
 from . import utils
-from .kumo_core import get_parameter_diff, delete_stack, \
-    deploy_stack, generate_template_file, list_stacks, create_change_set, \
-    describe_change_set, load_cloudformation_template, call_pre_hook
-from .kumo_viz import cfn_viz, svg_output
 from .gcdt_cmd_dispatcher import cmd
 from . import gcdt_lifecycle
 
 
 # creating docopt parameters and usage help
 DOC = '''Usage:
-        kumo deploy [--override-stack-policy] [-v]
+        kumo deploy [--override-stack-policy] [-v] [--metrics-file=<file>]
+        kumo deploy-all <folder>... [--workers=<workers>] [--override-stack-policy] [-v] [--metrics-file=<file>]
         kumo list [-v]
-        kumo delete -f [-v]
+        kumo delete -f [-v] [--metrics-file=<file>]
         kumo generate [-v]
         kumo preview [-v]
         kumo version
         kumo dot [-v]
 
--h --help           show this
--v --verbose        show debug messages
+-h --help               show this
+-v --verbose            show debug messages
+--workers=<workers>     max. number of concurrent stack deployments (default: 4)
+--metrics-file=<file>   write the AWS API call metrics to a JSON file
 '''
 
 
 def load_template():
     """Bail out if template is not found.
     """
+    from .kumo_core import load_cloudformation_template
     cloudformation, found = load_cloudformation_template()
     if not found:
         print(colored.red('could not load cloudformation.py, bailing out...'))
@@ -58,6 +56,7 @@ def version_cmd():
 
 @cmd(spec=['dot'])
 def dot_cmd(**tooldata):
+    from .kumo_viz import cfn_viz, svg_output
     conf = tooldata.get('config')
     cloudformation = load_template()
     with NamedTemporaryFile(delete=False, mode='w') as temp_dot:
@@ -72,6 +71,8 @@ def dot_cmd(**tooldata):
 
 @cmd(spec=['deploy', '--override-stack-policy'])
 def deploy_cmd(override, **tooldata):
+    from pyspin.spin import Default, Spinner
+    from .kumo_core import call_pre_hook, deploy_stack, get_parameter_diff
     context = tooldata.get('context')
     conf = tooldata.get('config')
     awsclient = context.get('_awsclient')
@@ -96,8 +97,20 @@ def deploy_cmd(override, **tooldata):
     return exit_code
 
 
+@cmd(spec=['deploy-all', '<folder>', '--workers', '--override-stack-policy'])
+def deploy_all_cmd(folders, workers, override, **tooldata):
+    from .kumo_orchestrator import read_stack_configs, deploy_all
+    context = tooldata.get('context')
+    stacks = read_stack_configs(folders, context['env'])
+    return deploy_all(stacks, workers=int(workers or 4),
+                      override_stack_policy=override,
+                      verbose=context.get('_verbose', False),
+                      metrics_file=context.get('_metrics_file'))
+
+
 @cmd(spec=['delete', '-f'])
 def delete_cmd(force, **tooldata):
+    from .kumo_core import delete_stack
     context = tooldata.get('context')
     conf = tooldata.get('config')
     awsclient = context.get('_awsclient')
@@ -106,6 +119,7 @@ def delete_cmd(force, **tooldata):
 
 @cmd(spec=['generate'])
 def generate_cmd(**tooldata):
+    from .kumo_core import generate_template_file
     conf = tooldata.get('config')
     cloudformation = load_template()
     generate_template_file(conf, cloudformation)
@@ -114,6 +128,7 @@ def generate_cmd(**tooldata):
 
 @cmd(spec=['list'])
 def list_cmd(**tooldata):
+    from .kumo_core import list_stacks
     context = tooldata.get('context')
     awsclient = context.get('_awsclient')
     list_stacks(awsclient)
@@ -121,6 +136,8 @@ def list_cmd(**tooldata):
 
 @cmd(spec=['preview'])
 def preview_cmd(**tooldata):
+    from .kumo_core import create_change_set, delete_stack, \
+        describe_change_set, get_parameter_diff
     context = tooldata.get('context')
     conf = tooldata.get('config')
     awsclient = context.get('_awsclient')
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""Deploy multiple kumo stacks concurrently.
+
+The stacks are deployed in the order of their dependencies. Independent stacks
+are deployed in parallel (bounded by the number of workers). Every stack
+deployment runs as a separate `kumo deploy` process in the stack folder so
+hooks, lookups and plugins work exactly as for a single stack deployment.
+"""
+from __future__ import unicode_literals, print_function
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from tabulate import tabulate
+
+from .gcdt_config_reader import read_json_config
+from .gcdt_logging import getLogger
+from .utils import GracefulExit, fix_old_kumo_config
+
+log = getLogger(__name__)
+
+
+PY3 = sys.version_info[0] >= 3
+
+if PY3:
+    basestring = str
+
+
+# stacks referenced via `lookup:stack:<stack_name>:<output>` in config
+LOOKUP_STACK_RE = re.compile(r'lookup:stack:([^:]+)')
+# stacks referenced via `get_outputs_for_stack(awsclient, '<stack_name>')`
+# in cloudformation.py templates
+OUTPUTS_FOR_STACK_RE = re.compile(
+    r'get_outputs_for_stack\s*\([^,]+,\s*[\'"]([^\'"]+)[\'"]')
+
+_print_lock = threading.Lock()
+
+
+def read_stack_configs(folders, env):
+    """Read the kumo config for the stacks in the given folders.
+
+    :param folders: list of stack folders
+    :param env: environment (selects 'gcdt_<env>.json')
+    :return: list of stacks (dict with 'folder', 'stack_name', 'config' and
+        'template' (text of cloudformation.py))
+    """
+    stacks = []
+    for folder in folders:
+        config_file = os.path.join(folder, 'gcdt_%s.json' % env)
+        config = fix_old_kumo_config(read_json_config(config_file),
+                                     silent=True)
+        if 'kumo' not in config:
+            raise Exception('Configuration missing for \'kumo\' in %s' %
+                            config_file)
+        template = ''
+        template_file = os.path.join(folder, 'cloudformation.py')
+        if os.path.isfile(template_file):
+            with open(template_file) as tfile:
+                template = tfile.read()
+        stacks.append({
+            'folder': folder,
+            'stack_name': config['kumo']['stack']['StackName'],
+            'config': config['kumo'],
+            'template': template
+        })
+    return stacks
+
+
+def _iter_strings(data):
+    # all string values contained in a (nested) config
+    if isinstance(data, basestring):
+        yield data
+    elif isinstance(data, dict):
+        for value in data.values():
+            for s in _iter_strings(value):
+                yield s
+    elif isinstance(data, list):
+        for value in data:
+            for s in _iter_strings(value):
+                yield s
+
+
+def get_stack_dependencies(stacks):
+    """Derive the dependencies between the given stacks.
+
+    A stack depends on another stack if:
+    * the other stack is listed in 'dependsOn' of the kumo config
+    * the config contains a 'lookup:stack:<stack_name>' lookup
+    * a config value equals the stack name (e.g. parameter used in StackLookup)
+    * cloudformation.py uses get_outputs_for_stack(awsclient, '<stack_name>')
+
+    Dependencies on stacks which are not part of the deployment are ignored.
+
+    :param stacks: list of stacks (see read_stack_configs)
+    :return: dictionary stack_name -> set of stack_names
+    """
+    names = set([s['stack_name'] for s in stacks])
+    dependencies = {}
+    for stack in stacks:
+        name = stack['stack_name']
+        referenced = set(stack['config'].get('dependsOn', []))
+        for value in _iter_strings(stack['config']):
+            referenced.update(LOOKUP_STACK_RE.findall(value))
+            if value in names:
+                referenced.add(value)
+        referenced.update(OUTPUTS_FOR_STACK_RE.findall(stack['template']))
+        referenced.discard(name)
+        dependencies[name] = referenced & names
+    return dependencies
+
+
+def _find_cycle(dependencies):
+    """Return a list of stack names which form a cycle (or None)."""
+    visited = set()
+
+    def _visit(name, path):
+        if name in path:
+            return path[path.index(name):] + [name]
+        if name in visited:
+            return None
+        visited.add(name)
+        for dep in sorted(dependencies[name]):
+            cycle = _visit(dep, path + [name])
+            if cycle:
+                return cycle
+        return None
+
+    for name in sorted(dependencies):
+        cycle = _visit(name, [])
+        if cycle:
+            return cycle
+    return None
+
+
+def _print_prefixed(stack_name, line):
+    with _print_lock:
+        print('[%s] %s' % (stack_name, line))
+        sys.stdout.flush()
+
+
+def get_stack_metrics_file(metrics_file, stack_name):
+    """Metrics file of a stack deployment: 'metrics.json' ->
+    '/abs/path/metrics.<stack_name>.json' (the kumo processes run in the
+    stack folders and must not overwrite each others metrics).
+
+    :param metrics_file:
+    :param stack_name:
+    :return: absolute filename
+    """
+    base, ext = os.path.splitext(os.path.abspath(metrics_file))
+    return '%s.%s%s' % (base, stack_name, ext)
+
+
+def deploy_stack_process(stack, override_stack_policy=False, verbose=False,
+                         metrics_file=None):
+    """Deploy a stack by running `kumo deploy` in the stack folder.
+
+    The output of the process is streamed prefixed with the stack name.
+
+    :param stack: stack (see read_stack_configs)
+    :param override_stack_policy:
+    :param verbose: pass '-v' to kumo deploy
+    :param metrics_file: the metrics of the stack deployment are written to
+        a file per stack (see get_stack_metrics_file)
+    :return: exit_code
+    """
+    command = [sys.executable, '-m', 'gcdt.kumo_main', 'deploy']
+    if override_stack_policy:
+        command.append('--override-stack-policy')
+    if verbose:
+        command.append('-v')
+    if metrics_file:
+        command.append('--metrics-file=%s' % get_stack_metrics_file(
+            metrics_file, stack['stack_name']))
+    process = subprocess.Popen(command, cwd=stack['folder'],
+                               stdout=subprocess.PIPE,
+                               stderr=subprocess.STDOUT)
+    for line in iter(process.stdout.readline, b''):
+        _print_prefixed(stack['stack_name'],
+                        line.decode('utf-8', 'replace').rstrip())
+    process.stdout.close()
+    return process.wait()
+
+
+def deploy_all(stacks, workers=4, override_stack_policy=False,
+               verbose=False, metrics_file=None,
+               deploy_func=deploy_stack_process):
+    """Deploy the stacks concurrently in the order of their dependencies.
+
+    Stacks which depend on a failed stack are skipped.
+
+    :param stacks: list of stacks (see read_stack_configs)
+    :param workers: max. number of concurrent stack deployments
+    :param override_stack_policy:
+    :param verbose: debug messages of the stack deployments
+    :param metrics_file: write the API call metrics of the stack
+        deployments to files next to this one (see get_stack_metrics_file)
+    :param deploy_func: function(stack, override_stack_policy, verbose,
+        metrics_file) -> exit_code
+    :return: exit_code
+    """
+    dependencies = get_stack_dependencies(stacks)
+    cycle = _find_cycle(dependencies)
+    if cycle:
+        log.error('Stack dependencies contain a cycle: %s',
+                  ' -> '.join(cycle))
+        return 1
+
+    by_name = dict([(s['stack_name'], s) for s in stacks])
+    pending = set(by_name.keys())
+    results = {}  # stack_name -> (status, duration)
+    running = {}  # future -> (stack_name, start time)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        try:
+            while pending or running:
+                for name in sorted(pending):
+                    deps = dependencies[name]
+                    if any([results.get(d, ('',))[0] in ['failed', 'skipped']
+                            for d in deps]):
+                        pending.discard(name)
+                        results[name] = ('skipped', 0)
+                        _print_prefixed(name, 'skipped (dependency failed)')
+                    elif all([results.get(d, ('',))[0] == 'succeeded'
+                              for d in deps]):
+                        pending.discard(name)
+                        future = executor.submit(
+                            deploy_func, by_name[name], override_stack_policy,
+                            verbose, metrics_file)
+                        running[future] = (name, time.time())
+                if not running:
+                    continue
+                done, _ = wait(list(running.keys()),
+                               return_when=FIRST_COMPLETED)
+                for future in done:
+                    name, start = running.pop(future)
+                    try:
+                        exit_code = future.result()
+                    except GracefulExit:
+                        raise
+                    except Exception as e:
+                        log.error('Deployment of stack \'%s\' failed: %s',
+                                  name, str(e))
+                        exit_code = 1
+                    status = 'failed' if exit_code else 'succeeded'
+                    results[name] = (status, time.time() - start)
+        except GracefulExit:
+            # the kumo processes receive the signal, too
+            for future in running:
+                future.cancel()
+            raise
+
+    table = [[name, results[name][0], '%.0fs' % results[name][1]]
+             for name in sorted(results)]
+    print(tabulate(table, headers=['Stack', 'Status', 'Duration']))
+    if any([status != 'succeeded' for status, _ in results.values()]):
+        return 1
+    return 0
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""Incremental and deterministic zip bundles for AWS Lambda functions.
+
+The bundle builder records size, mtime and content hash of every file that
+goes into the bundle. On subsequent runs only files with a changed size or
+mtime are hashed again and the bundle is only rebuilt if the content of the
+files changed. Entries are sorted and have fixed timestamps so the same
+content always results in the same bundle (and the same hash).
+"""
+from __future__ import unicode_literals, print_function
+import base64
+import glob
+import hashlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import zipfile
+
+from .gcdt_logging import getLogger
+from .utils import read_json_cache, write_json_cache
+
+log = getLogger(__name__)
+
+
+BUNDLE_MANIFEST_FILE = os.path.join('.gcdt', 'bundle_manifest.json')
+# zip format does not support timestamps before 1980
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+# compiled python files contain timestamps
+IGNORED_EXTENSIONS = ['.pyc', '.pyo']
+CHUNK_SIZE = 1024 * 1024
+
+
+class BundleArtifact(object):
+    """Lambda code bundle backed by a file (or by bytes for compatibility).
+
+    The bundle content is streamed in chunks for hashing, uploading and
+    copying so the bundle is never held in memory as a whole.
+    """
+
+    def __init__(self, filename=None, data=None):
+        """
+        :param filename: zip bundle file
+        :param data: zip bundle content as bytes
+        """
+        assert filename or data is not None
+        self.filename = filename
+        self._data = data
+        self._digest = None
+
+    @property
+    def size(self):
+        if self.filename:
+            return os.path.getsize(self.filename)
+        return len(self._data)
+
+    def open(self):
+        """Open the bundle for reading (binary file object)."""
+        if self.filename:
+            return open(self.filename, 'rb')
+        return io.BytesIO(self._data)
+
+    def read(self):
+        """Bundle content as bytes (only for small bundles!)."""
+        if self._data is not None:
+            return self._data
+        with self.open() as f:
+            return f.read()
+
+    def save(self, filename):
+        """Copy the bundle to filename."""
+        if self.filename and \
+                os.path.abspath(self.filename) == os.path.abspath(filename):
+            return
+        with self.open() as src, open(filename, 'wb') as dest:
+            shutil.copyfileobj(src, dest, CHUNK_SIZE)
+
+    def _sha256_digest(self):
+        if self._digest is None:
+            sha256 = hashlib.sha256()
+            with self.open() as f:
+                for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                    sha256.update(chunk)
+            self._digest = sha256.digest()
+        return self._digest
+
+    def sha256(self):
+        """base64 encoded sha256 (same format as AWS Lambda CodeSha256)."""
+        return base64.b64encode(self._sha256_digest()).decode('ascii')
+
+    def sha256_urlsafe(self):
+        return base64.urlsafe_b64encode(self._sha256_digest()).decode('ascii')
+
+
+def to_artifact(zipfile):
+    """Wrap the zip bundle into a BundleArtifact.
+
+    :param zipfile: BundleArtifact or bytes
+    :return: BundleArtifact (None if zipfile is empty)
+    """
+    if isinstance(zipfile, BundleArtifact) or not zipfile:
+        return zipfile or None
+    return BundleArtifact(data=zipfile)
+
+
+def get_bundle(context):
+    """The bundle provided by the bundler plugin.
+
+    Bundlers should provide the bundle file (context['_bundle_file']) so the
+    bundle is streamed from disk. A bundle provided as bytes
+    (context['_zipfile']) is held in memory by the bundler.
+
+    :param context: gcdt context
+    :return: BundleArtifact (None if the bundle is empty)
+    """
+    if context.get('_bundle_file'):
+        return BundleArtifact(filename=context['_bundle_file'])
+    return to_artifact(context['_zipfile'])
+
+
+def _file_sha256(filename):
+    sha256 = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def _arcname(target, path):
+    arcname = os.path.normpath(os.path.join(target, path))
+    return arcname.replace(os.sep, '/').lstrip('/')
+
+
+def collect_files(folders):
+    """Collect the files for the bundle.
+
+    :param folders: list of {'source': <path or glob>, 'target': <path>}
+    :return: sorted list of (arcname, filename)
+    """
+    files = {}
+    for folder in folders:
+        target = folder.get('target', '')
+        for source in sorted(glob.glob(folder['source'])):
+            if os.path.isdir(source):
+                for root, dirs, filenames in os.walk(source):
+                    dirs[:] = [d for d in dirs if d != '__pycache__']
+                    for filename in filenames:
+                        if os.path.splitext(filename)[1] in \
+                                IGNORED_EXTENSIONS:
+                            continue
+                        path = os.path.join(root, filename)
+                        files[_arcname(target,
+                                       os.path.relpath(path, source))] = path
+            elif os.path.isfile(source):
+                files[_arcname(target, os.path.basename(source))] = source
+    return sorted(files.items())
+
+
+def _zipinfo(arcname, mode):
+    zinfo = zipfile.ZipInfo(arcname, date_time=ZIP_DATE_TIME)
+    zinfo.compress_type = zipfile.ZIP_DEFLATED
+    # keep the executable flag but nothing else
+    zinfo.external_attr = ((0o755 if mode & 0o111 else 0o644) | 0o100000) << 16
+    return zinfo
+
+
+def _write_entry(zip_file, zinfo, filename):
+    with open(filename, 'rb') as f:
+        if sys.version_info < (3, 6):
+            # ZipFile.open supports mode 'w' since python 3.6
+            zip_file.writestr(zinfo, f.read())
+        else:
+            with zip_file.open(zinfo, 'w') as dest:
+                shutil.copyfileobj(f, dest, CHUNK_SIZE)
+
+
+def build_bundle(folders, bundle_file='bundle.zip',
+                 manifest_file=BUNDLE_MANIFEST_FILE):
+    """Build the zip bundle incrementally.
+
+    :param folders: list of {'source': <path or glob>, 'target': <path>}
+    :param bundle_file: filename of the zip bundle
+    :param manifest_file: records the files of the previous bundle
+    :return: tuple (bundle_file, changed)
+    """
+    files = collect_files(folders)
+    manifest = read_json_cache(manifest_file)
+    old_entries = manifest.get('files', {})
+    bundle_stat = manifest.get('bundle', {})
+    # the previous bundle can only be reused if it was not modified
+    previous_bundle = os.path.isfile(bundle_file) and \
+        bundle_stat.get('name') == bundle_file and \
+        bundle_stat.get('size') == os.path.getsize(bundle_file) and \
+        bundle_stat.get('mtime') == os.path.getmtime(bundle_file)
+
+    entries = {}
+    unchanged = previous_bundle and len(files) == len(old_entries)
+    for arcname, filename in files:
+        stat = os.stat(filename)
+        old = old_entries.get(arcname)
+        if old and old['size'] == stat.st_size and \
+                old['mtime'] == stat.st_mtime:
+            sha256 = old['sha256']
+        else:
+            sha256 = _file_sha256(filename)
+        if not old or old['sha256'] != sha256 or old['mode'] != stat.st_mode:
+            unchanged = False
+        entries[arcname] = {'size': stat.st_size, 'mtime': stat.st_mtime,
+                            'mode': stat.st_mode, 'sha256': sha256}
+
+    if unchanged:
+        log.debug('bundle unchanged: %s', bundle_file)
+        return bundle_file, False
+
+    # the entries are streamed into the bundle using the public zipfile API
+    # (copying the compressed data of unchanged entries needs zipfile
+    # internals so a changed bundle is compressed again)
+    folder = os.path.dirname(os.path.abspath(bundle_file))
+    fd, tmp_file = tempfile.mkstemp(dir=folder, suffix='.zip')
+    os.close(fd)
+    try:
+        with zipfile.ZipFile(tmp_file, 'w', zipfile.ZIP_DEFLATED) as new_zip:
+            for arcname, filename in files:
+                _write_entry(new_zip,
+                             _zipinfo(arcname, entries[arcname]['mode']),
+                             filename)
+    except Exception:
+        os.unlink(tmp_file)
+        raise
+    shutil.move(tmp_file, bundle_file)
+    os.chmod(bundle_file, 0o644)  # mkstemp creates the file with 0600
+    log.debug('bundle %s: %d files', bundle_file, len(files))
+
+    write_json_cache(manifest_file, {
+        'bundle': {'name': bundle_file,
+                   'size': os.path.getsize(bundle_file),
+                   'mtime': os.path.getmtime(bundle_file)},
+        'files': entries
+    })
+    return bundle_file, True
@@ -19,14 +19,22 @@ from clint.textui import colored
 from gcdt.ramuda_utils import filter_bucket_notifications_with_arn
 from gcdt.ramuda_wire import unwire, unwire_deprecated
 from .cloudwatch_logs import put_retention_policy, delete_log_group, \
-    filter_log_events, decode_format_timestamp, datetime_to_timestamp
+    iter_log_events, iter_log_events_concurrent, LogTail, \
+    decode_format_timestamp, datetime_to_timestamp
 from .ramuda_utils import s3_upload, \
-    lambda_exists, create_sha256, get_remote_code_hash, unit, \
+    lambda_exists, get_remote_code_hash, unit, \
     aggregate_datapoints, build_filter_rules
-from .utils import GracefulExit, json2table
+from .ramuda_bundle import to_artifact
+from .gcdt_pagination import iter_items
+from .gcdt_inventory import list_resources, find_resources, put_resource, \
+    remove_resource
+from .utils import GracefulExit, json2table, wait_until
 
 log = logging.getLogger(__name__)
 ALIAS_NAME = 'ACTIVE'
+# max. seconds to wait for a new IAM role and for a new function
+LAMBDA_CREATE_MAX_WAIT = 120
+LAMBDA_READY_MAX_WAIT = 300
 
 
 def _create_alias(awsclient, function_name, function_version,
@@ -54,16 +62,21 @@ def _update_alias(awsclient, function_name, function_version,
 
 
 def _alias_exists(awsclient, function_name, alias_name):
+    if find_resources(awsclient, 'alias', alias_name, parent=function_name):
+        return True
     client_lambda = awsclient.get_client('lambda')
     try:
-        client_lambda.get_alias(
+        response = client_lambda.get_alias(
             FunctionName=function_name,
             Name=alias_name
         )
+        response.pop('ResponseMetadata', None)
+        put_resource(awsclient, 'alias', response, parent=function_name)
         return True
     except GracefulExit:
         raise
     except Exception:
+        remove_resource(awsclient, 'alias', alias_name, parent=function_name)
         return False
 
 
@@ -98,19 +111,9 @@ def _get_previous_version(awsclient, function_name, alias_name):
         return str(int(current_version) - 1)
 
     max_version = 0
-    marker = None
-    request_more_versions = True
-    while request_more_versions:
-        kwargs = {'Marker': marker} if marker else {}
-        response = client_lambda.list_versions_by_function(
-            FunctionName=function_name, **kwargs)
-        if 'Marker' not in response:
-            request_more_versions = False
-        else:
-            marker = response['Marker']
-        versions = list(map(_get_version_from_response, response['Versions']))
-        versions.append(max_version)
-        max_version = max(versions)
+    for version in iter_items(client_lambda, 'list_versions_by_function',
+                              'Versions', FunctionName=function_name):
+        max_version = max(max_version, _get_version_from_response(version))
     return str(max(0, max_version - 1))
 
 
@@ -127,9 +130,7 @@ def list_functions(awsclient):
 
     :return: exit_code
     """
-    client_lambda = awsclient.get_client('lambda')
-    response = client_lambda.list_functions()
-    for function in response['Functions']:
+    for function in list_resources(awsclient, 'function'):
         log.info(function['FunctionName'])
         log.info('\t' 'Memory: ' + str(function['MemorySize']))
         log.info('\t' 'Timeout: ' + str(function['Timeout']))
@@ -165,13 +166,14 @@ def deploy_lambda(awsclient, function_name, role, handler_filename,
     :param subnet_ids:
     :param security_groups:
     :param artifact_bucket:
-    :param zipfile:
+    :param zipfile: BundleArtifact (or bytes)
     :param environment: environment variables
     :param retention_in_days: retention time of the cloudwatch logs
     :return: exit_code
     """
     # TODO: the signature of this function is too big, clean this up
     # also consolidate create, update, config and add waiters!
+    zipfile = to_artifact(zipfile)
     if lambda_exists(awsclient, function_name):
         function_version = _update_lambda(awsclient, function_name,
                                           handler_filename,
@@ -185,7 +187,7 @@ def deploy_lambda(awsclient, function_name, role, handler_filename,
     else:
         if not zipfile:
             return 1
-        log.info('buffer size: %0.2f MB' % float(len(zipfile) / 1000000.0))
+        log.info('buffer size: %0.2f MB' % float(zipfile.size / 1000000.0))
         function_version = _create_lambda(awsclient, function_name, role,
                                           handler_filename, handler_function,
                                           folders, description, timeout,
@@ -227,75 +229,104 @@ def _create_lambda(awsclient, function_name, role, handler_filename,
     # function_name, role, handler_filename, str(folders), str(timeout), str(memory))
     if environment is None:
         environment = {}
+    zipfile = to_artifact(zipfile)
+
+    request = {
+        'FunctionName': function_name,
+        'Runtime': runtime,
+        'Role': role,
+        'Handler': handler_function,
+        'Description': description,
+        'Timeout': int(timeout),
+        'MemorySize': int(memory),
+        'Publish': True,
+        'Environment': {
+            'Variables': environment
+        }
+    }
+    if subnet_ids and security_groups:
+        request['VpcConfig'] = {
+            'SubnetIds': subnet_ids,
+            'SecurityGroupIds': security_groups
+        }
 
     if not artifact_bucket:
         log.debug('create without artifact bucket...')
-
-        response = client_lambda.create_function(
-            FunctionName=function_name,
-            Runtime=runtime,
-            Role=role,
-            Handler=handler_function,
-            Code={
-                'ZipFile': zipfile
-            },
-            Description=description,
-            Timeout=int(timeout),
-            MemorySize=int(memory),
-            Publish=True,
-            Environment={
-                'Variables': environment
-            }
-        )
+        request['Code'] = {
+            'ZipFile': zipfile.read()
+        }
     elif artifact_bucket and zipfile:
         log.debug('create with artifact bucket...')
-        # print 'uploading bundle to s3'
         log.debug('uploading artifact...')
         dest_key, e_tag, version_id = \
             s3_upload(awsclient, artifact_bucket, zipfile, function_name)
-        log.debug('call create_function')
-        # print dest_key, e_tag, version_id
-        response = client_lambda.create_function(
-            FunctionName=function_name,
-            Runtime=runtime,
-            Role=role,
-            Handler=handler_function,
-            Code={
-                'S3Bucket': artifact_bucket,
-                'S3Key': dest_key,
-                'S3ObjectVersion': version_id
-            },
-            Description=description,
-            Timeout=int(timeout),
-            MemorySize=int(memory),
-            Publish=True,
-            Environment={
-                'Variables': environment
-            }
-        )
+        request['Code'] = {
+            'S3Bucket': artifact_bucket,
+            'S3Key': dest_key,
+            'S3ObjectVersion': version_id
+        }
     else:
         log.debug('no zipfile and no artifact_bucket -> nothing to do!')
         # no zipfile and no artifact_bucket -> nothing to do!
         return
+
+    log.debug('call create_function')
+    response = wait_until(
+        lambda: _try_create_function(client_lambda, request),
+        max_wait=LAMBDA_CREATE_MAX_WAIT, name='role %s' % role)
     log.debug('lambda create completed...')
 
     function_version = response['Version']
     log.info(json2table(response))
-    # FIXME: 23.08.2016 WHY update configuration after create?
-    # timing issue:
-    # http://jenkins.dev.dp.glomex.cloud/job/packages/job/gcdt_pull_request/32/console
-    #       1) we need to wait till the function is available for update
-    #          is there a better way than sleep?
-    time.sleep(15)
-    #       2) I believe this was implemented as shortcut to set subnet, and sg
-    #          a way better way is to set this is using the using VPCConfig argument!
-    _update_lambda_configuration(
-        awsclient, function_name, role, handler_function, description,
-        timeout, memory, subnet_ids, security_groups
-    )
+    _wait_for_function_ready(awsclient, function_name)
     return function_version
 
 
+def _try_create_function(client_lambda, request):
+    """Call create_function, return None if the role can not be assumed yet.
+
+    A new IAM role takes a few seconds until it is usable by AWS Lambda.
+    """
+    try:
+        return client_lambda.create_function(**request)
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'InvalidParameterValueException' \
+                and 'cannot be assumed' in e.response['Error']['Message']:
+            log.debug('role not yet available for AWS Lambda')
+            return None
+        raise
+
+
+def _is_function_ready(client_lambda, function_name):
+    try:
+        config = client_lambda.get_function_configuration(
+            FunctionName=function_name)
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ResourceNotFoundException':
+            return False
+        raise
+    # 'State' and 'LastUpdateStatus' are only returned by newer API versions
+    state = config.get('State', 'Active')
+    if state == 'Failed':
+        raise Exception('Lambda function %s failed: %s' % (
+            function_name, config.get('StateReason', '')))
+    return state == 'Active' and \
+        config.get('LastUpdateStatus', 'Successful') != 'InProgress'
+
+
+def _wait_for_function_ready(awsclient, function_name,
+                             max_wait=LAMBDA_READY_MAX_WAIT):
+    """Wait until the lambda function is available for further updates.
+
+    :param awsclient:
+    :param function_name:
+    :param max_wait: max. seconds to wait
+    """
+    client_lambda = awsclient.get_client('lambda')
+    wait_until(lambda: _is_function_ready(client_lambda, function_name),
+               max_wait=max_wait, name='lambda function %s' % function_name)
+
+
 def _update_lambda(awsclient, function_name, handler_filename,
                    handler_function, folders,
                    role, description, timeout, memory, subnet_ids=None,
@@ -319,14 +350,14 @@ def _update_lambda(awsclient, function_name, handler_filename,
 def bundle_lambda(zipfile):
     """Write zipfile contents to file.
 
-    :param zipfile:
+    :param zipfile: BundleArtifact (or bytes)
     :return: exit_code
     """
     # TODO have 'bundle.zip' as default config
+    zipfile = to_artifact(zipfile)
     if not zipfile:
         return 1
-    with open('bundle.zip', 'wb') as zfile:
-        zfile.write(zipfile)
+    zipfile.save('bundle.zip')
     log.info('Finished - a bundle.zip is waiting for you...')
     return 0
 
@@ -338,9 +369,10 @@ def _update_lambda_function_code(
 ):
     log.debug('Updating existing AWS Lambda function...')
     client_lambda = awsclient.get_client('lambda')
+    zipfile = to_artifact(zipfile)
     if not zipfile:
         return 1
-    local_hash = create_sha256(zipfile)
+    local_hash = zipfile.sha256()
     log.debug('local_hash: %s', local_hash)
 
     remote_hash = get_remote_code_hash(awsclient, function_name)
@@ -352,7 +384,7 @@ def _update_lambda_function_code(
             log.warn('no stack bucket found')
             response = client_lambda.update_function_code(
                 FunctionName=function_name,
-                ZipFile=zipfile,
+                ZipFile=zipfile.read(),
                 Publish=True
             )
         else:
@@ -487,6 +519,7 @@ def delete_lambda(awsclient, function_name, events=None, delete_logs=False):
         unwire(awsclient, events, function_name, alias_name=ALIAS_NAME)
     client_lambda = awsclient.get_client('lambda')
     response = client_lambda.delete_function(FunctionName=function_name)
+    remove_resource(awsclient, 'function', function_name)
     if delete_logs:
         log_group_name = '/aws/lambda/%s' % function_name
         delete_log_group(awsclient, log_group_name)
@@ -513,6 +546,7 @@ def delete_lambda_deprecated(awsclient, function_name, s3_event_sources=[],
                       alias_name=ALIAS_NAME)
     client_lambda = awsclient.get_client('lambda')
     response = client_lambda.delete_function(FunctionName=function_name)
+    remove_resource(awsclient, 'function', function_name)
     if delete_logs:
         log_group_name = '/aws/lambda/%s' % function_name
         delete_log_group(awsclient, log_group_name)
@@ -604,9 +638,9 @@ def info(awsclient, function_name, s3_event_sources=None,
             log.info('- \tCloudWatch: %s' % rule_name)
             try:
                 rule_response = client_events.describe_rule(Name=rule_name)
-                target_list = client_events.list_targets_by_rule(
-                    Rule=rule_name,
-                )["Targets"]
+                target_list = list(iter_items(
+                    client_events, 'list_targets_by_rule', 'Targets',
+                    Rule=rule_name))
                 if target_list:
                     log.info("\t\tSchedule expression: {}".format(
                         rule_response['ScheduleExpression']))
@@ -700,14 +734,18 @@ def invoke(awsclient, function_name, payload, invocation_type=None,
         return results
 
 
-def logs(awsclient, function_name, start_dt, end_dt=None, tail=False):
-    """Send a ping request to a lambda function.
+def logs(awsclient, function_name, start_dt, end_dt=None, tail=False,
+         filter_pattern=None, log_stream_names=None, slices=None):
+    """Output the cloudwatch logs of a lambda function.
 
     :param awsclient:
     :param function_name:
     :param start_dt:
     :param end_dt:
     :param tail:
+    :param filter_pattern: CloudWatch Logs filter pattern
+    :param log_stream_names: only output events from these log streams
+    :param slices: fetch the time range in concurrent slices (not for tail)
     :return:
     """
     log.debug('Getting cloudwatch logs for: %s', function_name)
@@ -720,24 +758,25 @@ def logs(awsclient, function_name, start_dt, end_dt=None, tail=False):
     else:
         end_ts = None
 
-    # tail mode
-    # we assume that logs can arrive late but not out of order
-    # so we hold the timestamp of the last logentry and start the next iteration
-    # from there
-    while True:
-        logentries = filter_log_events(awsclient, log_group_name,
-                                       start_ts=start_ts, end_ts=end_ts)
-        if logentries:
-            for e in logentries:
-                actual_date, actual_time = decode_format_timestamp(e['timestamp'])
-                if current_date != actual_date:
-                    # print the date only when it changed
-                    current_date = actual_date
-                    log.info(current_date)
-                log.info('%s  %s' % (actual_time, e['message'].strip()))
-        if tail:
-            if logentries:
-                start_ts = logentries[-1]['timestamp'] + 1
-            time.sleep(2)
-            continue
-        break
+    if tail:
+        logentries = LogTail(awsclient, log_group_name, start_ts,
+                             log_stream_names=log_stream_names,
+                             filter_pattern=filter_pattern).follow()
+    elif slices:
+        logentries = iter_log_events_concurrent(
+            awsclient, log_group_name, start_ts,
+            end_ts or int(time.time() * 1000),
+            log_stream_names=log_stream_names,
+            filter_pattern=filter_pattern, slices=slices)
+    else:
+        logentries = iter_log_events(
+            awsclient, log_group_name, start_ts, end_ts,
+            log_stream_names=log_stream_names,
+            filter_pattern=filter_pattern)
+    for e in logentries:
+        actual_date, actual_time = decode_format_timestamp(e['timestamp'])
+        if current_date != actual_date:
+            # print the date only when it changed
+            current_date = actual_date
+            log.info(current_date)
+        log.info('%s  %s' % (actual_time, e['message'].strip()))
@@ -7,6 +7,7 @@ Commands to deploy Lambda functions to AWS
 
 from __future__ import unicode_literals, print_function
 
+import os
 import sys
 
 from clint.textui import colored
@@ -15,11 +16,6 @@ from . import gcdt_lifecycle
 from . import utils
 from .gcdt_cmd_dispatcher import cmd
 from .gcdt_defaults import DEFAULT_CONFIG
-from .ramuda_core import list_functions, get_metrics, deploy_lambda, \
-    bundle_lambda, delete_lambda_deprecated, rollback,\
-    ping, info, cleanup_bundle, invoke, logs, delete_lambda
-from gcdt.ramuda_wire import wire, wire_deprecated, unwire, unwire_deprecated
-from .ramuda_utils import check_and_format_logs_params
 from .gcdt_logging import getLogger
 
 
@@ -36,23 +32,25 @@ log = getLogger(__name__)
 DOC = '''Usage:
         ramuda clean
         ramuda bundle [--keep] [-v]
-        ramuda deploy [--keep] [-v]
+        ramuda deploy [--keep] [-v] [--metrics-file=<file>]
+        ramuda deploy-all [--workers=<workers>] [-v] [--metrics-file=<file>]
         ramuda list
         ramuda metrics <lambda>
         ramuda info
-        ramuda wire [-v]
-        ramuda unwire [-v]
-        ramuda delete [-v] -f <lambda> [--delete-logs]
+        ramuda wire [-v] [--metrics-file=<file>]
+        ramuda unwire [-v] [--metrics-file=<file>]
+        ramuda delete [-v] -f <lambda> [--delete-logs] [--metrics-file=<file>]
         ramuda rollback [-v] <lambda> [<version>]
         ramuda ping [-v] <lambda> [<version>]
         ramuda invoke [-v] <lambda> [<version>] [--invocation-type=<type>] --payload=<payload> [--outfile=<file>]
-        ramuda logs <lambda> [--start=<start>] [--end=<end>] [--tail]
+        ramuda logs <lambda> [--start=<start>] [--end=<end>] [--tail] [--filter=<pattern>] [--stream=<stream>]... [--slices=<slices>]
         ramuda version
 
 Options:
 -h --help               show this
 -v --verbose            show debug messages
 --keep                  keep (reuse) installed packages
+--workers=workers       max. number of concurrent deployments (default: 4)
 --payload=payload       '{"foo": "bar"}' or file://input.txt
 --invocation-type=type  Event, RequestResponse or DryRun
 --outfile=file          write the response to file
@@ -60,6 +58,10 @@ Options:
 --start=start           log start UTC '2017-06-28 14:23' or '1h', '3d', '5w', ...
 --end=end               log end UTC '2017-06-28 14:25' or '2h', '4d', '6w', ...
 --tail                  continuously output logs (can't use '--end'), stop 'Ctrl-C'
+--filter=pattern        only output events matching the CloudWatch Logs filter pattern
+--stream=stream         only output events from this log stream (can be repeated)
+--slices=slices         fetch the time range in concurrent slices (can't use '--tail')
+--metrics-file=file     write the AWS API call metrics to a JSON file
 '''
 
 
@@ -70,62 +72,54 @@ def version_cmd():
 
 @cmd(spec=['clean'])
 def clean_cmd():
+    from .ramuda_core import cleanup_bundle
     return cleanup_bundle()
 
 
 @cmd(spec=['list'])
 def list_cmd(**tooldata):
+    from .ramuda_core import list_functions
     context = tooldata.get('context')
     awsclient = context.get('_awsclient')
     return list_functions(awsclient)
 
 
+def _build_bundle(context, config):
+    # python functions are bundled incrementally (like deploy-all), other
+    # runtimes use the bundle of the bundler plugin
+    from .ramuda_bundle import BundleArtifact, get_bundle
+    from .ramuda_orchestrator import build_config_bundle, \
+        check_function_config
+    if not config or 'lambda' not in config or check_function_config(config):
+        return get_bundle(context), True
+    bundle_file, changed = build_config_bundle(config)
+    context['_bundle_file'] = bundle_file
+    return BundleArtifact(filename=bundle_file), changed
+
+
 @cmd(spec=['deploy', '--keep'])
 def deploy_cmd(keep, **tooldata):
+    from .ramuda_orchestrator import deploy_function_config
     context = tooldata.get('context')
     context['keep'] = keep or DEFAULT_CONFIG['ramuda']['keep']
     config = tooldata.get('config')
     awsclient = context.get('_awsclient')
-    fail_deployment_on_unsuccessful_ping = \
-        config.get('failDeploymentOnUnsuccessfulPing', False)
-    lambda_name = config['lambda'].get('name')
-    lambda_description = config['lambda'].get('description')
-    role_arn = config['lambda'].get('role')
-    lambda_handler = config['lambda'].get('handlerFunction')
-    handler_filename = config['lambda'].get('handlerFile')
-    timeout = int(config['lambda'].get('timeout'))
-    memory_size = int(config['lambda'].get('memorySize'))
-    folders_from_file = config['bundling'].get('folders')
-    subnet_ids = config['lambda'].get('vpc', {}).get('subnetIds', None)
-    security_groups = config['lambda'].get('vpc', {}).get('securityGroups', None)
-    artifact_bucket = config.get('deployment', {}).get('artifactBucket', None)
-    zipfile = context['_zipfile']
-    runtime = config['lambda'].get('runtime', 'python2.7')
-    environment = config['lambda'].get('environment', {})
-    retention_in_days = config['lambda'].get('logs', {}).get('retentionInDays', None)
-    if runtime:
-        assert runtime in DEFAULT_CONFIG['ramuda']['runtime']
-    settings = config['lambda'].get('settings', None)
-    exit_code = deploy_lambda(
-        awsclient, lambda_name, role_arn, handler_filename,
-        lambda_handler, folders_from_file,
-        lambda_description, timeout,
-        memory_size, subnet_ids=subnet_ids,
-        security_groups=security_groups,
-        artifact_bucket=artifact_bucket,
-        zipfile=zipfile,
-        fail_deployment_on_unsuccessful_ping=
-        fail_deployment_on_unsuccessful_ping,
-        runtime=runtime,
-        settings=settings,
-        environment=environment,
-        retention_in_days=retention_in_days
-    )
-    return exit_code
+    bundle, _ = _build_bundle(context, config)
+    return deploy_function_config(awsclient, config, bundle)
+
+
+@cmd(spec=['deploy-all', '--workers'])
+def deploy_all_cmd(workers, **tooldata):
+    from .ramuda_orchestrator import deploy_all
+    context = tooldata.get('context')
+    config = tooldata.get('config')
+    awsclient = context.get('_awsclient')
+    return deploy_all(awsclient, config, workers=int(workers or 4))
 
 
 @cmd(spec=['metrics', '<lambda>'])
 def metrics_cmd(lambda_name, **tooldata):
+    from .ramuda_core import get_metrics
     context = tooldata.get('context')
     awsclient = context.get('_awsclient')
     return get_metrics(awsclient, lambda_name)
@@ -133,6 +127,7 @@ def metrics_cmd(lambda_name, **tooldata):
 
 @cmd(spec=['delete', '-f', '<lambda>', '--delete-logs'])
 def delete_cmd(force, lambda_name, delete_logs, **tooldata):
+    from .ramuda_core import delete_lambda, delete_lambda_deprecated
     context = tooldata.get('context')
     config = tooldata.get('config')
     awsclient = context.get('_awsclient')
@@ -156,6 +151,7 @@ def delete_cmd(force, lambda_name, delete_logs, **tooldata):
 
 @cmd(spec=['info'])
 def info_cmd(**tooldata):
+    from .ramuda_core import info
     context = tooldata.get('context')
     config = tooldata.get('config')
     awsclient = context.get('_awsclient')
@@ -168,6 +164,7 @@ def info_cmd(**tooldata):
 
 @cmd(spec=['wire'])
 def wire_cmd(**tooldata):
+    from .ramuda_wire import wire, wire_deprecated
     context = tooldata.get('context')
     config = tooldata.get('config')
     awsclient = context.get('_awsclient')
@@ -186,6 +183,7 @@ def wire_cmd(**tooldata):
 
 @cmd(spec=['unwire'])
 def unwire_cmd(**tooldata):
+    from .ramuda_wire import unwire, unwire_deprecated
     context = tooldata.get('context')
     config = tooldata.get('config')
     awsclient = context.get('_awsclient')
@@ -204,12 +202,20 @@ def unwire_cmd(**tooldata):
 
 @cmd(spec=['bundle', '--keep'])
 def bundle_cmd(keep, **tooldata):
+    from .ramuda_core import bundle_lambda
+    from .ramuda_bundle import BundleArtifact
     context = tooldata.get('context')
-    return bundle_lambda(context['_zipfile'])
+    bundle, changed = _build_bundle(context, tooldata.get('config'))
+    if not changed and os.path.isfile('bundle.zip') and \
+            BundleArtifact(filename='bundle.zip').sha256() == bundle.sha256():
+        log.info('bundle.zip is up to date')
+        return 0
+    return bundle_lambda(bundle)
 
 
 @cmd(spec=['rollback', '<lambda>', '<version>'])
 def rollback_cmd(lambda_name, version, **tooldata):
+    from .ramuda_core import rollback
     context = tooldata.get('context')
     awsclient = context.get('_awsclient')
     if version:
@@ -222,6 +228,7 @@ def rollback_cmd(lambda_name, version, **tooldata):
 
 @cmd(spec=['ping', '<lambda>', '<version>'])
 def ping_cmd(lambda_name, version=None, **tooldata):
+    from .ramuda_core import ping
     context = tooldata.get('context')
     awsclient = context.get('_awsclient')
     if version:
@@ -241,6 +248,7 @@ def ping_cmd(lambda_name, version=None, **tooldata):
 def invoke_cmd(lambda_name, version, itype, payload, outfile, **tooldata):
     # samples
     # $ ramuda invoke infra-dev-sample-lambda-unittest --payload='{"ramuda_action": "ping"}'
+    from .ramuda_core import invoke
     context = tooldata.get('context')
     awsclient = context.get('_awsclient')
     results = invoke(awsclient, lambda_name, payload, invocation_type=itype,
@@ -249,14 +257,21 @@ def invoke_cmd(lambda_name, version, itype, payload, outfile, **tooldata):
     log.info(results)
 
 
-@cmd(spec=['logs', '<lambda>', '--start', '--end', '--tail'])
-def logs_cmd(lambda_name, start, end, tail, **tooldata):
+@cmd(spec=['logs', '<lambda>', '--start', '--end', '--tail', '--filter',
+           '--stream', '--slices'])
+def logs_cmd(lambda_name, start, end, tail, filter_pattern=None,
+             streams=None, slices=None, **tooldata):
+    from .ramuda_core import logs
+    from .ramuda_utils import check_and_format_logs_params
 
     context = tooldata.get('context')
     awsclient = context.get('_awsclient')
     if tail and end:
         log.error(colored.red('You can not use \'--end\' and \'--tail\' options together.'))
         return 1
+    if tail and slices:
+        log.error(colored.red('You can not use \'--slices\' and \'--tail\' options together.'))
+        return 1
 
     start_dt, end_dt = check_and_format_logs_params(start, end, tail)
 
@@ -266,7 +281,9 @@ def logs_cmd(lambda_name, start, end, tail, **tooldata):
 
     if tail:
         log.info(colored.yellow('Use \'Ctrl-C\' to exit tail mode'))
-    logs(awsclient, lambda_name, start_dt=start_dt, end_dt=end_dt, tail=tail)
+    logs(awsclient, lambda_name, start_dt=start_dt, end_dt=end_dt, tail=tail,
+         filter_pattern=filter_pattern, log_stream_names=streams or None,
+         slices=int(slices) if slices else None)
 
 
 def main():
@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+"""Deploy multiple lambda functions from one ramuda invocation.
+
+The functions are listed in the 'functions' section of the ramuda config.
+Config, lookups and credential check are done once for all functions. The
+bundles are built in a process pool (see ramuda_bundle), the deployments
+(upload, create / update, ping, alias) run concurrently in a thread pool.
+
+The bundles contain the same files as the bundles of gcdt-bundler: the
+configured folders, the handler file, the settings file and the packages of
+requirements.txt.
+"""
+from __future__ import unicode_literals, print_function
+import copy
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, \
+    as_completed
+
+from tabulate import tabulate
+
+from .gcdt_defaults import DEFAULT_CONFIG
+from .gcdt_logging import getLogger
+from .ramuda_bundle import BundleArtifact, build_bundle
+from .ramuda_core import deploy_lambda
+from .utils import GracefulExit, dict_merge
+
+log = getLogger(__name__)
+
+
+BUNDLE_DIR = os.path.join('.gcdt', 'bundles')
+REQUIREMENTS_FILE = 'requirements.txt'
+
+
+def get_function_configs(config):
+    """Assemble the config for every function of the 'functions' section.
+
+    Settings on the top level of the ramuda config (e.g. 'deployment',
+    'failDeploymentOnUnsuccessfulPing') apply to all functions, the function
+    config takes precedence.
+
+    :param config: ramuda config
+    :return: list of function configs (same format as the ramuda config)
+    """
+    shared = dict([(k, v) for k, v in config.items() if k != 'functions'])
+    function_configs = []
+    for function_config in config.get('functions', []):
+        function_configs.append(
+            dict_merge(copy.deepcopy(shared), copy.deepcopy(function_config)))
+    return function_configs
+
+
+def deploy_function_config(awsclient, config, zipfile):
+    """Deploy a lambda function as configured in the ramuda config.
+
+    :param awsclient:
+    :param config: ramuda config (containing 'lambda', 'bundling', ...)
+    :param zipfile: BundleArtifact
+    :return: exit_code
+    """
+    fail_deployment_on_unsuccessful_ping = \
+        config.get('failDeploymentOnUnsuccessfulPing', False)
+    lambda_name = config['lambda'].get('name')
+    lambda_description = config['lambda'].get('description')
+    role_arn = config['lambda'].get('role')
+    lambda_handler = config['lambda'].get('handlerFunction')
+    handler_filename = config['lambda'].get('handlerFile')
+    timeout = int(config['lambda'].get('timeout'))
+    memory_size = int(config['lambda'].get('memorySize'))
+    folders_from_file = config['bundling'].get('folders')
+    subnet_ids = config['lambda'].get('vpc', {}).get('subnetIds', None)
+    security_groups = config['lambda'].get('vpc', {}).get('securityGroups', None)
+    artifact_bucket = config.get('deployment', {}).get('artifactBucket', None)
+    runtime = config['lambda'].get('runtime', 'python2.7')
+    environment = config['lambda'].get('environment', {})
+    retention_in_days = config['lambda'].get('logs', {}).get('retentionInDays', None)
+    if runtime:
+        assert runtime in DEFAULT_CONFIG['ramuda']['runtime']
+    settings = config['lambda'].get('settings', None)
+    return deploy_lambda(
+        awsclient, lambda_name, role_arn, handler_filename,
+        lambda_handler, folders_from_file,
+        lambda_description, timeout,
+        memory_size, subnet_ids=subnet_ids,
+        security_groups=security_groups,
+        artifact_bucket=artifact_bucket,
+        zipfile=zipfile,
+        fail_deployment_on_unsuccessful_ping=
+        fail_deployment_on_unsuccessful_ping,
+        runtime=runtime,
+        settings=settings,
+        environment=environment,
+        retention_in_days=retention_in_days
+    )
+
+
+def check_function_config(config):
+    """Check whether deploy-all can bundle the function like 'ramuda deploy'.
+
+    :param config: function config
+    :return: error message or None
+    """
+    runtime = config['lambda'].get('runtime', 'python2.7')
+    if not runtime.startswith('python'):
+        # gcdt-bundler installs the dependencies of package.json using npm
+        return 'runtime \'%s\' is not supported by deploy-all, please ' \
+               'use \'ramuda deploy\'' % runtime
+
+
+def install_requirements(requirements_file=REQUIREMENTS_FILE,
+                         bundle_dir=BUNDLE_DIR):
+    """Install the packages of the requirements file into a folder which is
+    added to the bundles. The folder is reused until the requirements change.
+
+    :param requirements_file:
+    :param bundle_dir: folder for bundles and manifests
+    :return: folder containing the packages
+    """
+    with open(requirements_file, 'rb') as rfile:
+        digest = hashlib.sha1(rfile.read()).hexdigest()
+    folder = os.path.join(bundle_dir, 'requirements-%s' % digest)
+    if not os.path.isdir(folder):
+        log.info('installing %s', requirements_file)
+        tmp_folder = folder + '.tmp'
+        shutil.rmtree(tmp_folder, ignore_errors=True)
+        subprocess.check_call([
+            sys.executable, '-m', 'pip', 'install', '--quiet',
+            '-r', requirements_file, '-t', tmp_folder])
+        os.rename(tmp_folder, folder)
+    return folder
+
+
+def _write_settings(name, settings, bundle_dir=BUNDLE_DIR):
+    # the file is only written if the settings changed (the bundle is
+    # rebuilt if the file changes)
+    folder = os.path.join(bundle_dir, name)
+    settings_file = os.path.join(folder,
+                                 DEFAULT_CONFIG['ramuda']['settings_file'])
+    data = json.dumps(settings, sort_keys=True, indent=4)
+    if os.path.isfile(settings_file):
+        with open(settings_file) as sfile:
+            if sfile.read() == data:
+                return settings_file
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    with open(settings_file, 'w') as sfile:
+        sfile.write(data)
+    return settings_file
+
+
+def get_bundle_folders(config, requirements_folder=None,
+                       bundle_dir=BUNDLE_DIR):
+    """The folders and files of a function bundle (like gcdt-bundler).
+
+    :param config: function config
+    :param requirements_folder: packages of requirements.txt
+    :param bundle_dir: folder for bundles and manifests
+    :return: list of {'source': <path or glob>, 'target': <path>}
+    """
+    folders = []
+    if requirements_folder:
+        folders.append({'source': requirements_folder, 'target': '.'})
+    folders.extend(config.get('bundling', {}).get('folders', []))
+    handler_filename = config['lambda'].get('handlerFile')
+    if handler_filename:
+        folders.append({'source': handler_filename, 'target': '.'})
+    settings = config['lambda'].get('settings')
+    if settings:
+        folders.append({
+            'source': _write_settings(config['lambda']['name'], settings,
+                                      bundle_dir),
+            'target': '.'})
+    return folders
+
+
+def build_function_bundle(name, folders, bundle_dir=BUNDLE_DIR):
+    """Build the bundle of a function (runs in a worker process).
+
+    :param name: function name
+    :param folders: list of {'source': <path or glob>, 'target': <path>}
+    :param bundle_dir: folder for bundles and manifests
+    :return: bundle filename
+    """
+    return _build_function_bundle(name, folders, bundle_dir)[0]
+
+
+def _build_function_bundle(name, folders, bundle_dir=BUNDLE_DIR):
+    if not os.path.isdir(bundle_dir):
+        try:
+            os.makedirs(bundle_dir)
+        except OSError:
+            if not os.path.isdir(bundle_dir):
+                raise
+    return build_bundle(
+        folders, bundle_file=os.path.join(bundle_dir, '%s.zip' % name),
+        manifest_file=os.path.join(bundle_dir, '%s.json' % name))
+
+
+def build_config_bundle(config, bundle_dir=BUNDLE_DIR,
+                        requirements_file=REQUIREMENTS_FILE):
+    """Build the bundle of the function in the ramuda config (used by
+    'ramuda deploy' and 'ramuda bundle').
+
+    :param config: ramuda config
+    :param bundle_dir: folder for bundles and manifests
+    :param requirements_file: installed into the bundle (if present)
+    :return: tuple (bundle_file, changed)
+    """
+    requirements_folder = None
+    if os.path.isfile(requirements_file):
+        requirements_folder = install_requirements(requirements_file,
+                                                   bundle_dir)
+    return _build_function_bundle(
+        config['lambda']['name'],
+        get_bundle_folders(config, requirements_folder, bundle_dir),
+        bundle_dir)
+
+
+def build_bundles(function_configs, workers=4, bundle_dir=BUNDLE_DIR,
+                  requirements_file=REQUIREMENTS_FILE):
+    """Build the bundles of the functions in a process pool.
+
+    :param function_configs: list of function configs
+    :param workers: max. number of worker processes
+    :param bundle_dir: folder for bundles and manifests
+    :param requirements_file: installed into every bundle (if present)
+    :return: dictionary function name -> BundleArtifact (or Exception)
+    """
+    bundles = {}
+    requirements_folder = None
+    if os.path.isfile(requirements_file):
+        try:
+            requirements_folder = install_requirements(requirements_file,
+                                                       bundle_dir)
+        except GracefulExit:
+            raise
+        except Exception as e:
+            log.error('Installing %s failed: %s', requirements_file, str(e))
+            return dict([(c['lambda']['name'], e) for c in function_configs])
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for config in function_configs:
+            name = config['lambda']['name']
+            future = executor.submit(
+                build_function_bundle, name,
+                get_bundle_folders(config, requirements_folder, bundle_dir),
+                bundle_dir)
+            futures[future] = name
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                bundles[name] = BundleArtifact(filename=future.result())
+            except GracefulExit:
+                raise
+            except Exception as e:
+                log.error('Bundling of function \'%s\' failed: %s',
+                          name, str(e))
+                bundles[name] = e
+    return bundles
+
+
+def deploy_all(awsclient, config, workers=4,
+               deploy_func=deploy_function_config,
+               build_func=build_bundles):
+    """Deploy all functions of the 'functions' section concurrently.
+
+    :param awsclient:
+    :param config: ramuda config
+    :param workers: max. number of concurrent bundles / deployments
+    :param deploy_func: function(awsclient, config, zipfile) -> exit_code
+    :param build_func: function(function_configs, workers) -> bundles
+    :return: exit_code
+    """
+    function_configs = get_function_configs(config)
+    if not function_configs:
+        log.error('No functions configured in the \'functions\' section.')
+        return 1
+    names = [c['lambda']['name'] for c in function_configs]
+    duplicates = sorted(set([n for n in names if names.count(n) > 1]))
+    if duplicates:
+        log.error('Functions configured more than once: %s',
+                  ', '.join(duplicates))
+        return 1
+
+    errors = [(c['lambda']['name'], check_function_config(c))
+              for c in function_configs]
+    errors = [(name, error) for name, error in errors if error]
+    for name, error in errors:
+        log.error('Function \'%s\': %s', name, error)
+    if errors:
+        return 1
+
+    bundles = build_func(function_configs, workers)
+
+    # create the clients before the threads start
+    for service_name in ['lambda', 's3', 'logs']:
+        awsclient.get_client(service_name)
+
+    results = {}  # function name -> (status, duration)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for function_config in function_configs:
+            name = function_config['lambda']['name']
+            if isinstance(bundles.get(name), Exception):
+                results[name] = ('failed (bundle)', 0)
+                continue
+            future = executor.submit(deploy_func, awsclient, function_config,
+                                     bundles[name])
+            futures[future] = (name, time.time())
+        try:
+            for future in as_completed(futures):
+                name, start = futures[future]
+                try:
+                    exit_code = future.result()
+                except GracefulExit:
+                    raise
+                except Exception as e:
+                    log.error('Deployment of function \'%s\' failed: %s',
+                              name, str(e))
+                    exit_code = 1
+                status = 'failed' if exit_code else 'succeeded'
+                results[name] = (status, time.time() - start)
+        except GracefulExit:
+            for future in futures:
+                future.cancel()
+            raise
+
+    table = [[name, results[name][0], '%.0fs' % results[name][1]]
+             for name in sorted(results)]
+    print(tabulate(table, headers=['Function', 'Status', 'Duration']))
+    if any([status != 'succeeded' for status, _ in results.values()]):
+        return 1
+    return 0
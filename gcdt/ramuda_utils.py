@@ -10,10 +10,12 @@ import time
 
 import maya
 import os
-from s3transfer import S3Transfer
 
 from gcdt.utils import GracefulExit
 from . import utils
+from .gcdt_inventory import find_resources, put_resource, remove_resource
+from .ramuda_bundle import to_artifact
+from .s3 import get_object_info, get_indexed_artifact, add_indexed_artifact
 
 PY3 = sys.version_info[0] >= 3
 
@@ -25,14 +27,19 @@ log = logging.getLogger(__name__)
 
 
 def lambda_exists(awsclient, lambda_name):
+    if find_resources(awsclient, 'function', lambda_name):
+        return True
     client_lambda = awsclient.get_client('lambda')
     try:
-        client_lambda.get_function(FunctionName=lambda_name)
+        response = client_lambda.get_function(FunctionName=lambda_name)
     except GracefulExit:
         raise
     except Exception as e:
+        remove_resource(awsclient, 'function', lambda_name)
         return False
     else:
+        if 'Configuration' in response:
+            put_resource(awsclient, 'function', response['Configuration'])
         return True
 
 
@@ -126,9 +133,11 @@ def build_filter_rules(prefix, suffix):
 
 
 class ProgressPercentage(object):
-    def __init__(self, filename, out=sys.stdout):
+    def __init__(self, filename, out=sys.stdout, size=None):
         self._filename = filename
-        self._size = float(os.path.getsize(filename))
+        if size is None:
+            size = os.path.getsize(filename)
+        self._size = float(size)
         self._seen_so_far = 0
         self._lock = threading.Lock()
         self._time = time.time()
@@ -164,37 +173,50 @@ class ProgressPercentage(object):
 # TODO move this to s3 module
 @utils.retries(3)
 def s3_upload(awsclient, deploy_bucket, zipfile, lambda_name):
+    """Upload the bundle to the deploy bucket.
+
+    The key of the bundle contains the hash of its content. If the bundle
+    is already present (local index or head_object) the upload is skipped.
+    Otherwise the bundle is streamed from file (no copy in memory or in /tmp)
+    using the shared uploader of the awsclient.
+
+    :param awsclient:
+    :param deploy_bucket:
+    :param zipfile: BundleArtifact (or bytes)
+    :param lambda_name:
+    :return: tuple (dest_key, ETag, VersionId)
+    """
     client_s3 = awsclient.get_client('s3')
     region = client_s3.meta.region_name
-    transfer = S3Transfer(client_s3)
     bucket = deploy_bucket
 
-    if not zipfile:
+    bundle = to_artifact(zipfile)
+    if not bundle:
         return
-    local_hash = str(create_sha256_urlsafe(zipfile))
+    local_hash = bundle.sha256_urlsafe()
 
     # ramuda/eu-west-1/<lambda_name>/<local_hash>.zip
     dest_key = 'ramuda/%s/%s/%s.zip' % (region, lambda_name, local_hash)
 
-    source_filename = '/tmp/' + local_hash
-    with open(source_filename, 'wb') as source_file:
-        source_file.write(zipfile)
-
-    # print 'uploading to S3'
-    # start = time.time()
-    transfer.upload_file(source_filename, bucket, dest_key,
-                         callback=ProgressPercentage(source_filename))
-    # end = time.time()
-    # print 'uploading took:'
-    # print(end - start)
-
-    response = client_s3.head_object(Bucket=bucket, Key=dest_key)
-    # print '\n'
-    # print response['ETag']
-    # print response['VersionId']
-    # print(dest_key)
-    # print()
-    return dest_key, response['ETag'], response['VersionId']
+    present = get_indexed_artifact(bucket, dest_key)
+    if present:
+        log.info('bundle already uploaded to s3://%s/%s', bucket, dest_key)
+        return (dest_key,) + present
+
+    present = get_object_info(awsclient, bucket, dest_key)
+    if present:
+        log.info('bundle already present in s3://%s/%s - skipping upload',
+                 bucket, dest_key)
+        etag, version_id = present
+    else:
+        with bundle.open() as source_file:
+            progress = ProgressPercentage(bundle.filename or local_hash,
+                                          size=bundle.size)
+            response = awsclient.get_uploader().upload(
+                source_file, bucket, dest_key, callback=progress)
+        etag, version_id = response['ETag'], response.get('VersionId')
+    add_indexed_artifact(bucket, dest_key, etag, version_id)
+    return dest_key, etag, version_id
 
 
 # helpers for ramuda logs command
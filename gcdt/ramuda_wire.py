@@ -10,6 +10,7 @@ from clint.textui import colored
 
 from gcdt.ramuda_utils import filter_bucket_notifications_with_arn
 from gcdt.utils import json2table
+from .gcdt_pagination import iter_items
 from .ramuda_utils import lambda_exists, get_bucket_from_s3_arn, \
     get_rule_name_from_event_arn, create_aws_s3_arn, build_filter_rules, \
     list_of_dict_equals
@@ -333,9 +334,8 @@ def _remove_events_from_s3_bucket(awsclient, bucket_name, target_lambda_arn,
 def _remove_cloudwatch_rule_event(awsclient, rule_name, target_lambda_arn):
     client_event = awsclient.get_client('events')
     try:
-        target_list = client_event.list_targets_by_rule(
-            Rule=rule_name,
-        )
+        targets = list(iter_items(client_event, 'list_targets_by_rule',
+                                  'Targets', Rule=rule_name))
     except ClientError as e:
         if e.response['Error']['Code'] == 'ResourceNotFoundException':
             return
@@ -343,7 +343,7 @@ def _remove_cloudwatch_rule_event(awsclient, rule_name, target_lambda_arn):
             raise e
     target_id_list = []
 
-    for target in target_list['Targets']:
+    for target in targets:
         if target['Arn'] == target_lambda_arn:
             target_id_list += [target['Id']]
     # remove targets
@@ -353,8 +353,7 @@ def _remove_cloudwatch_rule_event(awsclient, rule_name, target_lambda_arn):
             Ids=target_id_list,
         )
     # Delete rule only if all targets were associated with target_arn (i.e. only target target_arn function)
-    if len(target_id_list) == len(target_list['Targets']) or (
-                not target_id_list and not target_list):
+    if len(target_id_list) == len(targets):
         client_event.delete_rule(
             Name=rule_name
         )
@@ -1,11 +1,52 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals, print_function
+import calendar
+import hashlib
+import json
 import logging
-from s3transfer import S3Transfer
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, \
+    FIRST_COMPLETED
+
 from botocore.client import ClientError
 
+from .gcdt_pagination import iter_pages, iter_items
+from .utils import read_json_cache, write_json_cache
+
+try:
+    import fcntl
+except ImportError:  # windows
+    fcntl = None
+
 log = logging.getLogger(__name__)
 
+PY3 = sys.version_info[0] >= 3
+
+if PY3:
+    basestring = str
+
+MB = 1024 * 1024
+# S3 limits for multipart uploads
+MIN_PART_SIZE = 5 * MB
+MAX_PARTS = 10000
+UPLOAD_STATE_DIR = os.path.join(os.path.expanduser('~'), '.gcdt', 'uploads')
+# unfinished uploads which are not resumed within this time (seconds) are
+# aborted so S3 does not keep (and bill) their parts
+UPLOAD_STATE_TTL = 24 * 3600
+# index of content-addressed objects known to be present in S3
+ARTIFACT_INDEX_FILE = os.path.join('.gcdt', 'artifact_index.json')
+# index entries are trusted for (seconds). After that the object is verified
+# since it might have been deleted (lifecycle rule, other machine, ...)
+ARTIFACT_INDEX_TTL = 3600
+# artifact cleanup
+ARTIFACT_PREFIXES = ['ramuda/', 'kumo/']
+DELETE_BATCH_SIZE = 1000  # S3 limit of delete_objects
+DELETE_REPORT_INTERVAL = 5  # seconds
+
 
 ### bucket
 def prepare_artifacts_bucket(awsclient, bucket):
@@ -53,22 +94,236 @@ def create_bucket(awsclient, bucket):
 
 
 def delete_bucket(awsclient, bucket):
-    # this works up to 1000 keys
     log.debug('deleting bucket %s' % bucket)
     if bucket.startswith('unittest-'):
         client_s3 = awsclient.get_client('s3')
-        # delete all objects first
+        # delete all objects first (including versions and delete markers)
         log.debug('deleting keys')
-        objects = client_s3.list_objects_v2(Bucket=bucket)
-        if objects['KeyCount'] > 0:
-            delete={'Objects': [{'Key': k['Key']} for k in objects['Contents']]}
-            client_s3.delete_objects(Bucket=bucket, Delete=delete)
+        delete_object_versions(awsclient, bucket,
+                               iter_object_versions(awsclient, bucket))
 
         log.debug('deleting bucket')
         # now we can delete the bucket
         client_s3.delete_bucket(Bucket=bucket)
 
 
+### uploads
+class TransferConfig(object):
+    """Configuration for S3 uploads.
+
+    The defaults can be changed using the environment variables
+    GCDT_S3_MULTIPART_CHUNKSIZE (in MB) and GCDT_S3_MAX_CONCURRENCY.
+    """
+    def __init__(self, multipart_threshold=None, multipart_chunksize=None,
+                 max_concurrency=None, state_dir=UPLOAD_STATE_DIR):
+        """
+        :param multipart_threshold: use multipart uploads for files of this
+            size or larger (defaults to the chunksize)
+        :param multipart_chunksize: size of the parts (min 5 MB)
+        :param max_concurrency: max number of concurrent part uploads
+        :param state_dir: folder for the state of unfinished uploads
+        """
+        self.multipart_chunksize = max(
+            multipart_chunksize or
+            int(os.getenv('GCDT_S3_MULTIPART_CHUNKSIZE', 8)) * MB,
+            MIN_PART_SIZE)
+        self.multipart_threshold = \
+            multipart_threshold or self.multipart_chunksize
+        self.max_concurrency = max_concurrency or \
+            int(os.getenv('GCDT_S3_MAX_CONCURRENCY', 10))
+        self.state_dir = state_dir
+
+
+class S3Uploader(object):
+    """Upload files to S3 using concurrent multipart uploads.
+
+    The uploader is shared via the awsclient (awsclient.get_uploader()) so
+    all uploads of a gcdt process use the same thread pool.
+    Multipart uploads of files are resumable: the state of unfinished
+    uploads is kept in the state_dir so an interrupted upload (e.g. SIGTERM)
+    continues with the missing parts on the next run. Unfinished uploads
+    which are not resumed within UPLOAD_STATE_TTL are aborted.
+
+    s3transfer is not used since it can neither resume uploads nor return
+    the response (ETag, VersionId) of the upload.
+    """
+    def __init__(self, client_s3, config=None):
+        self._client = client_s3
+        self._config = config or TransferConfig()
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self._config.max_concurrency)
+            return self._executor
+
+    def shutdown(self):
+        """Wait for running uploads and stop the threads."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def upload(self, source, bucket, key, callback=None):
+        """Upload a file to S3.
+
+        :param source: filename or binary file object
+        :param bucket:
+        :param key:
+        :param callback: called with the number of bytes transferred
+        :return: response of put_object / complete_multipart_upload
+            (contains 'ETag' and 'VersionId' for versioned buckets)
+        """
+        if isinstance(source, basestring):
+            with open(source, 'rb') as fileobj:
+                return self.upload(fileobj, bucket, key, callback)
+
+        fileobj = source
+        fileobj.seek(0, os.SEEK_END)
+        size = fileobj.tell()
+        fileobj.seek(0)
+        if size < self._config.multipart_threshold:
+            response = self._client.put_object(Bucket=bucket, Key=key,
+                                               Body=fileobj)
+            if callback:
+                callback(size)
+            return response
+        return self._multipart_upload(fileobj, bucket, key, size, callback)
+
+    def _get_state_file(self, fileobj, bucket, key, size):
+        # only uploads from files can be resumed
+        filename = getattr(fileobj, 'name', None)
+        if not isinstance(filename, basestring) or \
+                not os.path.isfile(filename):
+            return None
+        fingerprint = json.dumps([os.path.abspath(filename), size,
+                                  os.path.getmtime(filename), bucket, key])
+        return os.path.join(
+            self._config.state_dir,
+            hashlib.sha1(fingerprint.encode('utf-8')).hexdigest() + '.json')
+
+    def _abort_upload(self, bucket, key, upload_id):
+        try:
+            self._client.abort_multipart_upload(
+                Bucket=bucket, Key=key, UploadId=upload_id)
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'NoSuchUpload':
+                log.warning('can not abort unfinished upload to s3://%s/%s: '
+                            '%s', bucket, key, e)
+
+    def _abort_stale_uploads(self):
+        # uploads are not resumed if the file changed (new fingerprint)
+        state_dir = self._config.state_dir
+        if not os.path.isdir(state_dir):
+            return
+        now = time.time()
+        for name in os.listdir(state_dir):
+            state_file = os.path.join(state_dir, name)
+            try:
+                if not name.endswith('.json') or \
+                        now - os.path.getmtime(state_file) < UPLOAD_STATE_TTL:
+                    continue
+                state = read_json_cache(state_file)
+                os.unlink(state_file)
+            except OSError:
+                continue  # removed by another process
+            if state.get('UploadId'):
+                log.debug('aborting stale upload to s3://%s/%s',
+                          state['Bucket'], state['Key'])
+                self._abort_upload(state['Bucket'], state['Key'],
+                                   state['UploadId'])
+
+    def _list_parts(self, bucket, key, upload_id):
+        parts = {}
+        request = {'Bucket': bucket, 'Key': key, 'UploadId': upload_id}
+        while True:
+            response = self._client.list_parts(**request)
+            for part in response.get('Parts', []):
+                parts[part['PartNumber']] = part['ETag']
+            if not response.get('IsTruncated'):
+                return parts
+            request['PartNumberMarker'] = response['NextPartNumberMarker']
+
+    def _upload_part(self, fileobj, file_lock, bucket, key, upload_id,
+                     part_number, part_size, callback):
+        with file_lock:
+            fileobj.seek((part_number - 1) * part_size)
+            data = fileobj.read(part_size)
+        response = self._client.upload_part(
+            Bucket=bucket, Key=key, UploadId=upload_id,
+            PartNumber=part_number, Body=data)
+        if callback:
+            callback(len(data))
+        return response['ETag']
+
+    def _multipart_upload(self, fileobj, bucket, key, size, callback):
+        part_size = max(self._config.multipart_chunksize,
+                        -(-size // MAX_PARTS))
+        num_parts = -(-size // part_size)
+        state_file = self._get_state_file(fileobj, bucket, key, size)
+        state = {}
+        if state_file:
+            self._abort_stale_uploads()
+            state = read_json_cache(state_file)
+
+        parts = {}
+        upload_id = None
+        if state.get('UploadId') and state.get('PartSize') != part_size:
+            # the chunksize was changed, the parts can not be reused
+            self._abort_upload(bucket, key, state['UploadId'])
+        elif state.get('UploadId'):
+            try:
+                parts = self._list_parts(bucket, key, state['UploadId'])
+                upload_id = state['UploadId']
+                log.info('resuming upload to s3://%s/%s (%d of %d parts '
+                         'done)', bucket, key, len(parts), num_parts)
+            except ClientError as e:
+                log.debug('can not resume upload: %s', e)
+                parts = {}
+        if not upload_id:
+            upload_id = self._client.create_multipart_upload(
+                Bucket=bucket, Key=key)['UploadId']
+            if state_file:
+                write_json_cache(state_file, {
+                    'Bucket': bucket, 'Key': key, 'UploadId': upload_id,
+                    'PartSize': part_size})
+        if callback and parts:
+            callback(sum([min(part_size, size - (n - 1) * part_size)
+                          for n in parts]))
+
+        executor = self._get_executor()
+        file_lock = threading.Lock()
+        futures = {}
+        for part_number in range(1, num_parts + 1):
+            if part_number not in parts:
+                future = executor.submit(
+                    self._upload_part, fileobj, file_lock, bucket, key,
+                    upload_id, part_number, part_size, callback)
+                futures[future] = part_number
+        try:
+            for future in as_completed(futures):
+                parts[futures[future]] = future.result()
+        except Exception:  # this includes GracefulExit
+            for future in futures:
+                future.cancel()
+            if not state_file:
+                # can not be resumed so we do not leave the parts behind
+                self._client.abort_multipart_upload(
+                    Bucket=bucket, Key=key, UploadId=upload_id)
+            raise
+
+        response = self._client.complete_multipart_upload(
+            Bucket=bucket, Key=key, UploadId=upload_id,
+            MultipartUpload={'Parts': [
+                {'ETag': parts[n], 'PartNumber': n} for n in sorted(parts)]})
+        if state_file and os.path.isfile(state_file):
+            os.unlink(state_file)
+        return response
+
+
 ### keys
 def upload_file_to_s3(awsclient, bucket, key, filename):
     """Upload a file to AWS S3 bucket.
@@ -77,18 +332,104 @@ def upload_file_to_s3(awsclient, bucket, key, filename):
     :param bucket:
     :param key:
     :param filename:
-    :return:
+    :return: tuple (etag, version_id)
     """
-    client_s3 = awsclient.get_client('s3')
-    transfer = S3Transfer(client_s3)
-    # Upload /tmp/myfile to s3://bucket/key and print upload progress.
-    transfer.upload_file(filename, bucket, key)
-    response = client_s3.head_object(Bucket=bucket, Key=key)
+    response = awsclient.get_uploader().upload(filename, bucket, key)
     etag = response.get('ETag')
     version_id = response.get('VersionId', None)
     return etag, version_id
 
 
+def get_object_info(awsclient, bucket, key):
+    """Retrieve ETag and VersionId of an object.
+
+    :param awsclient:
+    :param bucket:
+    :param key:
+    :return: tuple (etag, version_id) or None if the object does not exist
+    """
+    client_s3 = awsclient.get_client('s3')
+    try:
+        response = client_s3.head_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        # without s3:ListBucket permission S3 answers 403 for missing keys
+        if e.response['Error']['Code'] in ['403', '404', 'NoSuchKey',
+                                           'AccessDenied', 'Forbidden']:
+            return None
+        raise
+    return response.get('ETag'), response.get('VersionId', None)
+
+
+### artifact index
+_artifact_index_lock = threading.Lock()
+
+
+@contextmanager
+def _lock_artifact_index(index_file):
+    """Serialize the read-modify-write of the index between threads
+    (deploy-all) and processes (lock file, not available on windows)."""
+    with _artifact_index_lock:
+        if fcntl is None:
+            yield
+            return
+        folder = os.path.dirname(index_file) or '.'
+        try:
+            os.makedirs(folder)
+        except OSError:
+            if not os.path.isdir(folder):
+                raise
+        with open(index_file + '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _is_fresh(entry, now):
+    return now - entry.get('Timestamp', 0) < ARTIFACT_INDEX_TTL
+
+
+def get_indexed_artifact(bucket, key, index_file=ARTIFACT_INDEX_FILE):
+    """Lookup a content-addressed artifact in the local index.
+
+    :param bucket:
+    :param key:
+    :param index_file:
+    :return: tuple (etag, version_id) or None if the key is not indexed or
+        the entry is older than ARTIFACT_INDEX_TTL
+    """
+    entry = read_json_cache(index_file).get(bucket, {}).get(key)
+    if entry and _is_fresh(entry, time.time()):
+        return entry['ETag'], entry['VersionId']
+
+
+def add_indexed_artifact(bucket, key, etag, version_id,
+                         index_file=ARTIFACT_INDEX_FILE):
+    """Record a content-addressed artifact in the local index."""
+    now = time.time()
+    with _lock_artifact_index(index_file):
+        index = read_json_cache(index_file)
+        # drop the expired entries so the index does not grow forever
+        for bucket_name in list(index):
+            index[bucket_name] = dict(
+                (k, e) for k, e in index[bucket_name].items()
+                if _is_fresh(e, now))
+        index.setdefault(bucket, {})[key] = {
+            'ETag': etag, 'VersionId': version_id, 'Timestamp': now}
+        write_json_cache(index_file, index)
+
+
+def remove_indexed_artifacts(bucket, keys, index_file=ARTIFACT_INDEX_FILE):
+    """Remove artifacts from the local index (e.g. after deleting them)."""
+    with _lock_artifact_index(index_file):
+        index = read_json_cache(index_file)
+        if bucket in index:
+            for key in keys:
+                index[bucket].pop(key, None)
+            write_json_cache(index_file, index)
+
+
 def ls(awsclient, bucket, prefix=None):
     """List bucket contents
 
@@ -97,12 +438,221 @@ def ls(awsclient, bucket, prefix=None):
     :param prefix:
     :return:
     """
-    # this works until 1000 keys!
     params = {'Bucket': bucket}
     if prefix:
         params['Prefix'] = prefix
     client_s3 = awsclient.get_client('s3')
-    objects = client_s3.list_objects_v2(**params)
-    if objects['KeyCount'] > 0:
-        keys = [k['Key'] for k in objects['Contents']]
+    keys = [k['Key'] for k in
+            iter_items(client_s3, 'list_objects_v2', 'Contents', **params)]
+    if keys:
         return keys
+
+
+### cleanup
+class _DeleteProgress(object):
+    """Report the number of deleted objects and the throughput."""
+    def __init__(self, interval=DELETE_REPORT_INTERVAL):
+        self._interval = interval
+        self._lock = threading.Lock()
+        self._start = time.time()
+        self._last_report = self._start
+        self.deleted = 0
+        self.errors = 0
+
+    def __call__(self, deleted, errors):
+        with self._lock:
+            self.deleted += deleted
+            self.errors += errors
+            now = time.time()
+            if now - self._last_report >= self._interval:
+                self._last_report = now
+                self.report()
+
+    def report(self):
+        elapsed = max(time.time() - self._start, 0.001)
+        log.info('deleted %d objects (%.0f objects/s), %d errors',
+                 self.deleted, self.deleted / elapsed, self.errors)
+
+
+def iter_object_versions(awsclient, bucket, prefix=None):
+    """Stream all object versions and delete markers of a bucket.
+
+    The versions are ordered by key, the versions of a key newest first.
+
+    :param awsclient:
+    :param bucket:
+    :param prefix:
+    :return: generator of {'Key', 'VersionId', 'LastModified', 'IsLatest',
+        'IsDeleteMarker'}
+    """
+    params = {'Bucket': bucket}
+    if prefix:
+        params['Prefix'] = prefix
+    client_s3 = awsclient.get_client('s3')
+    for page in iter_pages(client_s3, 'list_object_versions', **params):
+        # merge versions and delete markers of the page
+        versions = [dict(v, IsDeleteMarker=False)
+                    for v in page.get('Versions', [])] + \
+                   [dict(m, IsDeleteMarker=True)
+                    for m in page.get('DeleteMarkers', [])]
+        versions.sort(key=lambda v: (v['Key'], -_timestamp(v)))
+        for version in versions:
+            yield version
+
+
+def _timestamp(version):
+    # LastModified is a datetime
+    return calendar.timegm(version['LastModified'].utctimetuple())
+
+
+def _delete_batch(client_s3, bucket, batch):
+    response = client_s3.delete_objects(
+        Bucket=bucket,
+        Delete={'Objects': [{'Key': v['Key'], 'VersionId': v['VersionId']}
+                            for v in batch],
+                'Quiet': True})
+    for error in response.get('Errors', []):
+        log.debug('could not delete s3://%s/%s (%s): %s', bucket,
+                  error.get('Key'), error.get('VersionId'),
+                  error.get('Message'))
+    return len(batch) - len(response.get('Errors', [])), \
+        len(response.get('Errors', []))
+
+
+def delete_object_versions(awsclient, bucket, versions, workers=4,
+                           batch_size=DELETE_BATCH_SIZE, progress=None):
+    """Delete object versions in batches using a pool of workers.
+
+    The versions are consumed while the batches are deleted so the
+    versions can be streamed from iter_object_versions.
+
+    :param awsclient:
+    :param bucket:
+    :param versions: iterable of {'Key', 'VersionId'}
+    :param workers: number of concurrent delete_objects calls
+    :param batch_size: max. 1000 (S3 limit)
+    :param progress: function(deleted, errors), defaults to _DeleteProgress
+    :return: tuple (deleted, errors)
+    """
+    client_s3 = awsclient.get_client('s3')
+    if progress is None:
+        progress = _DeleteProgress()
+    deleted, errors = 0, 0
+    pending = set()
+
+    def _collect(done):
+        for future in done:
+            pending.discard(future)
+            result = future.result()
+            progress(*result)
+            yield result
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        try:
+            batch = []
+            for version in versions:
+                batch.append(version)
+                if len(batch) < batch_size:
+                    continue
+                if len(pending) >= 2 * workers:
+                    # do not read ahead too far
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for d, e in _collect(done):
+                        deleted, errors = deleted + d, errors + e
+                pending.add(executor.submit(_delete_batch, client_s3, bucket,
+                                            batch))
+                batch = []
+            if batch:
+                pending.add(executor.submit(_delete_batch, client_s3, bucket,
+                                            batch))
+            for d, e in _collect(list(as_completed(list(pending)))):
+                deleted, errors = deleted + d, errors + e
+        except Exception:  # this includes GracefulExit
+            for future in pending:
+                future.cancel()
+            raise
+    return deleted, errors
+
+
+def _retention_group(key):
+    """Artifacts of a group share the retention (keep the last N).
+
+    ramuda: bundles of a function 'ramuda/<region>/<lambda>/<hash>.zip'
+    kumo: versions of a template 'kumo/<region>/<stack>-cloudformation.json'
+    """
+    parts = key.split('/')
+    if parts[0] == 'ramuda' and len(parts) == 4:
+        return '/'.join(parts[:3]) + '/'
+    return key
+
+
+def select_expired_versions(versions, keep):
+    """Select the versions beyond the last `keep` of each retention group.
+
+    Delete markers are expired if no version of their key is kept.
+
+    :param versions: versions ordered by key (see iter_object_versions)
+    :param keep: number of versions to keep per retention group
+    :return: generator of expired versions
+    """
+    def _expired(group):
+        objects = sorted([v for v in group if not v['IsDeleteMarker']],
+                         key=_timestamp, reverse=True)
+        kept_keys = set([v['Key'] for v in objects[:keep]])
+        for version in objects[keep:]:
+            yield version
+        for version in group:
+            if version['IsDeleteMarker'] and version['Key'] not in kept_keys:
+                yield version
+
+    group, group_name = [], None
+    for version in versions:
+        name = _retention_group(version['Key'])
+        if name != group_name and group:
+            for expired in _expired(group):
+                yield expired
+            group = []
+        group_name = name
+        group.append(version)
+    for expired in _expired(group):
+        yield expired
+
+
+def cleanup_artifacts(awsclient, bucket, keep=10, workers=4, dry_run=False,
+                      prefixes=ARTIFACT_PREFIXES):
+    """Delete all but the last `keep` ramuda bundles of every function and
+    versions of every kumo template.
+
+    :param awsclient:
+    :param bucket: artifact bucket
+    :param keep: number of bundles / versions to keep
+    :param workers: number of concurrent delete_objects calls
+    :param dry_run: only log what would be deleted
+    :param prefixes: artifact prefixes
+    :return: tuple (deleted, errors)
+    """
+    deleted, errors = 0, 0
+    for prefix in prefixes:
+        expired = select_expired_versions(
+            iter_object_versions(awsclient, bucket, prefix), keep)
+        if dry_run:
+            for version in expired:
+                log.info('would delete s3://%s/%s (%s)', bucket,
+                         version['Key'], version['VersionId'])
+                deleted += 1
+            continue
+        removed_keys = set()
+
+        def _track(versions):
+            for version in versions:
+                removed_keys.add(version['Key'])
+                yield version
+
+        progress = _DeleteProgress()
+        d, e = delete_object_versions(awsclient, bucket, _track(expired),
+                                      workers=workers, progress=progress)
+        progress.report()
+        deleted, errors = deleted + d, errors + e
+        # keys might still have other versions, the index is just a cache
+        remove_indexed_artifacts(bucket, removed_keys)
+    return deleted, errors
@@ -5,10 +5,28 @@ A refactoring might break team-code!!
 """
 from __future__ import unicode_literals, print_function
 from distutils.version import StrictVersion
+import os
 import re
+import threading
+import time
+import weakref
 
 import maya
 
+from .gcdt_pagination import iter_items
+from .utils import read_json_cache, write_json_cache
+
+
+# in-process cache for stack outputs per run (awsclient):
+# awsclient -> {(region, stack_name): outputs}
+_stack_outputs_cache = weakref.WeakKeyDictionary()
+_cache_lock = threading.Lock()
+
+# the on-disk cache is shared between gcdt processes (e.g. CI jobs). It is
+# only used if GCDT_STACK_OUTPUTS_CACHE_TTL (seconds) is set.
+STACK_OUTPUTS_CACHE_FILE = os.path.join(
+    os.path.expanduser('~'), '.gcdt', 'stack_outputs.json')
+
 
 def parse_ts(ts):
     """
@@ -31,24 +49,85 @@ def get_outputs_for_stack(awsclient, stack_name):
     Note: gcdt.servicediscovery get_outputs_for_stack((awsclient, stack_name)
     is used in many cloudformation.py templates!
 
+    The outputs are cached (see invalidate_outputs_for_stack).
+
     :param awsclient:
     :param stack_name:
     :return: dictionary containing the stack outputs
     """
     client_cf = awsclient.get_client('cloudformation')
+    key = (client_cf.meta.region_name, stack_name)
+    with _cache_lock:
+        cache = _stack_outputs_cache.setdefault(awsclient, {})
+        if key in cache:
+            return _copy(cache[key])
+    ttl = _get_cache_ttl()
+    if ttl:
+        disk_key = _get_disk_cache_key(awsclient, *key)
+        entry = read_json_cache(STACK_OUTPUTS_CACHE_FILE).get(disk_key)
+        if entry and entry['timestamp'] + ttl > time.time():
+            with _cache_lock:
+                cache[key] = entry['outputs']
+            return _copy(entry['outputs'])
+
     response = client_cf.describe_stacks(StackName=stack_name)
+    result = None
     if response['Stacks'] and 'Outputs' in response['Stacks'][0]:
         result = {}
         for output in response['Stacks'][0]['Outputs']:
             result[output['OutputKey']] = output['OutputValue']
-        return result
+    with _cache_lock:
+        cache[key] = result
+    if ttl:
+        disk_cache = read_json_cache(STACK_OUTPUTS_CACHE_FILE)
+        disk_cache[disk_key] = {'timestamp': time.time(), 'outputs': result}
+        write_json_cache(STACK_OUTPUTS_CACHE_FILE, disk_cache)
+    return _copy(result)
+
+
+def invalidate_outputs_for_stack(awsclient, stack_name):
+    """Remove the cached outputs of a stack (e.g. after a stack update).
+
+    :param awsclient:
+    :param stack_name:
+    """
+    client_cf = awsclient.get_client('cloudformation')
+    key = (client_cf.meta.region_name, stack_name)
+    with _cache_lock:
+        _stack_outputs_cache.get(awsclient, {}).pop(key, None)
+    if os.path.isfile(STACK_OUTPUTS_CACHE_FILE):
+        disk_key = _get_disk_cache_key(awsclient, *key)
+        disk_cache = read_json_cache(STACK_OUTPUTS_CACHE_FILE)
+        if disk_cache.pop(disk_key, None) is not None:
+            write_json_cache(STACK_OUTPUTS_CACHE_FILE, disk_cache)
+
+
+def _copy(outputs):
+    # callers (cloudformation templates) might modify the outputs
+    if outputs is not None:
+        return dict(outputs)
+
+
+def _get_disk_cache_key(awsclient, region, stack_name):
+    # stack names are only unique per account and region. The on-disk cache
+    # is shared by processes using different credentials (profiles, ENV) so
+    # the account id is part of the key.
+    return '%s:%s:%s' % (awsclient.get_account_id(), region, stack_name)
+
+
+def _get_cache_ttl():
+    try:
+        return int(os.getenv('GCDT_STACK_OUTPUTS_CACHE_TTL', 0))
+    except ValueError:
+        return 0
 
 
 def get_ssl_certificate(awsclient, domain):
     client_iam = awsclient.get_client('iam')
-    response = client_iam.list_server_certificates()
+    certs = iter_items(client_iam, 'list_server_certificates',
+                       'ServerCertificateMetadataList')
     arn = ""
-    for cert in response["ServerCertificateMetadataList"]:
+    for cert in certs:
         if domain in cert["ServerCertificateName"]:
             print(cert['Expiration'])
             #print(datetime.now(UTC()))
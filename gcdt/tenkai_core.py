@@ -5,6 +5,7 @@ import time
 
 from clint.textui import colored
 from clint.packages.colorama import Fore
+from concurrent.futures import ThreadPoolExecutor
 
 from .s3 import upload_file_to_s3
 from .gcdt_logging import getLogger
@@ -14,6 +15,11 @@ from .cloudwatch_logs import get_log_events, datetime_to_timestamp, \
 
 log = getLogger(__name__)
 
+# max. number of instances per batch_get_deployment_instances call
+INSTANCE_BATCH_SIZE = 25
+# max. number of concurrent batch_get_deployment_instances calls
+INSTANCE_WORKERS = 8
+
 
 def deploy(awsclient, applicationName, deploymentGroupName,
            deploymentConfigName, bucket, bundlefile):
@@ -141,40 +147,69 @@ def _list_deployment_instances(awsclient, deployment_id):
     return instances
 
 
-def _get_deployment_instance_summary(awsclient, deployment_id, instance_id):
-    """instance summary.
+def _get_instance_summaries_batch(client_codedeploy, deployment_id,
+                                  instance_ids):
+    response = client_codedeploy.batch_get_deployment_instances(
+        deploymentId=deployment_id,
+        instanceIds=instance_ids
+    )
+    if response.get('errorMessage'):
+        log.debug('batch_get_deployment_instances: %s',
+                  response['errorMessage'])
+    return response['instancesSummary']
+
+
+def _get_instance_id(instance_summary):
+    # the summary contains the instance ARN
+    # (arn:aws:ec2:<region>:<account>:instance/<instance id>)
+    return instance_summary['instanceId'].split('/')[-1]
+
+
+def get_deployment_instance_summaries(awsclient, deployment_id):
+    """Get the instance summaries of a deployment. The summaries are fetched
+    in batches (concurrently).
 
     :param awsclient:
     :param deployment_id:
-    :param instance_id:
-    return: status, last_event
+    :return: list of instance summaries (in the order of the instance list)
     """
     client_codedeploy = awsclient.get_client('codedeploy')
-    request = {
-        'deploymentId': deployment_id,
-        'instanceId': instance_id
-    }
-    response = client_codedeploy.get_deployment_instance(**request)
-    return response['instanceSummary']['status'], \
-           response['instanceSummary']['lifecycleEvents'][-1]['lifecycleEventName']
+    instance_ids = _list_deployment_instances(awsclient, deployment_id)
+    if not instance_ids:
+        return []
+    batches = [instance_ids[i:i + INSTANCE_BATCH_SIZE]
+               for i in range(0, len(instance_ids), INSTANCE_BATCH_SIZE)]
+    summaries = {}
+    with ThreadPoolExecutor(
+            max_workers=min(INSTANCE_WORKERS, len(batches))) as executor:
+        for batch_summaries in executor.map(
+                lambda batch: _get_instance_summaries_batch(
+                    client_codedeploy, deployment_id, batch), batches):
+            for summary in batch_summaries:
+                summaries[_get_instance_id(summary)] = summary
+    return [summaries[instance_id] for instance_id in instance_ids
+            if instance_id in summaries]
+
+
+def _get_deployment_instance_summary(instance_summary):
+    """instance summary.
+
+    :param instance_summary:
+    return: status, last_event
+    """
+    events = instance_summary.get('lifecycleEvents') or [{}]
+    return instance_summary['status'], \
+           events[-1].get('lifecycleEventName', '')
 
 
-def _get_deployment_instance_diagnostics(awsclient, deployment_id, instance_id):
+def _get_deployment_instance_diagnostics(instance_summary):
     """Gets you the diagnostics details for the first 'Failed' event.
 
-    :param awsclient:
-    :param deployment_id:
-    :param instance_id:
+    :param instance_summary:
     return: None or (error_code, script_name, message, log_tail)
     """
-    client_codedeploy = awsclient.get_client('codedeploy')
-    request = {
-        'deploymentId': deployment_id,
-        'instanceId': instance_id
-    }
-    response = client_codedeploy.get_deployment_instance(**request)
     # find first 'Failed' event
-    for i, event in enumerate(response['instanceSummary']['lifecycleEvents']):
+    for i, event in enumerate(instance_summary.get('lifecycleEvents', [])):
         if event['status'] == 'Failed':
             return event['diagnostics']['errorCode'], \
                    event['diagnostics']['scriptName'], \
@@ -183,31 +218,45 @@ def _get_deployment_instance_diagnostics(awsclient, deployment_id, instance_id):
     return None
 
 
-def output_deployment_summary(awsclient, deployment_id):
+def output_deployment_summary(awsclient, deployment_id,
+                              instance_summaries=None):
     """summary
 
     :param awsclient:
     :param deployment_id:
+    :param instance_summaries: see get_deployment_instance_summaries
+        (fetched if not provided)
     """
+    if instance_summaries is None:
+        instance_summaries = get_deployment_instance_summaries(
+            awsclient, deployment_id)
     log.info('\ndeployment summary:')
     log.info('%-22s %-12s %s', 'Instance ID', 'Status', 'Most recent event')
-    for instance_id in _list_deployment_instances(awsclient, deployment_id):
+    for instance_summary in instance_summaries:
         status, last_event = \
-            _get_deployment_instance_summary(awsclient, deployment_id, instance_id)
+            _get_deployment_instance_summary(instance_summary)
         log.info(Fore.MAGENTA + '%-22s' + Fore.RESET + ' %-12s %s',
-                 instance_id, status, last_event)
+                 _get_instance_id(instance_summary), status, last_event)
 
 
-def output_deployment_diagnostics(awsclient, deployment_id, log_group, start_time=None):
+def output_deployment_diagnostics(awsclient, deployment_id, log_group,
+                                  start_time=None, instance_summaries=None):
     """diagnostics
 
     :param awsclient:
     :param deployment_id:
+    :param log_group:
+    :param start_time:
+    :param instance_summaries: see get_deployment_instance_summaries
+        (fetched if not provided)
     """
+    if instance_summaries is None:
+        instance_summaries = get_deployment_instance_summaries(
+            awsclient, deployment_id)
     headline = False
-    for instance_id in _list_deployment_instances(awsclient, deployment_id):
-        diagnostics = _get_deployment_instance_diagnostics(
-            awsclient, deployment_id, instance_id)
+    for instance_summary in instance_summaries:
+        instance_id = _get_instance_id(instance_summary)
+        diagnostics = _get_deployment_instance_diagnostics(instance_summary)
         #if error_code != 'Success':
         if diagnostics is not None:
             error_code, script_name, message, log_tail = diagnostics
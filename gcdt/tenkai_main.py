@@ -7,13 +7,8 @@ from __future__ import unicode_literals, print_function
 import os
 import sys
 
-import maya
-
 from . import utils
 from .gcdt_defaults import DEFAULT_CONFIG
-from .tenkai_core import deploy, output_deployment_status, stop_deployment, \
-    output_deployment_summary, output_deployment_diagnostics
-from gcdt.s3 import prepare_artifacts_bucket
 from .gcdt_cmd_dispatcher import cmd
 from .utils import GracefulExit
 from .gcdt_logging import getLogger
@@ -25,11 +20,12 @@ log = getLogger(__name__)
 
 DOC = '''Usage:
         tenkai bundle [-v]
-        tenkai deploy [-v]
+        tenkai deploy [-v] [--metrics-file=<file>]
         tenkai version
 
 -h --help           show this
 -v --verbose        show debug messages
+--metrics-file=<file>   write the AWS API call metrics to a JSON file
 '''
 
 
@@ -41,6 +37,12 @@ def version_cmd():
 
 @cmd(spec=['deploy'])
 def deploy_cmd(**tooldata):
+    import maya
+    from .s3 import prepare_artifacts_bucket
+    from .tenkai_core import deploy, output_deployment_status, \
+        stop_deployment, output_deployment_summary, \
+        output_deployment_diagnostics, get_deployment_instance_summaries
+
     context = tooldata.get('context')
     config = tooldata.get('config')
     awsclient = context.get('_awsclient')
@@ -73,8 +75,12 @@ def deploy_cmd(**tooldata):
         )
 
         exit_code = output_deployment_status(awsclient, deployment)
-        output_deployment_summary(awsclient, deployment)
-        output_deployment_diagnostics(awsclient, deployment, log_group, start_time)
+        # the instance summaries are fetched once for summary and diagnostics
+        instance_summaries = get_deployment_instance_summaries(awsclient,
+                                                               deployment)
+        output_deployment_summary(awsclient, deployment, instance_summaries)
+        output_deployment_diagnostics(awsclient, deployment, log_group,
+                                      start_time, instance_summaries)
         if exit_code:
             return 1
 
@@ -1,7 +1,9 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals, print_function
 
+import hashlib
 import random
+import re
 import string
 import sys
 import getpass
@@ -10,13 +12,13 @@ import time
 from time import sleep
 import collections
 import json
+import tempfile
 
 import os
 from clint.textui import prompt, colored
 from tabulate import tabulate
 
-from . import __version__
-from .package_utils import get_package_versions
+from . import __version__, GcdtError
 from .gcdt_plugins import get_plugin_versions
 from .gcdt_logging import getLogger
 
@@ -97,6 +99,45 @@ def retries(max_tries, delay=1, backoff=2, exceptions=(Exception,), hook=None):
     return dec
 
 
+class WaitTimeoutError(GcdtError):
+    fmt = 'Waiting for {name} timed out after {max_wait} seconds'
+
+
+def wait_until(condition, max_wait=300, delay=1, max_delay=20, backoff=2,
+               name='condition'):
+    """Poll until condition() returns a truthy value.
+
+    The delay between polls grows exponentially (with jitter) up to
+    max_delay.
+
+    :param condition: function without arguments
+    :param max_wait: max. seconds to wait before WaitTimeoutError is raised
+    :param delay: initial delay in seconds
+    :param max_delay: max. delay between two polls in seconds
+    :param backoff: multiply delay by this factor after each poll
+    :param name: used in log and error messages
+    :return: result of condition()
+    """
+    start = time.time()
+    waited = 0
+    while True:
+        result = condition()
+        if result:
+            return result
+        # sleep is faked during placebo playback so we account for it, too
+        elapsed = max(time.time() - start, waited)
+        if elapsed >= max_wait:
+            raise WaitTimeoutError(name=name, max_wait=max_wait)
+        # equal jitter: at least half of the delay
+        mydelay = min(delay, max_delay)
+        mydelay = mydelay / 2.0 + random.uniform(0, mydelay / 2.0)
+        mydelay = min(mydelay, max_wait - elapsed)
+        log.debug('waiting for %s (%.1fs)', name, mydelay)
+        time.sleep(mydelay)
+        waited += mydelay
+        delay *= backoff
+
+
 def _get_user():
     return getpass.getuser()
 
@@ -165,19 +206,87 @@ def _execute_script(file_name):
         return 1
 
 
+# result of the last check for a newer gcdt version
+UPDATE_CHECK_FILE = os.path.join(
+    os.path.expanduser('~'), '.gcdt', 'update_check.json')
+UPDATE_CHECK_TTL = 24 * 3600  # seconds
+
+
 def check_gcdt_update():
     """Check whether a newer gcdt is available and output a warning.
 
+    The latest version is read from UPDATE_CHECK_FILE. If the file is older
+    than UPDATE_CHECK_TTL it is refreshed by a background process so the
+    command is never delayed by the package index. Set GCDT_NO_UPDATE_CHECK
+    to skip the check (e.g. on build agents without internet access).
     """
+    if os.getenv('GCDT_NO_UPDATE_CHECK'):
+        return
+    state = read_json_cache(UPDATE_CHECK_FILE)
+    latest_version = state.get('latest_version')
+    if latest_version and _is_newer_version(latest_version, __version__):
+        log.warn('Please consider an update to gcdt version: %s' %
+                 latest_version)
+    if state.get('timestamp', 0) + UPDATE_CHECK_TTL < time.time():
+        # record the attempt so we do not start another check before the
+        # TTL expired (even if the package index is unreachable)
+        state['timestamp'] = time.time()
+        try:
+            write_json_cache(UPDATE_CHECK_FILE, state)
+            _start_update_check()
+        except GracefulExit:
+            raise
+        except Exception as e:
+            log.debug('Can not check for newer gcdt versions: %s', e)
+
+
+def _parse_version(version):
+    # lightweight replacement of pkg_resources.parse_version (importing
+    # pkg_resources is slow): '0.1.436' -> ((0, 1, 436), True)
+    # pre- and dev-releases sort before the release
+    match = re.match(r'v?(\d+(?:\.\d+)*)(.*)$', version.strip())
+    if match is None:
+        return None
+    numbers = [int(n) for n in match.group(1).split('.')]
+    while numbers and numbers[-1] == 0:
+        numbers.pop()  # '1.0' == '1'
+    return tuple(numbers), not match.group(2)
+
+
+def _is_newer_version(version_a, version_b):
+    parsed_a, parsed_b = _parse_version(version_a), _parse_version(version_b)
+    if parsed_a is None or parsed_b is None:
+        return False
+    return parsed_a > parsed_b
+
+
+def _start_update_check():
+    # the process keeps running after the gcdt command finished
+    with open(os.devnull, 'w') as devnull:
+        subprocess.Popen(
+            [sys.executable, '-c',
+             'from gcdt.utils import update_gcdt_version_info; '
+             'update_gcdt_version_info()'],
+            stdin=devnull, stdout=devnull, stderr=devnull, close_fds=True)
+
+
+def update_gcdt_version_info():
+    """Look up the latest gcdt version on PyPi and write it to
+    UPDATE_CHECK_FILE (runs in the background process).
+    """
+    from .package_utils import get_package_versions
+    state = read_json_cache(UPDATE_CHECK_FILE)
     try:
         inst_version, latest_version = get_package_versions('gcdt')
-        if inst_version < latest_version:
-            log.warn('Please consider an update to gcdt version: %s' %
-                                 latest_version)
     except GracefulExit:
         raise
     except Exception:
         log.warn('PyPi appears to be down - we currently can\'t check for newer gcdt versions')
+        return
+    if latest_version:
+        state['latest_version'] = str(latest_version)
+    state['timestamp'] = time.time()
+    write_json_cache(UPDATE_CHECK_FILE, state)
 
 
 # adapted from:
@@ -211,24 +320,62 @@ def dict_merge(a, b, path=None):
     return dict_selective_merge(a, b, b.keys(), path)
 
 
-# TODO test this properly!
-# TODO use logging
-# TODO move to gcdt-checks!
-def are_credentials_still_valid(awsclient):
+# "valid until" of the credentials per profile and access key
+CREDENTIALS_CHECK_FILE = os.path.join(
+    os.path.expanduser('~'), '.gcdt', 'credentials_check.json')
+# a successful check is trusted for (seconds). Keep this short, access keys
+# do not expire but can be deactivated at any time.
+CREDENTIALS_CHECK_TTL = 300
+
+
+def are_credentials_still_valid(awsclient, cache_file=None):
     """Check whether the credentials have expired.
 
+    The credentials are validated using sts.get_caller_identity which does
+    not require any permissions. A successful check is cached for
+    CREDENTIALS_CHECK_TTL per profile and access key so consecutive commands
+    do not need to call AWS. Temporary credentials get a new access key when
+    they are refreshed so they are checked again.
+
     :param awsclient:
+    :param cache_file: json file for the cached checks (default is
+        CREDENTIALS_CHECK_FILE)
     :return: exit_code
     """
-    client = awsclient.get_client('lambda')
+    if cache_file is None:
+        cache_file = CREDENTIALS_CHECK_FILE
+    now = time.time()
+    key = None
+    credentials = awsclient.get_credentials()
+    if credentials is not None:
+        # note: accessing the access_key refreshes expired credentials
+        # if possible (e.g. assumed roles)
+        access_key = credentials.access_key
+        key = '%s:%s' % (
+            awsclient.get_profile() or 'default',
+            hashlib.sha1(access_key.encode('utf-8')).hexdigest())
+        entry = read_json_cache(cache_file).get(key)
+        if entry and now < entry['valid_until'] <= \
+                now + CREDENTIALS_CHECK_TTL:
+            return 0
+
+    client = awsclient.get_client('sts')
     try:
-        client.list_functions()
+        client.get_caller_identity()
     except GracefulExit:
         raise
     except Exception as e:
         log.debug(e)
         log.error(e)
         return 1
+
+    if key:
+        cache = read_json_cache(cache_file)
+        # drop outdated entries
+        cache = dict([(k, v) for k, v in cache.items()
+                      if v['valid_until'] > now])
+        cache[key] = {'valid_until': now + CREDENTIALS_CHECK_TTL}
+        write_json_cache(cache_file, cache)
     return 0
 
 
@@ -308,6 +455,44 @@ def fix_old_kumo_config(config, silent=False):
     return config
 
 
+def read_json_cache(filename):
+    """Read a json cache file.
+
+    :param filename:
+    :return: dictionary (empty if the file does not exist or is corrupt)
+    """
+    try:
+        with open(filename) as jfile:
+            return json.load(jfile)
+    except (IOError, OSError, ValueError):
+        return {}
+
+
+def write_json_cache(filename, data):
+    """Write a json cache file.
+
+    The file is written to a temporary file first and then renamed so
+    concurrent readers never see a partially written file.
+
+    :param filename:
+    :param data: dictionary
+    """
+    folder = os.path.dirname(filename) or '.'
+    try:
+        os.makedirs(folder)
+    except OSError:
+        if not os.path.isdir(folder):
+            raise
+    fd, tmp_filename = tempfile.mkstemp(dir=folder, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as jfile:
+            json.dump(data, jfile)
+        os.rename(tmp_filename, filename)
+    except Exception:
+        os.unlink(tmp_filename)
+        raise
+
+
 def random_string(length=6):
     """Create a random 6 character string.
 
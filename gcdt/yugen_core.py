@@ -1,19 +1,38 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals, print_function
 import codecs
+import hashlib
 import json
 import os
+import threading
 import uuid
+import weakref
 
 from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
 from pybars import Compiler
 from tabulate import tabulate
 
 from gcdt.utils import GracefulExit, json2table
+from .gcdt_pagination import iter_items
+from .gcdt_inventory import list_resources, find_resources, put_resource, \
+    remove_resource
 
 SWAGGER_FILE = 'swagger.yaml'
 INVOKE_FUNCTION_ACTION = 'lambda:InvokeFunction'
 AMAZON_API_PRINCIPAL = 'apigateway.amazonaws.com'
+# max. number of concurrent lambda lookups
+LOOKUP_WORKERS = 10
+# stage variable holding the hash of the deployed swagger and stage
+SWAGGER_HASH_VARIABLE = 'gcdtSwaggerHash'
+
+# per run (awsclient) cache of the API, lambda and domain lookups:
+# awsclient -> {(kind, name): value}
+_lookup_cache = weakref.WeakKeyDictionary()
+_lookup_lock = threading.Lock()
+
+# compiled swagger templates: sha1 of the template -> template
+_template_cache = {}
 
 
 # WIP
@@ -55,16 +74,12 @@ def export_to_swagger(awsclient, api_name, stage_name, api_description,
 
 def list_apis(awsclient):
     """List APIs in account."""
-    client_api = awsclient.get_client('apigateway')
-
-    apis = client_api.get_rest_apis()['items']
-
-    for api in apis:
+    for api in list_resources(awsclient, 'rest_api'):
         print(json2table(api))
 
 
 def deploy_api(awsclient, api_name, api_description, stage_name, api_key,
-               lambdas):
+               lambdas, stage_settings=None):
     """Deploy API Gateway to AWS cloud.
     
     :param awsclient:
@@ -73,36 +88,47 @@ def deploy_api(awsclient, api_name, api_description, stage_name, api_key,
     :param stage_name: 
     :param api_key: 
     :param lambdas: 
+    :param stage_settings: further settings of the stage (e.g. custom
+        domain), a change results in a new deployment
     """
+    stage_settings = dict(stage_settings or {}, apiKey=api_key)
     if not _api_exists(awsclient, api_name):
         if os.path.isfile(SWAGGER_FILE):
             # this does an import from swagger file
             # the next step does not make sense since there is a check in
             # _import_from_swagger for if api is existent!
             # _create_api(api_name=api_name, api_description=api_description)
-            _import_from_swagger(awsclient, api_name, api_description,
-                                 stage_name, lambdas)
+            swagger_hash = _import_from_swagger(
+                awsclient, api_name, api_description, stage_name, lambdas,
+                stage_settings)
         else:
             print('No swagger file (%s) found' % SWAGGER_FILE)
+            swagger_hash = None
 
         api = _api_by_name(awsclient, api_name)
         if api is not None:
             _ensure_lambdas_permissions(awsclient, lambdas, api)
-            _create_deployment(awsclient, api_name, stage_name)
+            _create_deployment(awsclient, api_name, stage_name, swagger_hash)
             _wire_api_key(awsclient, api_name, api_key, stage_name)
         else:
             print('API name unknown')
     else:
+        changed, swagger_hash = True, None
         if os.path.isfile(SWAGGER_FILE):
-            _update_from_swagger(awsclient, api_name, api_description,
-                                 stage_name, lambdas)
+            changed, swagger_hash = _update_from_swagger(
+                awsclient, api_name, api_description, stage_name, lambdas,
+                stage_settings)
         else:
             _update_api()
 
         api = _api_by_name(awsclient, api_name)
         if api is not None:
             _ensure_lambdas_permissions(awsclient, lambdas, api)
-            _create_deployment(awsclient, api_name, stage_name)
+            if changed:
+                _create_deployment(awsclient, api_name, stage_name,
+                                   swagger_hash)
+            else:
+                print('API unchanged, skipping deployment')
         else:
             print('API name unknown')
 
@@ -123,6 +149,8 @@ def delete_api(awsclient, api_name):
         response = client_api.delete_rest_api(
             restApiId=api['id']
         )
+        remove_resource(awsclient, 'rest_api', api['id'])
+        _invalidate_lookup(awsclient, ('api', api_name))
 
         print(json2table(response))
     else:
@@ -146,6 +174,8 @@ def create_api_key(awsclient, api_name, api_key_name):
     )
 
     #print(json2table(response))
+    response.pop('ResponseMetadata', None)
+    put_resource(awsclient, 'api_key', response)
 
     print('Add this api key \'%s\' to your api.conf' % response['id'])
     return response['id']
@@ -162,6 +192,7 @@ def delete_api_key(awsclient, api_key):
     response = client_api.delete_api_key(
         apiKey=api_key
     )
+    remove_resource(awsclient, 'api_key', api_key)
 
     print(json2table(response))
 
@@ -169,12 +200,9 @@ def delete_api_key(awsclient, api_key):
 def list_api_keys(awsclient):
     """Print the defined API keys.
     """
-    client_api = awsclient.get_client('apigateway')
     print('listing api keys')
 
-    response = client_api.get_api_keys()['items']
-
-    for item in response:
+    for item in list_resources(awsclient, 'api_key'):
         print(json2table(item))
 
 
@@ -241,7 +269,6 @@ def get_lambdas(awsclient, config, add_arn=False):
     :return: list containing lambda entries
     """
     if 'lambda' in config:
-        client_lambda = awsclient.get_client('lambda')
         lambda_entries = config['lambda'].get('entries', [])
         lmbdas = []
         for lambda_entry in lambda_entries:
@@ -250,18 +277,22 @@ def get_lambdas(awsclient, config, add_arn=False):
                 'alias': lambda_entry.get('alias', None),
                 'swagger_ref': lambda_entry.get('swaggerRef', None)
             }
-            if add_arn:
-                response_lambda = client_lambda.get_function(
-                    FunctionName=lmbda['name'])
-                lmbda['arn'] = response_lambda['Configuration']['FunctionArn']
             lmbdas.append(lmbda)
+        if add_arn and lmbdas:
+            # resolve the ARNs concurrently
+            with ThreadPoolExecutor(
+                    max_workers=min(LOOKUP_WORKERS, len(lmbdas))) as executor:
+                arns = executor.map(
+                    lambda l: _get_lambda_arn(awsclient, l['name']), lmbdas)
+                for lmbda, arn in zip(lmbdas, arns):
+                    lmbda['arn'] = arn
         return lmbdas
     else:
         return []
 
 
 def _import_from_swagger(awsclient, api_name, api_description, stage_name,
-                         lambdas):
+                         lambdas, stage_settings=None):
     client_api = awsclient.get_client('apigateway')
 
     print('Import from swagger file')
@@ -283,13 +314,15 @@ def _import_from_swagger(awsclient, api_name, api_description, stage_name,
             failOnWarnings=True,
             body=swagger_body
         )
+        _cache_api(awsclient, api_name, response_swagger)
         print(json2table(response_swagger))
+        return _get_swagger_hash(swagger_body, stage_name, stage_settings)
     else:
         print('API already taken')
 
 
 def _update_from_swagger(awsclient, api_name, api_description, stage_name,
-                         lambdas):
+                         lambdas, stage_settings=None):
     client_api = awsclient.get_client('apigateway')
 
     print('update from swagger file')
@@ -307,6 +340,12 @@ def _update_from_swagger(awsclient, api_name, api_description, stage_name,
             lambdas)
         filled_swagger_file = _compile_template(SWAGGER_FILE,
                                                 template_variables)
+        swagger_hash = _get_swagger_hash(filled_swagger_file, stage_name,
+                                         stage_settings)
+        if swagger_hash == _get_deployed_swagger_hash(awsclient, api['id'],
+                                                      stage_name):
+            print('swagger file unchanged, skipping update')
+            return False, swagger_hash
 
         response_swagger = client_api.put_rest_api(
             restApiId=api['id'],
@@ -314,10 +353,43 @@ def _update_from_swagger(awsclient, api_name, api_description, stage_name,
             failOnWarnings=True,
             body=filled_swagger_file
         )
+        _cache_api(awsclient, api_name, response_swagger)
+        print(json2table(response_swagger))
+        return True, swagger_hash
     else:
         print('API name unknown')
+        return True, None
 
-    print(json2table(response_swagger))
+
+def _get_swagger_hash(swagger_body, stage_name, stage_settings=None):
+    """Content hash of the rendered swagger file and the stage config.
+
+    :param swagger_body:
+    :param stage_name:
+    :param stage_settings: dict of the stage settings managed by yugen
+        (api key, custom domain, base path)
+    :return: hex digest
+    """
+    sha = hashlib.sha256()
+    sha.update(swagger_body.encode('utf-8'))
+    sha.update(b'\n')
+    sha.update(stage_name.encode('utf-8'))
+    if stage_settings:
+        sha.update(b'\n')
+        sha.update(json.dumps(stage_settings, sort_keys=True).encode('utf-8'))
+    return sha.hexdigest()
+
+
+def _get_deployed_swagger_hash(awsclient, api_id, stage_name):
+    # the hash is stored as stage variable by _create_deployment
+    client_api = awsclient.get_client('apigateway')
+    try:
+        stage = client_api.get_stage(restApiId=api_id, stageName=stage_name)
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'NotFoundException':
+            return None
+        raise
+    return stage.get('variables', {}).get(SWAGGER_HASH_VARIABLE)
 
 
 def _create_api(awsclient, api_name, api_description):
@@ -329,6 +401,7 @@ def _create_api(awsclient, api_name, api_description):
         name=api_name,
         description=api_description
     )
+    _cache_api(awsclient, api_name, response)
 
     print(json2table(response))
 
@@ -361,19 +434,21 @@ def _update_api():
     print('updating api. not supported now')
 
 
-def _create_deployment(awsclient, api_name, stage_name):
+def _create_deployment(awsclient, api_name, stage_name, swagger_hash=None):
     client_api = awsclient.get_client('apigateway')
     print('create deployment')
 
     api = _api_by_name(awsclient, api_name)
 
     if api is not None:
-
-        response = client_api.create_deployment(
-            restApiId=api['id'],
-            stageName=stage_name,
-            description='TO BE FILLED'
-        )
+        request = {
+            'restApiId': api['id'],
+            'stageName': stage_name,
+            'description': 'TO BE FILLED'
+        }
+        if swagger_hash:
+            request['variables'] = {SWAGGER_HASH_VARIABLE: swagger_hash}
+        response = client_api.create_deployment(**request)
 
         print(json2table(response))
     else:
@@ -458,18 +533,21 @@ def _record_exists_and_correct(awsclient, hosted_zone_id,
                                target_route_53_record_name,
                                cloudfront_distribution):
     client_route53 = awsclient.get_client('route53')
-    response = client_route53.list_resource_record_sets(
-        HostedZoneId=hosted_zone_id
-    )
-    resource_records = response['ResourceRecordSets']
+    record_name = target_route_53_record_name + '.'
+    # the record sets are sorted by name so we start at the record name and
+    # stop after the record sets of that name
+    resource_records = iter_items(
+        client_route53, 'list_resource_record_sets', 'ResourceRecordSets',
+        HostedZoneId=hosted_zone_id, StartRecordName=record_name)
     record_exists = False
     record_correct = False
     for record in resource_records:
-        if record['Name'] == (target_route_53_record_name + '.'):
-            record_exists = True
-            for value in record['ResourceRecords']:
-                if value['Value'] == cloudfront_distribution:
-                    record_correct = True
+        if record['Name'] != record_name:
+            break
+        record_exists = True
+        for value in record.get('ResourceRecords', []):
+            if value['Value'] == cloudfront_distribution:
+                record_correct = True
     return record_exists, record_correct
 
 
@@ -482,6 +560,7 @@ def _create_new_custom_domain(awsclient, domain_name, ssl_cert):
         certificatePrivateKey=ssl_cert['private_key'],
         certificateChain=ssl_cert['chain']
     )
+    _set_lookup(awsclient, ('domain', domain_name), response)
     return response
 
 
@@ -525,65 +604,106 @@ def _template_variables_to_dict(client_api, api_name, api_description,
 
 
 def _ensure_lambdas_permissions(awsclient, lambdas, api):
-    client_lambda = awsclient.get_client('lambda')
-    for lmbda in lambdas:
-        _ensure_lambda_permissions(client_lambda, lmbda, api, )
+    """Grant API Gateway the permission to invoke the integrated lambdas.
 
+    The policies of all lambdas are fetched concurrently and only the missing
+    permissions are added (also concurrently). The result is printed as one
+    summary table.
 
-def _ensure_lambda_permissions(client_lambda, lmbda, api):
-    if not lmbda.get('arn'):
-        lambda_name = lmbda.get('name', '(no name provided)')
-        print('Lambda function {} could not be found'.format(lambda_name))
+    :param awsclient:
+    :param lambdas: list of lambda entries (see get_lambdas)
+    :param api: the API
+    """
+    client_lambda = awsclient.get_client('lambda')
+    grants = []
+    for lmbda in lambdas:
+        if not lmbda.get('arn'):
+            lambda_name = lmbda.get('name', '(no name provided)')
+            print('Lambda function {} could not be found'.format(lambda_name))
+            continue
+        key = (lmbda['arn'], lmbda.get('alias'))
+        if key not in [(g['arn'], g['alias']) for g in grants]:
+            lambda_region, lambda_account_id = \
+                _get_region_and_account_from_lambda_arn(lmbda['arn'])
+            grants.append({
+                'name': lmbda.get('name'),
+                'arn': lmbda['arn'],
+                'alias': lmbda.get('alias'),
+                'source_arn': _get_source_arn(lambda_region,
+                                              lambda_account_id, api['id'])
+            })
+    if not grants:
         return
 
-    lambda_arn = lmbda.get('arn')
-    lambda_alias = lmbda.get('alias')
-    lambda_name = lmbda.get('name')
-
-    lambda_region, lambda_account_id = \
-        _get_region_and_account_from_lambda_arn(lambda_arn)
-
-    source_arn = 'arn:aws:execute-api:{region}:{accountId}:{apiId}/*/*'.format(
-        region=lambda_region,
-        accountId=lambda_account_id,
-        apiId=api['id']
-    )
+    with ThreadPoolExecutor(
+            max_workers=min(LOOKUP_WORKERS, len(grants))) as executor:
+        indexes = list(executor.map(
+            lambda g: _get_invoke_permissions(client_lambda, g['arn'],
+                                              g['alias']), grants))
+        missing = [g for g, index in zip(grants, indexes)
+                   if (g['source_arn'], AMAZON_API_PRINCIPAL,
+                       INVOKE_FUNCTION_ACTION) not in index]
+        futures = dict([((g['arn'], g['alias']), executor.submit(
+            _add_invoke_permission, client_lambda, g)) for g in missing])
 
-    if _invoke_lambda_permission_exists(client_lambda, lambda_arn, source_arn):
-        print('API already has permission to invoke lambda {}'.format(
-            lambda_name))
-        return
-
-    print('Adding lambda permission for API Gateway for lambda {}'.format(
-        lambda_name))
-    response = client_lambda.add_permission(
-        FunctionName=lambda_name,
-        StatementId=str(uuid.uuid1()),
-        Action=INVOKE_FUNCTION_ACTION,
-        Principal=AMAZON_API_PRINCIPAL,
-        SourceArn=source_arn,
-        Qualifier=lambda_alias
+    table = []
+    error = None
+    for grant in grants:
+        future = futures.get((grant['arn'], grant['alias']))
+        if future is None:
+            status = 'exists'
+        elif future.exception() is not None:
+            error = error or future.exception()
+            status = 'failed: %s' % future.exception()
+        else:
+            status = 'added'
+        table.append([grant['name'], grant['alias'], status])
+    print(tabulate(table, headers=['lambda', 'alias', 'invoke permission'],
+                   tablefmt='fancy_grid'))
+    if error is not None:
+        raise error
+
+
+def _get_source_arn(region, account_id, api_id):
+    return 'arn:aws:execute-api:{region}:{accountId}:{apiId}/*/*'.format(
+        region=region,
+        accountId=account_id,
+        apiId=api_id
     )
 
-    print(json2table(json.loads(response['Statement'])))
 
+def _get_invoke_permissions(client_lambda, lambda_arn, lambda_alias):
+    """Index of the permissions granted in the policy of a lambda alias.
 
-def _invoke_lambda_permission_exists(client_lambda, lambda_arn, source_arn):
-    policy_resource_arn = lambda_arn + ':ACTIVE'
+    :param client_lambda:
+    :param lambda_arn:
+    :param lambda_alias:
+    :return: set of (source arn, principal, action) of the 'Allow' statements
+    """
+    policy_resource_arn = '%s:%s' % (lambda_arn, lambda_alias or 'ACTIVE')
     try:
         response = client_lambda.get_policy(FunctionName=policy_resource_arn)
     except ClientError:
-        return False
+        return set()
 
     permissions = json.loads(response['Policy'])['Statement']
-    return [
-        p for p in permissions
-        if p.get('Condition', {}).get('ArnLike', {}).get(
-            'AWS:SourceArn') == source_arn
-        and p.get('Action') == INVOKE_FUNCTION_ACTION
-        and p.get('Effect') == 'Allow'
-        and p.get('Principal', {}).get('Service') == AMAZON_API_PRINCIPAL
-        ]
+    return set([
+        (p.get('Condition', {}).get('ArnLike', {}).get('AWS:SourceArn'),
+         p.get('Principal', {}).get('Service'),
+         p.get('Action'))
+        for p in permissions if p.get('Effect') == 'Allow'
+    ])
+
+
+def _add_invoke_permission(client_lambda, grant):
+    return client_lambda.add_permission(
+        FunctionName=grant['name'],
+        StatementId=str(uuid.uuid1()),
+        Action=INVOKE_FUNCTION_ACTION,
+        Principal=AMAZON_API_PRINCIPAL,
+        SourceArn=grant['source_arn'],
+        Qualifier=grant['alias']
+    )
 
 
 '''
@@ -604,6 +724,11 @@ def json2table(data):
 
 
 def _custom_domain_name_exists(awsclient, domain_name):
+    return _cached_lookup(awsclient, ('domain', domain_name),
+                          _get_domain_name, awsclient, domain_name)
+
+
+def _get_domain_name(awsclient, domain_name):
     client_api = awsclient.get_client('apigateway')
     try:
         domain = client_api.get_domain_name(domainName=domain_name)
@@ -626,19 +751,81 @@ def _api_exists(awsclient, api_name):
 
 
 def _api_by_name(awsclient, api_name):
-    client_api = awsclient.get_client('apigateway')
-    filtered_rest_apis = \
-        list(filter(lambda api: True if api['name'] == api_name else False,
-               client_api.get_rest_apis()['items']))
+    return _cached_lookup(awsclient, ('api', api_name),
+                          _lookup_api_by_name, awsclient, api_name)
+
+
+def _lookup_api_by_name(awsclient, api_name):
+    # API names are not unique so we need to look at all APIs to detect
+    # duplicates (but only keep the matches)
+    filtered_rest_apis = find_resources(awsclient, 'rest_api', api_name)
+    if filtered_rest_apis is None:
+        # not in the inventory: list the APIs (this refreshes the inventory)
+        filtered_rest_apis = [
+            api for api in list_resources(awsclient, 'rest_api', refresh=True)
+            if api['name'] == api_name]
     if len(filtered_rest_apis) > 1:
-        raise Exception(
-            'more than one API with that name found. Clean up manually first')
-    elif len(filtered_rest_apis) == 0:
+        raise Exception('more than one API with that name found. '
+                        'Clean up manually first')
+    if len(filtered_rest_apis) == 0:
         return None
     else:
         return filtered_rest_apis[0]
 
 
+def _get_lambda_arn(awsclient, function_name):
+    return _cached_lookup(awsclient, ('lambda_arn', function_name),
+                          _lookup_lambda_arn, awsclient, function_name)
+
+
+def _lookup_lambda_arn(awsclient, function_name):
+    client_lambda = awsclient.get_client('lambda')
+    response_lambda = client_lambda.get_function(FunctionName=function_name)
+    return response_lambda['Configuration']['FunctionArn']
+
+
+def _cached_lookup(awsclient, key, lookup, *args):
+    """Do a lookup once per run (awsclient). Later calls return the cached
+    value until a mutating call updates or invalidates it.
+
+    :param awsclient:
+    :param key: tuple (kind, name)
+    :param lookup: function doing the AWS call(s)
+    :param args: arguments for lookup
+    :return: result of the lookup
+    """
+    with _lookup_lock:
+        cache = _lookup_cache.setdefault(awsclient, {})
+        if key in cache:
+            return cache[key]
+    value = lookup(*args)
+    with _lookup_lock:
+        cache[key] = value
+    return value
+
+
+def _set_lookup(awsclient, key, value):
+    with _lookup_lock:
+        _lookup_cache.setdefault(awsclient, {})[key] = value
+
+
+def _invalidate_lookup(awsclient, key):
+    with _lookup_lock:
+        _lookup_cache.get(awsclient, {}).pop(key, None)
+
+
+def _cache_api(awsclient, api_name, response):
+    # update the cached API (and the inventory) with the RestApi returned by
+    # a create / import / put call
+    api = dict(response)
+    api.pop('ResponseMetadata', None)
+    if api.get('name') == api_name:
+        _set_lookup(awsclient, ('api', api_name), api)
+        put_resource(awsclient, 'rest_api', api)
+    else:
+        _invalidate_lookup(awsclient, ('api', api_name))
+
+
 def _basepath_to_string_if_null(basepath):
     # None (empty basepath) defined as '(null)' in API Gateway
     if basepath is None or basepath == '':
@@ -647,10 +834,14 @@ def _basepath_to_string_if_null(basepath):
 
 
 def _compile_template(swagger_template_file, template_params):
-    compiler = Compiler()
     with codecs.open(swagger_template_file, 'r', 'utf-8') as f:
         template_file = f.read()
-    template = compiler.compile(template_file)
+    # compiling the template is expensive so it is cached by content hash
+    key = hashlib.sha1(template_file.encode('utf-8')).hexdigest()
+    template = _template_cache.get(key)
+    if template is None:
+        template = Compiler().compile(template_file)
+        _template_cache[key] = template
     filled_template = template(template_params)
     return filled_template
 
@@ -3,9 +3,6 @@
 from __future__ import unicode_literals, print_function
 import sys
 
-from .yugen_core import list_api_keys, get_lambdas, delete_api, \
-    export_to_swagger, create_api_key, list_apis, \
-    create_custom_domain, delete_api_key, deploy_api
 from . import utils
 from .gcdt_cmd_dispatcher import cmd
 from . import gcdt_lifecycle
@@ -13,8 +10,8 @@ from . import gcdt_lifecycle
 
 # creating docopt parameters and usage help
 DOC = '''Usage:
-        yugen deploy
-        yugen delete -f
+        yugen deploy [--metrics-file=<file>]
+        yugen delete -f [--metrics-file=<file>]
         yugen export
         yugen list
         yugen apikey-create <keyname>
@@ -24,6 +21,7 @@ DOC = '''Usage:
         yugen version
 
 -h --help           show this
+--metrics-file=<file>   write the AWS API call metrics to a JSON file
 '''
 
 
@@ -38,6 +36,7 @@ def version_cmd():
 
 @cmd(spec=['list'])
 def list_cmd(**tooldata):
+    from .yugen_core import list_apis
     context = tooldata.get('context')
     awsclient = context.get('_awsclient')
     return list_apis(awsclient)
@@ -45,6 +44,8 @@ def list_cmd(**tooldata):
 
 @cmd(spec=['deploy'])
 def deploy_cmd(**tooldata):
+    from .yugen_core import get_lambdas, deploy_api, \
+        create_custom_domain
     context = tooldata.get('context')
     config = tooldata.get('config')
     awsclient = context.get('_awsclient')
@@ -55,13 +56,19 @@ def deploy_cmd(**tooldata):
     target_stage = config['api'].get('targetStage')
     api_key = config['api'].get('apiKey')
     lambdas = get_lambdas(awsclient, config, add_arn=True)
+    stage_settings = {}
+    if 'customDomain' in config:
+        stage_settings['customDomain'] = dict(
+            (key, config['customDomain'].get(key)) for key in
+            ['domainName', 'basePath', 'route53Record', 'certificateName'])
     exit_code = deploy_api(
         awsclient=awsclient,
         api_name=api_name,
         api_description=api_description,
         stage_name=target_stage,
         api_key=api_key,
-        lambdas=lambdas
+        lambdas=lambdas,
+        stage_settings=stage_settings
     )
     if 'customDomain' in config:
         domain_name = config['customDomain'].get('domainName')
@@ -89,6 +96,7 @@ def deploy_cmd(**tooldata):
 
 @cmd(spec=['delete', '-f'])
 def delete_cmd(force, **tooldata):
+    from .yugen_core import delete_api
     context = tooldata.get('context')
     config = tooldata.get('config')
     awsclient = context.get('_awsclient')
@@ -102,6 +110,7 @@ def delete_cmd(force, **tooldata):
 
 @cmd(spec=['export'])
 def export_cmd(**tooldata):
+    from .yugen_core import get_lambdas, export_to_swagger
     context = tooldata.get('context')
     config = tooldata.get('config')
     awsclient = context.get('_awsclient')
@@ -125,6 +134,7 @@ def export_cmd(**tooldata):
 
 @cmd(spec=['apikey-create', '<keyname>'])
 def apikey_create_cmd(keyname, **tooldata):
+    from .yugen_core import create_api_key
     context = tooldata.get('context')
     config = tooldata.get('config')
     awsclient = context.get('_awsclient')
@@ -134,6 +144,7 @@ def apikey_create_cmd(keyname, **tooldata):
 
 @cmd(spec=['apikey-delete'])
 def apikey_delete_cmd(**tooldata):
+    from .yugen_core import delete_api_key
     context = tooldata.get('context')
     config = tooldata.get('config')
     awsclient = context.get('_awsclient')
@@ -143,6 +154,7 @@ def apikey_delete_cmd(**tooldata):
 
 @cmd(spec=['apikey-list'])
 def apikey_list_cmd(**tooldata):
+    from .yugen_core import list_api_keys
     context = tooldata.get('context')
     awsclient = context.get('_awsclient')
     list_api_keys(awsclient)
@@ -150,6 +162,7 @@ def apikey_list_cmd(**tooldata):
 
 @cmd(spec=['custom-domain-create'])
 def custom_domain_create_cmd(**tooldata):
+    from .yugen_core import create_custom_domain
     context = tooldata.get('context')
     config = tooldata.get('config')
     awsclient = context.get('_awsclient')
@@ -7,6 +7,7 @@ import textwrap
 import logging
 
 import botocore.session
+from botocore.exceptions import ClientError
 import pytest
 from awacs.aws import Action, Allow, Policy, Principal, Statement
 from gcdt_bundler.bundler import get_zipped_file
@@ -124,11 +125,18 @@ def create_lambda_helper(awsclient, lambda_name, role_arn, handler_filename,
         **kwargs
     )
 
-    # TODO better use waiter for that!
-    time.sleep(10)
-
 
 # role helpers
+def _role_exists(iam, role_name):
+    try:
+        iam.get_role(RoleName=role_name)
+        return True
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'NoSuchEntity':
+            return False
+        raise
+
+
 def delete_role_helper(awsclient, role_name):
     """Delete the testing role.
 
@@ -182,17 +190,10 @@ def create_role_helper(awsclient, name, policies=None, principal_service=None):
         for p in policies:
             iam.attach_role_policy(RoleName=role['RoleName'], PolicyArn=p)
 
-    # TODO: on 20160816 we had multiple times that the role could not be assigned
-    # we suspect that this is a timing issue with AWS lambda
-    # get_role to make sure role is available for lambda
-    # response = iam.list_attached_role_policies(RoleName=name)
-    # log.info('created role: %s' % name)
-    # log.info(response)
-    # ClientError: An error occurred (InvalidParameterValueException) when
-    # calling the CreateFunction operation: The role defined for the function
-    # cannot be assumed by Lambda.
-    # current assumption is that the role is not propagated to lambda in time
-    time.sleep(15)
+    # the role needs a few seconds until it can be assumed by AWS Lambda
+    # (ramuda retries create_function until the role is propagated)
+    utils.wait_until(lambda: _role_exists(iam, role['RoleName']),
+                     max_wait=60, name='role %s' % role['RoleName'])
 
     return role
 
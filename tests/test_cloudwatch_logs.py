@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, print_function
+
+import mock
+import pytest
+
+from gcdt.cloudwatch_logs import iter_log_events, \
+    iter_log_events_concurrent, filter_log_events, _split_time_range, LogTail
+
+
+def _event(timestamp, stream='stream', event_id=None):
+    return {'timestamp': timestamp, 'message': 'msg %d' % timestamp,
+            'eventId': event_id or 'id%d' % timestamp,
+            'logStreamName': stream}
+
+
+def _fake_filter_log_events(events, page_size=2):
+    # paginated fake of client_logs.filter_log_events
+    def _filter_log_events(**request):
+        selected = [e for e in events
+                    if request['startTime'] <= e['timestamp'] and
+                    ('endTime' not in request or
+                     e['timestamp'] <= request['endTime'])]
+        offset = int(request.get('nextToken', 0))
+        response = {'events': selected[offset:offset + page_size]}
+        if offset + page_size < len(selected):
+            response['nextToken'] = str(offset + page_size)
+        return response
+    return _filter_log_events
+
+
+def test_iter_log_events():
+    awsclient = mock.Mock()
+    client_logs = awsclient.get_client.return_value
+    client_logs.filter_log_events.side_effect = _fake_filter_log_events(
+        [_event(ts) for ts in range(10, 15)])
+
+    events = iter_log_events(awsclient, 'log_group', 11,
+                             log_stream_names=['stream'],
+                             filter_pattern='ERROR')
+    # generator, nothing is fetched before the first event is requested
+    assert client_logs.filter_log_events.call_count == 0
+    assert next(events) == {'timestamp': 11, 'message': 'msg 11',
+                            'eventId': 'id11', 'logStreamName': 'stream'}
+    assert client_logs.filter_log_events.call_count == 1
+    assert [e['timestamp'] for e in events] == [12, 13, 14]
+    assert client_logs.filter_log_events.call_count == 2
+
+    request = client_logs.filter_log_events.call_args_list[0][1]
+    assert request == {'logGroupName': 'log_group', 'startTime': 11,
+                       'logStreamNames': ['stream'],
+                       'filterPattern': 'ERROR'}
+
+
+def test_filter_log_events():
+    awsclient = mock.Mock()
+    client_logs = awsclient.get_client.return_value
+    client_logs.filter_log_events.side_effect = _fake_filter_log_events(
+        [_event(ts) for ts in range(10, 15)])
+
+    assert filter_log_events(awsclient, 'log_group', 12, 13) == [
+        {'timestamp': 12, 'message': 'msg 12'},
+        {'timestamp': 13, 'message': 'msg 13'}
+    ]
+
+
+@pytest.mark.parametrize('start_ts, end_ts, slices, expected', [
+    (0, 99, 4, [(0, 24), (25, 49), (50, 74), (75, 99)]),
+    (0, 10, 4, [(0, 1), (2, 4), (5, 7), (8, 10)]),
+    (0, 2, 4, [(0, 0), (1, 1), (2, 2)]),
+    (5, 5, 4, [(5, 5)]),
+])
+def test_split_time_range(start_ts, end_ts, slices, expected):
+    assert _split_time_range(start_ts, end_ts, slices) == expected
+
+
+def test_iter_log_events_concurrent():
+    awsclient = mock.Mock()
+    client_logs = awsclient.get_client.return_value
+    client_logs.filter_log_events.side_effect = _fake_filter_log_events(
+        [_event(ts) for ts in range(0, 100, 3)])
+
+    events = list(iter_log_events_concurrent(awsclient, 'log_group', 0, 99,
+                                             slices=4))
+
+    assert [e['timestamp'] for e in events] == list(range(0, 100, 3))
+
+
+def test_iter_log_events_concurrent_stop_early():
+    awsclient = mock.Mock()
+    client_logs = awsclient.get_client.return_value
+    client_logs.filter_log_events.side_effect = _fake_filter_log_events(
+        [_event(ts) for ts in range(0, 1000)], page_size=1)
+
+    events = iter_log_events_concurrent(awsclient, 'log_group', 0, 999,
+                                        slices=4)
+    assert [next(events)['timestamp'] for _ in range(3)] == [0, 1, 2]
+    # closing the generator stops the workers
+    events.close()
+    assert client_logs.filter_log_events.call_count < 100
+
+
+def test_iter_log_events_concurrent_error():
+    awsclient = mock.Mock()
+    client_logs = awsclient.get_client.return_value
+    client_logs.filter_log_events.side_effect = Exception('access denied')
+
+    with pytest.raises(Exception) as einfo:
+        list(iter_log_events_concurrent(awsclient, 'log_group', 0, 99))
+    assert str(einfo.value) == 'access denied'
+
+
+@pytest.fixture(scope='function')
+def clock():
+    # fake time.time (seconds)
+    now = [3.0]
+    with mock.patch('gcdt.cloudwatch_logs.time.time',
+                    side_effect=lambda: now[0]):
+        yield now
+
+
+def _log_tail_awsclient(events):
+    awsclient = mock.Mock()
+    client_logs = awsclient.get_client.return_value
+    client_logs.filter_log_events.side_effect = _fake_filter_log_events(
+        events)
+    return awsclient, client_logs
+
+
+def test_log_tail(clock):
+    events = [_event(1000), _event(2000)]
+    awsclient, client_logs = _log_tail_awsclient(events)
+    tail = LogTail(awsclient, 'log_group', 500, lag_window=5)
+
+    assert [e['timestamp'] for e in tail.poll()] == [1000, 2000]
+    # no new events: poll less often
+    clock[0] = 3.1
+    assert tail.poll() == []
+    assert tail.interval > LogTail.POLL_INTERVAL_MIN
+    # polls start at the newest event
+    assert client_logs.filter_log_events.call_args[1]['startTime'] == 2000
+
+    # event in the same millisecond and late event of another stream
+    events.append(_event(2000, event_id='other'))
+    events.append(_event(1500, stream='late'))
+    events.sort(key=lambda e: e['timestamp'])
+    clock[0] = 3.2
+    assert [e['eventId'] for e in tail.poll()] == ['other']
+    assert tail.interval == LogTail.POLL_INTERVAL_MIN
+    # the late event is found by the sweep of the lag window
+    clock[0] = 5.6
+    assert [e['eventId'] for e in tail.poll()] == ['id1500']
+    assert client_logs.filter_log_events.call_args[1]['startTime'] == 600
+    assert tail.poll() == []
+
+
+def test_log_tail_lag_window(clock):
+    awsclient, client_logs = _log_tail_awsclient(
+        [_event(1000), _event(20000)])
+    clock[0] = 25.0
+    tail = LogTail(awsclient, 'log_group', 0, lag_window=10)
+
+    assert len(tail.poll()) == 2
+    clock[0] = 26.0
+    assert tail.poll() == []
+    assert client_logs.filter_log_events.call_args[1]['startTime'] == 20000
+    # events before the lag window are not needed for duplicate detection
+    assert list(tail._seen.keys()) == ['id20000']
+
+    # the sweep starts at the lag window, the timestamps before are fully
+    # seen
+    clock[0] = 31.0
+    assert tail.poll() == []
+    assert client_logs.filter_log_events.call_args[1]['startTime'] == 21000
+    assert tail._seen == {}
+
+
+def test_log_tail_same_timestamp(clock):
+    # events in the lag window are never dropped from duplicate detection
+    awsclient, client_logs = _log_tail_awsclient(
+        [_event(2500, event_id='id%d' % i) for i in range(50)])
+    tail = LogTail(awsclient, 'log_group', 0)
+
+    assert len(tail.poll()) == 50
+    assert tail.poll() == []
+    assert len(tail._seen) == 50
+
+
+@mock.patch('time.sleep')
+def test_log_tail_follow(mocked_sleep):
+    awsclient = mock.Mock()
+    client_logs = awsclient.get_client.return_value
+    client_logs.filter_log_events.side_effect = [
+        {'events': []},
+        {'events': [_event(1000)]},
+    ]
+    tail = LogTail(awsclient, 'log_group', 0)
+
+    assert next(tail.follow())['timestamp'] == 1000
+    assert mocked_sleep.call_count == 1
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, print_function
+import threading
+import time
+
+import mock
+
+from gcdt.gcdt_awsclient import AWSClient, get_client_config
+
+
+def test_get_client_config():
+    config = get_client_config(read_timeout=5)
+    assert config.max_pool_connections == 32
+    assert config.connect_timeout == 10
+    assert config.read_timeout == 5
+
+
+def _awsclient(session):
+    awsclient = AWSClient(session)
+    # the mocked clients have no botocore retry handler to replace
+    awsclient.retry_policy = mock.Mock()
+    return awsclient
+
+
+def test_get_client_cache_key():
+    session = mock.Mock()
+    session.create_client.side_effect = lambda *args, **kwargs: mock.Mock()
+    awsclient = _awsclient(session)
+
+    client = awsclient.get_client('lambda')
+    assert awsclient.get_client('lambda') is client
+    assert awsclient.get_client('lambda', region_name='us-east-1') is not \
+        client
+    assert session.create_client.call_count == 2
+    args, kwargs = session.create_client.call_args
+    assert args == ('lambda',)
+    assert kwargs['region_name'] == 'us-east-1'
+    assert kwargs['config'].max_pool_connections == 32
+
+
+@mock.patch('botocore.session.Session')
+def test_get_client_profile(mocked_session):
+    awsclient = _awsclient(mock.Mock())
+
+    awsclient.get_client('s3', profile_name='other')
+    awsclient.get_client('s3', profile_name='other')
+
+    mocked_session.assert_called_once_with(profile='other')
+    assert mocked_session.return_value.create_client.call_count == 1
+
+
+def test_get_client_threads():
+    def _create_client(*args, **kwargs):
+        time.sleep(0.01)  # slow model loading
+        return mock.Mock()
+
+    session = mock.Mock()
+    session.create_client.side_effect = _create_client
+    awsclient = _awsclient(session)
+    clients = []
+
+    threads = [threading.Thread(
+        target=lambda: clients.append(awsclient.get_client('lambda')))
+        for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert session.create_client.call_count == 1
+    assert len(set([id(c) for c in clients])) == 1
+
+
+def test_prewarm():
+    session = mock.Mock()
+    session.create_client.side_effect = [Exception('unknown service'),
+                                         mock.Mock()]
+    awsclient = _awsclient(session)
+
+    awsclient.prewarm(['foo', 'lambda', 'lambda'])
+    assert awsclient.wait_for_prewarm()
+
+    assert session.create_client.call_count == 2
+    awsclient.get_client('lambda')
+    assert session.create_client.call_count == 2
+
+
+def test_prewarm_timeout():
+    created = threading.Event()
+    session = mock.Mock()
+    session.create_client.side_effect = \
+        lambda *args, **kwargs: created.wait(5)
+    awsclient = _awsclient(session)
+
+    awsclient.prewarm(['lambda'])
+    assert not awsclient.wait_for_prewarm(timeout=0.01)
+    created.set()
+    # nothing to wait for
+    assert awsclient.wait_for_prewarm(timeout=0.01)
+
+
+def test_close():
+    awsclient = _awsclient(mock.Mock())
+    awsclient.close()  # no uploader yet
+
+    with mock.patch('gcdt.s3.S3Uploader') as mocked_uploader:
+        awsclient.get_uploader()
+        awsclient.close()
+    mocked_uploader.return_value.shutdown.assert_called_once_with()
+
+
+def test_get_account_id():
+    session = mock.Mock()
+    client_sts = session.create_client.return_value
+    client_sts.get_caller_identity.return_value = {'Account': '123456789012'}
+    awsclient = _awsclient(session)
+
+    assert awsclient.get_account_id() == '123456789012'
+    assert awsclient.get_account_id() == '123456789012'
+    assert client_sts.get_caller_identity.call_count == 1
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, print_function
+import datetime
+import os
+import time
+
+import mock
+import pytest
+
+from gcdt import gcdt_inventory
+from gcdt.gcdt_inventory import Inventory, get_inventory, reset_inventory, \
+    list_resources, find_resources, put_resource, remove_resource
+from gcdt.ramuda_utils import lambda_exists
+
+
+@pytest.fixture(scope='function')
+def inventory(tmpdir, monkeypatch):
+    monkeypatch.chdir(str(tmpdir))
+    monkeypatch.setenv('GCDT_INVENTORY_TTL', '300')
+    monkeypatch.setenv('ENV', 'DEV')
+    reset_inventory()
+    yield get_inventory()
+    reset_inventory()
+
+
+def _lambda_awsclient(pages):
+    awsclient = mock.Mock()
+    awsclient.get_account_id.return_value = '123456789012'
+    client_lambda = awsclient.get_client.return_value
+    client_lambda.meta.region_name = 'eu-west-1'
+    client_lambda.can_paginate.return_value = True
+    client_lambda.get_paginator.return_value.paginate.side_effect = \
+        lambda **kwargs: iter(pages)
+    return awsclient, client_lambda
+
+
+def test_get_inventory_disabled(tmpdir, monkeypatch):
+    monkeypatch.chdir(str(tmpdir))
+    monkeypatch.delenv('GCDT_INVENTORY_TTL', raising=False)
+    reset_inventory()
+    assert get_inventory() is None
+    assert not os.path.exists(gcdt_inventory.INVENTORY_FILE)
+
+
+def test_inventory_update(tmpdir):
+    inventory = Inventory(str(tmpdir.join('inventory.sqlite')), ttl=300)
+    assert not inventory.is_fresh('scope', 'function')
+
+    assert inventory.update('scope', 'function', [
+        ('a', 'a', {'FunctionName': 'a', 'Version': '1'}),
+        ('b', 'b', {'FunctionName': 'b', 'Version': '1'})
+    ]) == (2, 0)
+    assert inventory.is_fresh('scope', 'function')
+    # only the deltas are written
+    assert inventory.update('scope', 'function', [
+        ('a', 'a', {'FunctionName': 'a', 'Version': '2'}),
+        ('c', 'c', {'FunctionName': 'c', 'Version': '1'})
+    ]) == (2, 1)
+    assert [f['FunctionName'] for f in
+            inventory.get_items('scope', 'function')] == ['a', 'c']
+    assert inventory.find_items('scope', 'function', 'a') == [
+        {'FunctionName': 'a', 'Version': '2'}]
+    assert inventory.get_items('other_scope', 'function') == []
+
+
+def test_inventory_ttl(tmpdir):
+    inventory = Inventory(str(tmpdir.join('inventory.sqlite')), ttl=300)
+    inventory.update('scope', 'function', [])
+    assert inventory.is_fresh('scope', 'function')
+    with mock.patch('gcdt.gcdt_inventory.time.time',
+                    return_value=time.time() + 301):
+        assert not inventory.is_fresh('scope', 'function')
+
+
+def test_list_resources_refreshes_inventory(inventory):
+    modified = datetime.datetime(2017, 8, 1, 12, 0)
+    awsclient, client_lambda = _lambda_awsclient([
+        {'Functions': [{'FunctionName': 'a', 'LastModified': modified}]},
+        {'Functions': [{'FunctionName': 'b', 'LastModified': modified}]}
+    ])
+
+    assert [f['FunctionName'] for f in
+            list_resources(awsclient, 'function')] == ['a', 'b']
+    assert client_lambda.get_paginator.call_count == 1
+
+    # fresh inventory: no list call
+    assert [f['FunctionName'] for f in
+            list_resources(awsclient, 'function')] == ['a', 'b']
+    assert client_lambda.get_paginator.call_count == 1
+
+    # datetimes come back from the inventory like from a live call
+    assert find_resources(awsclient, 'function', 'b') == [
+        {'FunctionName': 'b', 'LastModified': modified}]
+    assert find_resources(awsclient, 'function', 'c') is None
+
+    # the inventory is scoped per account / region
+    awsclient.get_account_id.return_value = '210987654321'
+    assert find_resources(awsclient, 'function', 'b') is None
+    awsclient.get_account_id.return_value = '123456789012'
+    client_lambda.meta.region_name = 'us-east-1'
+    assert find_resources(awsclient, 'function', 'b') is None
+
+
+def test_put_and_remove_resource(inventory):
+    awsclient, client_lambda = _lambda_awsclient([{'Aliases': []}])
+    list(list_resources(awsclient, 'alias', parent='fn'))
+
+    put_resource(awsclient, 'alias', {'Name': 'ACTIVE'}, parent='fn')
+    assert find_resources(awsclient, 'alias', 'ACTIVE', parent='fn') == [
+        {'Name': 'ACTIVE'}]
+    assert find_resources(awsclient, 'alias', 'ACTIVE', parent='fn2') is None
+
+    remove_resource(awsclient, 'alias', 'ACTIVE', parent='fn')
+    assert find_resources(awsclient, 'alias', 'ACTIVE', parent='fn') is None
+
+
+def test_lambda_exists_uses_inventory(inventory):
+    awsclient, client_lambda = _lambda_awsclient([
+        {'Functions': [{'FunctionName': 'a'}]}
+    ])
+    list(list_resources(awsclient, 'function'))
+
+    assert lambda_exists(awsclient, 'a')
+    assert client_lambda.get_function.call_count == 0
+
+    # miss: live lookup
+    client_lambda.get_function.return_value = {
+        'Configuration': {'FunctionName': 'b'}}
+    assert lambda_exists(awsclient, 'b')
+    assert client_lambda.get_function.call_count == 1
+    assert lambda_exists(awsclient, 'b')
+    assert client_lambda.get_function.call_count == 1
+
+
+def test_put_resource_normalizes_items(inventory):
+    awsclient, client_cf = _lambda_awsclient([{'StackSummaries': []}])
+    list(list_resources(awsclient, 'stack'))
+
+    # describe_stacks result is stored like a list_stacks summary
+    created = datetime.datetime(2017, 8, 1, 12, 0)
+    put_resource(awsclient, 'stack', {
+        'StackId': 'id', 'StackName': 'stack', 'Description': 'my stack',
+        'CreationTime': created, 'StackStatus': 'CREATE_COMPLETE',
+        'Parameters': [], 'Outputs': [], 'Tags': []})
+    assert find_resources(awsclient, 'stack', 'stack') == [{
+        'StackId': 'id', 'StackName': 'stack',
+        'TemplateDescription': 'my stack', 'CreationTime': created,
+        'StackStatus': 'CREATE_COMPLETE'}]
+
+    # the value of an api key is not stored
+    list(list_resources(awsclient, 'api_key'))
+    put_resource(awsclient, 'api_key', {
+        'id': 'key', 'name': 'my key', 'value': 'secret',
+        'ResponseMetadata': {}})
+    assert find_resources(awsclient, 'api_key', 'my key') == [
+        {'id': 'key', 'name': 'my key'}]
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, print_function
+import io
+import json
+import os
+
+import botocore.session
+import mock
+import pytest
+
+from gcdt.gcdt_metrics import ApiMetrics, report_api_metrics, _percentile, \
+    _body_size
+
+from gcdt_testtools.helpers import temp_folder  # fixtures!
+
+
+class _FakeHttpResponse(object):
+    def __init__(self, status_code, content_length):
+        self.status_code = status_code
+        self.headers = {'content-length': str(content_length)}
+
+
+def _fake_responses(responses):
+    # before-call handler which returns the responses instead of calling AWS
+    def _before_call(**kwargs):
+        return responses.pop(0)
+    return _before_call
+
+
+@pytest.fixture(scope='function')
+def lambda_client():
+    session = botocore.session.Session()
+    metrics = ApiMetrics()
+    metrics.register(session)
+    responses = []
+    session.register('before-call.*.*', _fake_responses(responses))
+    client = session.create_client(
+        'lambda', region_name='eu-west-1', aws_access_key_id='access_key',
+        aws_secret_access_key='secret_key')
+    return client, metrics, responses
+
+
+@pytest.mark.parametrize('values, percent, expected', [
+    ([], 50, 0),
+    ([1], 99, 1),
+    ([1, 2, 3, 4], 50, 2),
+    (list(range(1, 101)), 90, 90),
+    (list(range(1, 101)), 99, 99),
+])
+def test_percentile(values, percent, expected):
+    assert _percentile(values, percent) == expected
+
+
+def test_body_size():
+    assert _body_size(None) == 0
+    assert _body_size(b'abc') == 3
+    assert _body_size('äbc') == 4
+    assert _body_size({'Action': 'ListStacks'}) == len('Action=ListStacks')
+    body = io.BytesIO(b'0123456789')
+    body.seek(4)
+    assert _body_size(body) == 6
+    assert body.tell() == 4
+
+
+def test_api_metrics(lambda_client):
+    client, metrics, responses = lambda_client
+    responses.extend([
+        (_FakeHttpResponse(200, 100), {
+            'Functions': [],
+            'ResponseMetadata': {'RetryAttempts': 2}}),
+        (_FakeHttpResponse(200, 50), {'Functions': []}),
+        (_FakeHttpResponse(404, 20), {
+            'Error': {'Code': 'ResourceNotFoundException',
+                      'Message': 'not found'}}),
+    ])
+    client.list_functions()
+    client.list_functions()
+    with pytest.raises(Exception):
+        client.get_function(FunctionName='unknown')
+
+    report = metrics.report()
+
+    assert report['total']['calls'] == 3
+    assert report['total']['errors'] == 1
+    assert report['total']['retries'] == 2
+    assert report['total']['bytes_received'] == 170
+    list_functions = [e for e in report['operations']
+                      if e['operation'] == 'ListFunctions'][0]
+    assert list_functions['service'] == 'lambda'
+    assert list_functions['calls'] == 2
+    assert list_functions['bytes_received'] == 150
+    assert list_functions['p50'] <= list_functions['p99']
+    assert 'ListFunctions' in metrics.format_summary()
+
+
+def test_api_metrics_throttles():
+    metrics = ApiMetrics()
+    operation = mock.Mock()
+    operation.name = 'DescribeStacks'
+    operation.service_model.endpoint_prefix = 'cloudformation'
+
+    metrics._needs_retry(operation=operation, response=(
+        mock.Mock(), {'Error': {'Code': 'Throttling'}}))
+    metrics._needs_retry(operation=operation, response=(
+        mock.Mock(), {'Error': {'Code': 'ValidationError'}}))
+    metrics._needs_retry(operation=operation, response=None)
+
+    assert metrics.report()['operations'][0]['throttles'] == 1
+
+
+def test_report_api_metrics(temp_folder, lambda_client, capsys):
+    client, metrics, responses = lambda_client
+    responses.append((_FakeHttpResponse(200, 10), {'Functions': []}))
+    client.list_functions()
+    context = {'tool': 'ramuda', 'command': 'deploy'}
+
+    report_api_metrics(metrics, context, metrics_file='metrics.json')
+
+    assert context['api_metrics']['total']['calls'] == 1
+    out, _ = capsys.readouterr()
+    assert 'ListFunctions' in out
+    with open(os.path.join(temp_folder[0], 'metrics.json')) as mfile:
+        report = json.load(mfile)
+    assert report['command'] == 'deploy'
+    assert report['operations'][0]['operation'] == 'ListFunctions'
+
+
+def test_report_api_metrics_no_calls(capsys):
+    context = {}
+    report_api_metrics(ApiMetrics(), context)
+    out, _ = capsys.readouterr()
+    assert out == ''
+    assert context['api_metrics']['total']['calls'] == 0
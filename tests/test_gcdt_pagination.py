@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, print_function
+
+import botocore.session
+import mock
+
+from gcdt.gcdt_pagination import iter_pages, iter_items, find_item
+
+
+def _rules_client(pages):
+    # client without paginator for list_rules (token pagination)
+    client = mock.Mock()
+    client.can_paginate.return_value = False
+    client.list_rules.side_effect = pages
+    return client
+
+
+def test_iter_items_token_pagination():
+    client = _rules_client([
+        {'Rules': [{'Name': 'a'}, {'Name': 'b'}], 'NextToken': 'token1'},
+        {'Rules': [{'Name': 'c'}]}
+    ])
+
+    items = iter_items(client, 'list_rules', 'Rules', NamePrefix='x')
+    assert client.list_rules.call_count == 0  # lazy
+    assert [r['Name'] for r in items] == ['a', 'b', 'c']
+
+    assert client.list_rules.call_args_list == [
+        mock.call(NamePrefix='x'),
+        mock.call(NamePrefix='x', NextToken='token1')
+    ]
+
+
+def test_find_item_stops_at_match():
+    client = _rules_client([
+        {'Rules': [{'Name': 'a'}, {'Name': 'b'}], 'NextToken': 'token1'},
+        {'Rules': [{'Name': 'c'}]}
+    ])
+
+    assert find_item(client, 'list_rules', 'Rules',
+                     lambda r: r['Name'] == 'b') == {'Name': 'b'}
+    assert client.list_rules.call_count == 1
+
+
+def test_find_item_no_match():
+    client = _rules_client([
+        {'Rules': [{'Name': 'a'}], 'NextToken': 'token1'},
+        {'Rules': []}
+    ])
+
+    assert find_item(client, 'list_rules', 'Rules',
+                     lambda r: r['Name'] == 'b') is None
+    assert client.list_rules.call_count == 2
+
+
+def test_iter_pages_without_pagination():
+    client = mock.Mock()
+    client.can_paginate.return_value = False
+    client.describe_stacks.return_value = {'Stacks': []}
+
+    assert list(iter_pages(client, 'describe_stacks', StackName='x')) == [
+        {'Stacks': []}]
+    client.describe_stacks.assert_called_once_with(StackName='x')
+
+
+def test_iter_items_paginator():
+    session = botocore.session.Session()
+    responses = [
+        {'Functions': [{'FunctionName': 'a'}], 'NextMarker': 'marker1'},
+        {'Functions': [{'FunctionName': 'b'}], 'NextMarker': 'marker2'},
+        {'Functions': [{'FunctionName': 'c'}]}
+    ]
+    requests = []
+
+    def _fake_response(params, **kwargs):
+        # return the response instead of calling AWS
+        requests.append(params)
+        return mock.Mock(status_code=200), responses.pop(0)
+
+    session.register('before-call.lambda.ListFunctions', _fake_response)
+    client = session.create_client(
+        'lambda', region_name='eu-west-1', aws_access_key_id='access_key',
+        aws_secret_access_key='secret_key')
+
+    assert find_item(client, 'list_functions', 'Functions',
+                     lambda f: f['FunctionName'] == 'b') == \
+        {'FunctionName': 'b'}
+    # the third page is not requested
+    assert len(requests) == 2
+    assert requests[1]['query_string']['Marker'] == 'marker1'
@@ -1,12 +1,34 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals, print_function
 
+import os
+
 import mock
+import pytest
 
-from gcdt.gcdt_plugins import load_plugins, get_plugin_versions
+from gcdt import gcdt_plugins
+from gcdt.gcdt_plugins import load_plugins, get_plugin_versions, \
+    get_entry_points, reset_plugin_registry
 from gcdt.gcdt_signals import check_hook_mechanism_is_intact
 
 
+@pytest.fixture(autouse=True)
+def plugin_registry():
+    # every test starts with an empty plugin registry
+    reset_plugin_registry()
+    yield
+    reset_plugin_registry()
+
+
+def _entry_point(project_name='gcdt-foo', version='0.0.1'):
+    ep = mock.Mock(module_name='gcdt.gcdt_signals',
+                   attrs=('check_register_present',))
+    ep.name = project_name
+    ep.dist.project_name = project_name
+    ep.dist.version = version
+    return ep
+
+
 def test_load_plugins():
     ep = mock.Mock(spec=['load'])
     plugin = mock.Mock(spec=['register', 'deregister'])
@@ -42,3 +64,43 @@ def test_get_plugin_versions():
     versions = get_plugin_versions()
     assert 'gcdt-bundler' in versions
     assert 'gcdt-lookups' in versions
+
+
+def test_get_entry_points_scans_once():
+    ep = _entry_point()
+    with mock.patch('pkg_resources.iter_entry_points',
+                    return_value=[ep]) as mocked_iter_entry_points:
+        assert get_entry_points() == [ep]
+        assert get_plugin_versions() == {'gcdt-foo': '0.0.1'}
+        mocked_iter_entry_points.assert_called_once_with('gcdt10', name=None)
+
+        reset_plugin_registry()
+        get_entry_points()
+        assert mocked_iter_entry_points.call_count == 2
+
+
+def test_get_entry_points_snapshot(tmpdir):
+    snapshot_file = os.path.join(str(tmpdir), 'plugin_snapshot.json')
+    ep = _entry_point()
+    with mock.patch.dict(os.environ, {'GCDT_PLUGIN_SNAPSHOT': '1'}), \
+            mock.patch.object(gcdt_plugins, 'PLUGIN_SNAPSHOT_FILE',
+                              snapshot_file), \
+            mock.patch('pkg_resources.iter_entry_points',
+                       return_value=[ep]) as mocked_iter_entry_points:
+        assert get_plugin_versions() == {'gcdt-foo': '0.0.1'}
+        assert os.path.isfile(snapshot_file)
+
+        # next process: served from the snapshot
+        reset_plugin_registry()
+        entry_points = get_entry_points()
+        assert mocked_iter_entry_points.call_count == 1
+        assert get_plugin_versions() == {'gcdt-foo': '0.0.1'}
+        plugin = entry_points[0].load()
+        assert plugin is gcdt_plugins.check_register_present
+
+        # installed distributions changed: scan again
+        reset_plugin_registry()
+        with mock.patch.object(gcdt_plugins, '_get_fingerprint',
+                               return_value='changed'):
+            get_entry_points()
+        assert mocked_iter_entry_points.call_count == 2
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, print_function
+
+import botocore.session
+import mock
+import pytest
+
+from gcdt.gcdt_ratelimit import RateLimiter, RetryBudget, RetryPolicy, \
+    RetryHandlerError, backoff_delay, _get_service_event_name
+
+
+class _FakeHttpResponse(object):
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+THROTTLED = (_FakeHttpResponse(400), {'Error': {'Code': 'Throttling'}})
+NOT_FOUND = (_FakeHttpResponse(404),
+             {'Error': {'Code': 'ResourceNotFoundException'}})
+SUCCESS = (_FakeHttpResponse(200), {'Functions': []})
+
+
+@pytest.fixture(scope='function')
+def clock():
+    # fake time.time / time.sleep
+    now = [1000.0]
+
+    def _sleep(seconds):
+        now[0] += seconds
+
+    with mock.patch('time.time', side_effect=lambda: now[0]), \
+            mock.patch('time.sleep', side_effect=_sleep) as mocked_sleep:
+        yield now, mocked_sleep
+
+
+@mock.patch('random.uniform', side_effect=lambda a, b: b)
+def test_backoff_delay(mocked_uniform):
+    assert backoff_delay(1) == 1.0
+    assert backoff_delay(3) == 4.0
+    assert backoff_delay(10) == 20  # max delay
+    mocked_uniform.assert_called_with(0, 20)
+
+
+def test_rate_limiter_unlimited(clock):
+    now, mocked_sleep = clock
+    limiter = RateLimiter()
+    for _ in range(100):
+        limiter.acquire()
+    assert limiter.rate is None
+    assert mocked_sleep.call_count == 0
+
+
+def test_rate_limiter_throttled(clock):
+    now, mocked_sleep = clock
+    limiter = RateLimiter()
+    for _ in range(8):
+        limiter.acquire()
+    limiter.on_throttle()
+    # half of the measured rate
+    assert limiter.rate == 4.0
+
+    start = now[0]
+    for _ in range(8):
+        limiter.acquire()
+    assert now[0] - start == pytest.approx(2.0)
+
+    limiter.on_throttle()
+    assert limiter.rate == 2.0
+    limiter.on_throttle()
+    limiter.on_throttle()
+    limiter.on_throttle()
+    assert limiter.rate == 0.5  # min rate
+
+
+def test_rate_limiter_recovers(clock):
+    now, mocked_sleep = clock
+    limiter = RateLimiter()
+    for _ in range(4):
+        limiter.acquire()
+    limiter.on_throttle()
+    assert limiter.rate == 2.0
+
+    now[0] += 2
+    limiter.on_success()
+    assert limiter.rate == 3.0
+    now[0] += 20
+    limiter.on_success()
+    assert limiter.rate is None
+
+
+def test_retry_budget():
+    budget = RetryBudget(capacity=10, cost=5, refund=1)
+    assert budget.withdraw()
+    assert budget.withdraw()
+    assert not budget.withdraw()
+    for _ in range(20):
+        budget.refund()
+    assert budget.available == 10
+
+
+@pytest.fixture(scope='function')
+def lambda_client():
+    session = botocore.session.Session()
+    client = _create_client(session, 'lambda')
+    policy = RetryPolicy(RetryBudget(capacity=10, cost=5))
+    policy.install(session, client)
+
+    def _needs_retry(response, attempts=1):
+        return _emit_needs_retry(client, 'ListFunctions', response,
+                                 attempts)
+
+    return policy, _needs_retry
+
+
+def _create_client(session, service_name):
+    return session.create_client(
+        service_name, region_name='eu-west-1',
+        aws_access_key_id='access_key', aws_secret_access_key='secret_key')
+
+
+def _emit_needs_retry(client, operation_name, response, attempts=1):
+    responses = client.meta.events.emit(
+        'needs-retry.%s.%s' % (
+            _get_service_event_name(client.meta.service_model),
+            operation_name),
+        response=response, endpoint=None, operation=None, attempts=attempts,
+        caught_exception=None, request_dict={'context': {}})
+    return [r for _, r in responses if r is not None]
+
+
+@mock.patch('random.uniform', side_effect=lambda a, b: b)
+def test_retry_policy(mocked_uniform, lambda_client):
+    policy, needs_retry = lambda_client
+
+    # only the gcdt handler decides (botocore handler is replaced)
+    assert needs_retry(THROTTLED) == [1.0]
+    assert policy.get_limiter('lambda').rate == policy.get_limiter(
+        'lambda')._min_rate
+    assert needs_retry(NOT_FOUND) == []
+    assert needs_retry(SUCCESS) == []
+    # botocore max. attempts
+    assert needs_retry(THROTTLED, attempts=5) == []
+
+    # budget is exhausted (capacity 10, cost 5)
+    assert needs_retry(THROTTLED, attempts=2) == [2.0]
+    assert needs_retry(THROTTLED, attempts=3) == []
+    assert policy.budget.available == 1
+
+
+@mock.patch('random.uniform', side_effect=lambda a, b: b)
+def test_retry_policy_service_event_name(mocked_uniform):
+    # newer botocore versions name the events of apigateway 'api-gateway'
+    session = botocore.session.Session()
+    client = _create_client(session, 'apigateway')
+    RetryPolicy().install(session, client)
+
+    assert _emit_needs_retry(client, 'GetRestApis', THROTTLED) == [1.0]
+
+
+def test_get_service_event_name():
+    service_model = mock.Mock(endpoint_prefix='apigateway')
+    service_model.service_id.hyphenize.return_value = 'api-gateway'
+    assert _get_service_event_name(service_model) == 'api-gateway'
+
+    service_model = mock.Mock(spec=['endpoint_prefix'],
+                              endpoint_prefix='apigateway')
+    assert _get_service_event_name(service_model) == 'apigateway'
+
+
+def test_retry_policy_handler_not_replaced():
+    # e.g. botocore registers the retry handler under a different unique_id
+    session = botocore.session.Session()
+    client = _create_client(session, 'lambda')
+    event_name = _get_service_event_name(client.meta.service_model)
+    client.meta.events.unregister('needs-retry.%s' % event_name,
+                                  unique_id='retry-config-%s' % event_name)
+
+    with pytest.raises(RetryHandlerError):
+        RetryPolicy().install(session, client)
+
+
+class _Acquired(Exception):
+    pass
+
+
+def test_retry_policy_rate_limits_requests():
+    session = botocore.session.Session()
+    client = _create_client(session, 'lambda')
+    policy = RetryPolicy()
+    policy.install(session, client)
+
+    # the limiter is asked before the request is signed and sent
+    with mock.patch.object(policy.get_limiter('lambda'), 'acquire',
+                           side_effect=_Acquired) as mocked_acquire:
+        with pytest.raises(_Acquired):
+            client.list_functions()
+    mocked_acquire.assert_called_once_with()
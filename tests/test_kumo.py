@@ -7,11 +7,12 @@ from nose.tools import assert_dict_equal
 from nose.tools import assert_equal, assert_true, \
     assert_regexp_matches, assert_list_equal, raises
 import pytest
+from mock import Mock
 
 from gcdt.kumo_core import _generate_parameters, \
     load_cloudformation_template, generate_template_file, _get_stack_name, \
     _get_stack_policy, _get_stack_policy_during_update, _get_conf_value, \
-    _generate_parameter_entry, _call_hook
+    _generate_parameter_entry, _call_hook, _get_new_stack_events
 
 from gcdt_testtools.helpers import cleanup_tempfiles, temp_folder  # fixtures!
 from gcdt_testtools.helpers import Bunch
@@ -250,3 +251,40 @@ def test_new_cloudformation_template_hooks():
     assert module.COUNTER['register'] == 1
     # currently deregister is not called (but we need that later!)
     #assert module.COUNTER['deregister'] == 1
+
+
+def test_get_new_stack_events_pages_until_seen_event():
+    # describe_stack_events returns the most recent events first
+    client = Mock()
+    client.describe_stack_events.side_effect = [
+        {'StackEvents': [{'EventId': 'e4', 'Timestamp': 4},
+                         {'EventId': 'e3', 'Timestamp': 3}],
+         'NextToken': 'token1'},
+        {'StackEvents': [{'EventId': 'e2', 'Timestamp': 2},
+                         {'EventId': 'e1', 'Timestamp': 1}],
+         'NextToken': 'token2'},
+    ]
+    seen_events = {'e2', 'e1'}
+    events = _get_new_stack_events(client, 'stack_id', seen_events)
+
+    assert [e['EventId'] for e in events] == ['e3', 'e4']
+    assert seen_events == {'e1', 'e2', 'e3', 'e4'}
+    # the third page is not requested since e2 was seen already
+    assert client.describe_stack_events.call_count == 2
+    client.describe_stack_events.assert_called_with(
+        StackName='stack_id', NextToken='token1')
+
+
+def test_get_new_stack_events_last_event():
+    client = Mock()
+    client.describe_stack_events.return_value = {
+        'StackEvents': [{'EventId': 'e3', 'Timestamp': 3},
+                        {'EventId': 'e2', 'Timestamp': 2},
+                        {'EventId': 'e1', 'Timestamp': 1}]
+    }
+    seen_events = set()
+    events = _get_new_stack_events(client, 'stack_id', seen_events,
+                                   last_event=2)
+
+    assert [e['EventId'] for e in events] == ['e3']
+    assert seen_events == {'e3'}
@@ -42,10 +42,11 @@ config_autoscaling = fix_old_kumo_config(read_json_config(
 
 
 @pytest.fixture(scope='function')  # 'function' or 'module'
-def simple_cloudformation_stack(awsclient):
+def simple_cloudformation_stack(awsclient, tmpdir):
     # create a stack we use for the test lifecycle
     #print_parameter_diff(awsclient, config_simple_stack)
-    are_credentials_still_valid(awsclient)
+    are_credentials_still_valid(
+        awsclient, str(tmpdir.join('credentials_check.json')))
     cloudformation_simple_stack, _ = load_cloudformation_template(
         here('resources/simple_cloudformation_stack/cloudformation.py')
     )
@@ -82,9 +83,10 @@ def sample_ec2_cloudformation_stack_folder():
 
 
 @pytest.fixture(scope='function')  # 'function' or 'module'
-def sample_cloudformation_stack_with_hooks(awsclient):
+def sample_cloudformation_stack_with_hooks(awsclient, tmpdir):
     # create a stack we use for the test lifecycle
-    are_credentials_still_valid(awsclient)
+    are_credentials_still_valid(
+        awsclient, str(tmpdir.join('credentials_check.json')))
     cloudformation_stack, _ = load_cloudformation_template(
         here('resources/sample_cloudformation_stack_with_hooks/cloudformation.py')
     )
@@ -214,8 +216,9 @@ def test_kumo_stack_lifecycle(awsclient, simple_cloudformation_stack):
 @pytest.mark.aws
 @check_preconditions
 def test_kumo_utils_ensure_autoscaling_ebs_tags(cleanup_stack_autoscaling,
-                                                awsclient):
-    are_credentials_still_valid(awsclient)
+                                                awsclient, tmpdir):
+    are_credentials_still_valid(
+        awsclient, str(tmpdir.join('credentials_check.json')))
     cloudformation_autoscaling, _ = load_cloudformation_template(
         here('resources/sample_autoscaling_cloudformation_stack/cloudformation.py')
     )
@@ -268,8 +271,9 @@ def test_kumo_utils_ensure_autoscaling_ebs_tags(cleanup_stack_autoscaling,
 
 @pytest.mark.aws
 @check_preconditions
-def test_kumo_utils_ensure_ebs_tags(cleanup_stack_ec2, awsclient):
-    are_credentials_still_valid(awsclient)
+def test_kumo_utils_ensure_ebs_tags(cleanup_stack_ec2, awsclient, tmpdir):
+    are_credentials_still_valid(
+        awsclient, str(tmpdir.join('credentials_check.json')))
     cloudformation_ec2, _ = load_cloudformation_template(
         here('resources/sample_ec2_cloudformation_stack/cloudformation.py')
     )
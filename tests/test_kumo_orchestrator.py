@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, print_function
+import io
+import json
+import os
+
+import mock
+
+from gcdt.kumo_orchestrator import read_stack_configs, \
+    get_stack_dependencies, deploy_all, _find_cycle, deploy_stack_process, \
+    get_stack_metrics_file
+
+from gcdt_testtools.helpers import temp_folder  # fixtures!
+
+
+def _stack(name, config=None, template=''):
+    kumo = {'stack': {'StackName': name}}
+    if config:
+        kumo.update(config)
+    return {'folder': name, 'stack_name': name, 'config': kumo,
+            'template': template}
+
+
+def test_read_stack_configs(temp_folder):
+    os.mkdir('infra')
+    with open(os.path.join('infra', 'gcdt_dev.json'), 'w') as jfile:
+        json.dump({'kumo': {'stack': {'StackName': 'infra-dev'}}}, jfile)
+    with open(os.path.join('infra', 'cloudformation.py'), 'w') as tfile:
+        tfile.write('# template')
+
+    stacks = read_stack_configs(['infra'], 'dev')
+    assert len(stacks) == 1
+    assert stacks[0]['stack_name'] == 'infra-dev'
+    assert stacks[0]['folder'] == 'infra'
+    assert stacks[0]['template'] == '# template'
+
+
+def test_get_stack_dependencies():
+    stacks = [
+        _stack('infra-dev'),
+        _stack('vpc-dev', {'dependsOn': ['infra-dev', 'unknown-dev']}),
+        _stack('app-dev', {'parameters': {
+            'VpcId': 'lookup:stack:vpc-dev:VpcId',
+            'DependentStack': 'infra-dev'}}),
+        _stack('api-dev',
+               template='get_outputs_for_stack(awsclient, \'app-dev\')\n')
+    ]
+    dependencies = get_stack_dependencies(stacks)
+
+    assert dependencies == {
+        'infra-dev': set(),
+        'vpc-dev': {'infra-dev'},
+        'app-dev': {'vpc-dev', 'infra-dev'},
+        'api-dev': {'app-dev'}
+    }
+
+
+def test_find_cycle():
+    assert _find_cycle({'a': {'b'}, 'b': set()}) is None
+    assert _find_cycle({'a': {'b'}, 'b': {'c'}, 'c': {'a'}}) == \
+        ['a', 'b', 'c', 'a']
+
+
+def test_deploy_all_order():
+    deployed = []
+
+    def _deploy(stack, override_stack_policy, verbose, metrics_file):
+        deployed.append(stack['stack_name'])
+        return 0
+
+    stacks = [
+        _stack('app-dev', {'dependsOn': ['vpc-dev']}),
+        _stack('vpc-dev', {'dependsOn': ['infra-dev']}),
+        _stack('infra-dev')
+    ]
+    exit_code = deploy_all(stacks, workers=2, deploy_func=_deploy)
+    assert exit_code == 0
+    assert deployed == ['infra-dev', 'vpc-dev', 'app-dev']
+
+
+def test_deploy_all_skips_dependents_of_failed_stack(capsys):
+    deployed = []
+
+    def _deploy(stack, override_stack_policy, verbose, metrics_file):
+        deployed.append(stack['stack_name'])
+        return 1 if stack['stack_name'] == 'infra-dev' else 0
+
+    stacks = [
+        _stack('infra-dev'),
+        _stack('app-dev', {'dependsOn': ['infra-dev']}),
+        _stack('other-dev')
+    ]
+    exit_code = deploy_all(stacks, deploy_func=_deploy)
+    assert exit_code == 1
+    assert sorted(deployed) == ['infra-dev', 'other-dev']
+    out, err = capsys.readouterr()
+    assert '[app-dev] skipped (dependency failed)' in out
+
+
+def test_deploy_all_cycle():
+    stacks = [
+        _stack('a-dev', {'dependsOn': ['b-dev']}),
+        _stack('b-dev', {'dependsOn': ['a-dev']})
+    ]
+    assert deploy_all(stacks, deploy_func=None) == 1
+
+
+def test_deploy_all_passes_global_options():
+    calls = []
+
+    def _deploy(stack, override_stack_policy, verbose, metrics_file):
+        calls.append((override_stack_policy, verbose, metrics_file))
+        return 0
+
+    assert deploy_all([_stack('infra-dev')], override_stack_policy=True,
+                      verbose=True, metrics_file='metrics.json',
+                      deploy_func=_deploy) == 0
+    assert calls == [(True, True, 'metrics.json')]
+
+
+@mock.patch('gcdt.kumo_orchestrator.subprocess.Popen')
+def test_deploy_stack_process_global_options(mocked_popen):
+    mocked_popen.return_value.stdout = io.BytesIO(b'deployed\n')
+    mocked_popen.return_value.wait.return_value = 0
+    stack = dict(_stack('infra-dev'), folder='infra')
+
+    assert deploy_stack_process(stack, override_stack_policy=True,
+                                verbose=True,
+                                metrics_file='metrics.json') == 0
+    command = mocked_popen.call_args[0][0]
+    assert command[1:] == [
+        '-m', 'gcdt.kumo_main', 'deploy', '--override-stack-policy', '-v',
+        '--metrics-file=%s' % os.path.abspath('metrics.infra-dev.json')]
+    assert mocked_popen.call_args[1]['cwd'] == 'infra'
+
+
+def test_get_stack_metrics_file():
+    assert get_stack_metrics_file('out/metrics.json', 'app-dev') == \
+        os.path.abspath('out/metrics.app-dev.json')
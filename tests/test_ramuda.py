@@ -15,13 +15,16 @@ from nose.tools import assert_regexp_matches
 import pytest
 import mock
 import maya
+from botocore.exceptions import ClientError
 
-from gcdt.ramuda_core import cleanup_bundle, bundle_lambda
+from gcdt.ramuda_core import cleanup_bundle, bundle_lambda, _create_lambda
 from gcdt.ramuda_utils import unit, \
     aggregate_datapoints, create_sha256, ProgressPercentage, \
     list_of_dict_equals, create_aws_s3_arn, get_rule_name_from_event_arn, \
     get_bucket_from_s3_arn, build_filter_rules, create_sha256_urlsafe, \
-    check_and_format_logs_params
+    check_and_format_logs_params, s3_upload
+from gcdt.ramuda_bundle import BundleArtifact
+from gcdt.s3 import ARTIFACT_INDEX_TTL
 from gcdt.utils import json2table
 from gcdt_testtools.helpers import create_tempfile, get_size, temp_folder, \
     cleanup_tempfiles
@@ -172,6 +175,96 @@ def test_bundle_lambda(temp_folder, logcapture):
     assert records[0][2] == 'Finished - a bundle.zip is waiting for you...'
 
 
+def test_s3_upload_streams_bundle(temp_folder):
+    with open('my_bundle.zip', 'wb') as zfile:
+        zfile.write(b'that was easy__')
+    bundle = BundleArtifact(filename='my_bundle.zip')
+    awsclient = mock.Mock()
+    client_s3 = awsclient.get_client.return_value
+    client_s3.meta.region_name = 'eu-west-1'
+    client_s3.head_object.side_effect = ClientError(
+        {'Error': {'Code': '404'}}, 'HeadObject')
+    upload = awsclient.get_uploader.return_value.upload
+    upload.return_value = {'ETag': 'etag', 'VersionId': 'version'}
+
+    dest_key, etag, version_id = \
+        s3_upload(awsclient, 'bucket', bundle, 'lambda')
+
+    assert dest_key == 'ramuda/eu-west-1/lambda/%s.zip' % \
+        bundle.sha256_urlsafe()
+    assert (etag, version_id) == ('etag', 'version')
+    # the bundle file is uploaded directly
+    fileobj = upload.call_args[0][0]
+    assert fileobj.name == 'my_bundle.zip'
+    assert upload.call_args[0][1:] == ('bucket', dest_key)
+
+    # the second upload is skipped (local index)
+    client_s3.head_object.reset_mock()
+    assert s3_upload(awsclient, 'bucket', bundle, 'lambda') == \
+        (dest_key, 'etag', 'version')
+    assert upload.call_count == 1
+    assert client_s3.head_object.call_count == 0
+
+    # expired index entry: the object is verified (deleted meanwhile)
+    with mock.patch('gcdt.s3.time.time',
+                    return_value=time.time() + ARTIFACT_INDEX_TTL + 1):
+        assert s3_upload(awsclient, 'bucket', bundle, 'lambda') == \
+            (dest_key, 'etag', 'version')
+    assert client_s3.head_object.call_count == 1
+    assert upload.call_count == 2
+
+
+def test_s3_upload_skips_present_bundle(temp_folder):
+    awsclient = mock.Mock()
+    client_s3 = awsclient.get_client.return_value
+    client_s3.meta.region_name = 'eu-west-1'
+    client_s3.head_object.return_value = {'ETag': 'etag',
+                                          'VersionId': 'version'}
+
+    dest_key, etag, version_id = \
+        s3_upload(awsclient, 'bucket', b'that was easy__', 'lambda')
+
+    assert (etag, version_id) == ('etag', 'version')
+    assert awsclient.get_uploader.call_count == 0
+    client_s3.head_object.assert_called_once_with(Bucket='bucket',
+                                                  Key=dest_key)
+
+
+@mock.patch('time.sleep')
+def test_create_lambda_waits_for_role_and_function(mocked_sleep):
+    awsclient = mock.Mock()
+    client_lambda = awsclient.get_client.return_value
+    client_lambda.create_function.side_effect = [
+        ClientError({'Error': {
+            'Code': 'InvalidParameterValueException',
+            'Message': 'The role defined for the function cannot be assumed '
+                       'by Lambda.'}}, 'CreateFunction'),
+        {'Version': '1'}
+    ]
+    client_lambda.get_function_configuration.side_effect = [
+        ClientError({'Error': {'Code': 'ResourceNotFoundException',
+                               'Message': ''}}, 'GetFunctionConfiguration'),
+        {'State': 'Pending'},
+        {'State': 'Active', 'LastUpdateStatus': 'Successful'}
+    ]
+
+    version = _create_lambda(awsclient, 'my_lambda', 'my_role', 'handler.py',
+                             'handler.handle', [], 'description', 300, 256,
+                             subnet_ids=['subnet'], security_groups=['sg'],
+                             zipfile=b'that was easy__')
+
+    assert version == '1'
+    assert client_lambda.create_function.call_count == 2
+    request = client_lambda.create_function.call_args[1]
+    assert request['VpcConfig'] == {'SubnetIds': ['subnet'],
+                                    'SecurityGroupIds': ['sg']}
+    assert request['Code'] == {'ZipFile': b'that was easy__'}
+    assert client_lambda.get_function_configuration.call_count == 3
+    # no configuration update after create
+    assert client_lambda.update_function_configuration.call_count == 0
+    assert mocked_sleep.call_count == 3
+
+
 LOGS_PARAM_CASES = [
     ('2w', '1w', False, '2014-12-18 03:00:00', '2014-12-25 03:00:00'),
     ('2w', '2d', False, '2014-12-18 03:00:00', '2014-12-30 03:00:00'),
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, print_function
+import os
+import time
+import zipfile
+
+import mock
+
+from gcdt import ramuda_bundle
+from gcdt.ramuda_bundle import build_bundle, collect_files, \
+    BundleArtifact, to_artifact, get_bundle
+from gcdt.ramuda_utils import create_sha256, create_sha256_urlsafe
+
+from gcdt_testtools.helpers import temp_folder  # fixtures!
+
+
+def _write(filename, content):
+    folder = os.path.dirname(filename)
+    if folder and not os.path.isdir(folder):
+        os.makedirs(folder)
+    with open(filename, 'w') as f:
+        f.write(content)
+
+
+def _read_bundle(bundle_file='bundle.zip'):
+    with open(bundle_file, 'rb') as f:
+        return f.read()
+
+
+FOLDERS = [
+    {'source': 'src', 'target': ''},
+    {'source': 'vendored', 'target': 'vendored'},
+    {'source': 'settings_*.json', 'target': ''}
+]
+
+
+def _create_sources():
+    _write('src/handler.py', 'def handle(event, context):\n    pass\n')
+    _write('src/handler.pyc', 'compiled')
+    _write('vendored/lib/__init__.py', '# lib\n')
+    _write('settings_dev.json', '{}')
+
+
+def test_collect_files(temp_folder):
+    _create_sources()
+    files = collect_files(FOLDERS)
+    assert [arcname for arcname, _ in files] == [
+        'handler.py', 'settings_dev.json', 'vendored/lib/__init__.py']
+
+
+def test_build_bundle_deterministic(temp_folder):
+    _create_sources()
+    bundle_file, changed = build_bundle(FOLDERS)
+    assert changed
+    first = _read_bundle()
+    with zipfile.ZipFile(bundle_file) as zf:
+        assert zf.namelist() == [
+            'handler.py', 'settings_dev.json', 'vendored/lib/__init__.py']
+        assert zf.getinfo('handler.py').date_time == (1980, 1, 1, 0, 0, 0)
+        assert zf.read('vendored/lib/__init__.py') == b'# lib\n'
+
+    # a fresh build of the same content results in the same bundle
+    os.unlink(bundle_file)
+    os.unlink(ramuda_bundle.BUNDLE_MANIFEST_FILE)
+    os.utime('src/handler.py', (time.time() + 10, time.time() + 10))
+    build_bundle(FOLDERS)
+    assert create_sha256(_read_bundle()) == create_sha256(first)
+
+
+def test_build_bundle_unchanged(temp_folder):
+    _create_sources()
+    build_bundle(FOLDERS)
+    with mock.patch.object(ramuda_bundle, '_file_sha256') as sha256:
+        bundle_file, changed = build_bundle(FOLDERS)
+    assert not changed
+    assert sha256.call_count == 0
+
+
+def test_build_bundle_incremental(temp_folder):
+    _create_sources()
+    build_bundle(FOLDERS)
+
+    _write('src/handler.py', 'def handle(event, context):\n    return 42\n')
+    with mock.patch.object(ramuda_bundle, '_file_sha256',
+                           wraps=ramuda_bundle._file_sha256) as sha256:
+        bundle_file, changed = build_bundle(FOLDERS)
+    assert changed
+    # only the changed file is hashed again
+    sha256.assert_called_once_with('src/handler.py')
+    with zipfile.ZipFile(bundle_file) as zf:
+        assert zf.testzip() is None
+        assert zf.read('handler.py') == \
+            b'def handle(event, context):\n    return 42\n'
+        assert zf.read('settings_dev.json') == b'{}'
+        assert zf.read('vendored/lib/__init__.py') == b'# lib\n'
+
+    # and the result is the same as a fresh build
+    incremental = _read_bundle()
+    os.unlink(ramuda_bundle.BUNDLE_MANIFEST_FILE)
+    build_bundle(FOLDERS)
+    assert _read_bundle() == incremental
+
+
+def test_build_bundle_removed_file(temp_folder):
+    _create_sources()
+    build_bundle(FOLDERS)
+    os.unlink('settings_dev.json')
+
+    bundle_file, changed = build_bundle(FOLDERS)
+    assert changed
+    with zipfile.ZipFile(bundle_file) as zf:
+        assert zf.namelist() == ['handler.py', 'vendored/lib/__init__.py']
+
+
+def test_bundle_artifact_file(temp_folder):
+    _write('bundle.zip', 'that was easy__')
+    bundle = BundleArtifact(filename='bundle.zip')
+
+    assert bundle.size == 15
+    assert bundle.read() == b'that was easy__'
+    assert bundle.sha256() == create_sha256(b'that was easy__').decode('ascii')
+    assert bundle.sha256_urlsafe() == \
+        create_sha256_urlsafe(b'that was easy__').decode('ascii')
+
+    bundle.save('copy.zip')
+    assert _read_bundle('copy.zip') == b'that was easy__'
+    # saving to the same file is a noop
+    bundle.save('bundle.zip')
+    assert _read_bundle('bundle.zip') == b'that was easy__'
+
+
+def test_bundle_artifact_bytes(temp_folder):
+    bundle = to_artifact(b'that was easy__')
+
+    assert bundle.size == 15
+    assert bundle.filename is None
+    with bundle.open() as f:
+        assert f.read() == b'that was easy__'
+    assert bundle.sha256() == create_sha256(b'that was easy__').decode('ascii')
+    assert to_artifact(bundle) is bundle
+    assert to_artifact(b'') is None
+    assert to_artifact(None) is None
+
+
+def test_get_bundle(temp_folder):
+    _write('my_bundle.zip', 'that was easy__')
+    bundle = get_bundle({'_bundle_file': 'my_bundle.zip',
+                         '_zipfile': b'other'})
+    assert bundle.filename == 'my_bundle.zip'
+    assert bundle.size == 15
+
+    bundle = get_bundle({'_zipfile': b'that was easy__'})
+    assert bundle.filename is None
+    assert bundle.read() == b'that was easy__'
@@ -3,6 +3,7 @@ from __future__ import unicode_literals, print_function
 import os
 import time
 import logging
+import zipfile
 from tempfile import NamedTemporaryFile
 
 import pytest
@@ -218,6 +219,18 @@ def test_bundle_cmd(temp_folder, logcapture):
     )
 
 
+def test_bundle_cmd_bundle_file(temp_folder):
+    with open('my_bundle.zip', 'wb') as zfile:
+        zfile.write(b'some_file')
+    tooldata = {
+        'context': {'_bundle_file': 'my_bundle.zip', '_zipfile': None}
+    }
+    tooldata['context']['_arguments'] = {'--keep': False}
+    assert bundle_cmd(False, **tooldata) == 0
+    with open('bundle.zip', 'rb') as zfile:
+        assert zfile.read() == b'some_file'
+
+
 @pytest.mark.aws
 @check_preconditions
 def test_logs_cmd(awsclient, vendored_folder, temp_lambda, logcapture):
@@ -235,3 +248,27 @@ def test_logs_cmd(awsclient, vendored_folder, temp_lambda, logcapture):
 
     assert records[3][1] == 'INFO'
     assert "{u'ramuda_action': u'ping'}" in records[3][2]
+
+
+def test_bundle_cmd_python_function(temp_folder, logcapture):
+    # python functions are bundled by gcdt (not the bundler plugin)
+    os.mkdir('impl')
+    with open(os.path.join('impl', 'code.py'), 'w') as cfile:
+        cfile.write('# code')
+    tooldata = {
+        'context': {'_zipfile': b'from the bundler'},
+        'config': {
+            'lambda': {'name': 'first', 'runtime': 'python2.7'},
+            'bundling': {'folders': [{'source': './impl', 'target': '.'}]}
+        }
+    }
+    assert bundle_cmd(False, **tooldata) == 0
+    assert tooldata['context']['_bundle_file'] == \
+        os.path.join('.gcdt', 'bundles', 'first.zip')
+    with zipfile.ZipFile('bundle.zip') as zfile:
+        assert zfile.namelist() == ['code.py']
+
+    # the bundle step is skipped if nothing changed
+    assert bundle_cmd(False, **tooldata) == 0
+    records = list(logcapture.actual())
+    assert records[-1][2] == 'bundle.zip is up to date'
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, print_function
+import json
+import os
+import zipfile
+
+import mock
+
+from gcdt.ramuda_bundle import BundleArtifact
+from gcdt.ramuda_orchestrator import get_function_configs, build_bundles, \
+    deploy_all, get_bundle_folders, build_config_bundle
+
+from gcdt_testtools.helpers import temp_folder  # fixtures!
+
+
+def _function(name, folder='.'):
+    return {
+        'lambda': {'name': name},
+        'bundling': {'folders': [{'source': folder, 'target': '.'}]}
+    }
+
+
+def test_get_function_configs():
+    config = {
+        'deployment': {'artifactBucket': 'shared-bucket'},
+        'failDeploymentOnUnsuccessfulPing': True,
+        'functions': [
+            _function('first'),
+            dict(_function('second'),
+                 deployment={'artifactBucket': 'own-bucket'})
+        ]
+    }
+
+    configs = get_function_configs(config)
+
+    assert [c['lambda']['name'] for c in configs] == ['first', 'second']
+    assert configs[0]['deployment']['artifactBucket'] == 'shared-bucket'
+    assert configs[1]['deployment']['artifactBucket'] == 'own-bucket'
+    assert configs[1]['failDeploymentOnUnsuccessfulPing']
+    assert 'functions' not in configs[0]
+    # the shared config is not modified
+    assert config['deployment']['artifactBucket'] == 'shared-bucket'
+
+
+def test_build_bundles(temp_folder):
+    for name in ['first', 'second']:
+        os.mkdir(name)
+        with open(os.path.join(name, 'handler.py'), 'w') as hfile:
+            hfile.write('# %s' % name)
+
+    bundles = build_bundles([_function('first', 'first'),
+                             _function('second', 'second'),
+                             _function('third', 'third')],
+                            bundle_dir='bundles')
+
+    assert isinstance(bundles['first'], BundleArtifact)
+    with zipfile.ZipFile(bundles['second'].filename) as zfile:
+        assert zfile.read('handler.py') == b'# second'
+    # empty bundle (source folder does not exist)
+    with zipfile.ZipFile(bundles['third'].filename) as zfile:
+        assert zfile.namelist() == []
+
+
+def test_build_bundles_like_bundler(temp_folder):
+    # handler file, settings and requirements are added to the bundle
+    os.mkdir('impl')
+    with open(os.path.join('impl', 'code.py'), 'w') as cfile:
+        cfile.write('# code')
+    with open('handler.py', 'w') as hfile:
+        hfile.write('# handler')
+    with open('requirements.txt', 'w') as rfile:
+        rfile.write('requests')
+    config = _function('first', 'impl')
+    config['lambda']['handlerFile'] = 'handler.py'
+    config['lambda']['settings'] = {'MYVALUE': 'FOO'}
+
+    def _pip_install(args):
+        package_folder = os.path.join(args[-1], 'requests')
+        os.makedirs(package_folder)
+        with open(os.path.join(package_folder, '__init__.py'), 'w') as pfile:
+            pfile.write('# requests')
+
+    with mock.patch('subprocess.check_call',
+                    side_effect=_pip_install) as mocked_check_call:
+        bundles = build_bundles([config], bundle_dir='bundles')
+        # the installed requirements are reused
+        build_bundles([config], bundle_dir='bundles')
+    assert mocked_check_call.call_count == 1
+
+    with zipfile.ZipFile(bundles['first'].filename) as zfile:
+        assert sorted(zfile.namelist()) == [
+            'code.py', 'handler.py', 'requests/__init__.py', 'settings.json']
+        assert json.loads(zfile.read('settings.json').decode('utf-8')) == \
+            {'MYVALUE': 'FOO'}
+
+
+def test_build_config_bundle(temp_folder):
+    os.mkdir('impl')
+    with open(os.path.join('impl', 'code.py'), 'w') as cfile:
+        cfile.write('# code')
+    config = _function('first', 'impl')
+
+    bundle_file, changed = build_config_bundle(config, bundle_dir='bundles')
+    assert bundle_file == os.path.join('bundles', 'first.zip')
+    assert changed
+    with zipfile.ZipFile(bundle_file) as zfile:
+        assert zfile.namelist() == ['code.py']
+
+    # unchanged bundle is not built again
+    assert build_config_bundle(config, bundle_dir='bundles') == \
+        (bundle_file, False)
+
+
+def test_get_bundle_folders_settings_unchanged(temp_folder):
+    config = _function('first')
+    config['lambda']['settings'] = {'MYVALUE': 'FOO'}
+    settings_file = get_bundle_folders(config, bundle_dir='bundles')[-1][
+        'source']
+    os.utime(settings_file, (1, 1))
+
+    # not written again so the bundle is not rebuilt
+    get_bundle_folders(config, bundle_dir='bundles')
+    assert os.path.getmtime(settings_file) == 1
+
+
+def test_install_requirements_failed(temp_folder):
+    with open('requirements.txt', 'w') as rfile:
+        rfile.write('requests')
+    with mock.patch('subprocess.check_call',
+                    side_effect=Exception('pip failed')):
+        bundles = build_bundles([_function('first')], bundle_dir='bundles')
+    assert isinstance(bundles['first'], Exception)
+
+
+def test_deploy_all_nodejs():
+    config = {'functions': [_function('first'), _function('second')]}
+    config['functions'][1]['lambda']['runtime'] = 'nodejs6.10'
+    build = mock.Mock()
+
+    assert deploy_all(mock.Mock(), config, build_func=build) == 1
+    assert build.call_count == 0
+
+
+def test_deploy_all(capsys):
+    config = {'functions': [_function('first'), _function('second'),
+                            _function('third')]}
+    deployed = []
+
+    def _build(function_configs, workers):
+        return {'first': BundleArtifact(data=b'first'),
+                'second': Exception('bundling failed'),
+                'third': BundleArtifact(data=b'third')}
+
+    def _deploy(awsclient, function_config, zipfile):
+        deployed.append(function_config['lambda']['name'])
+        assert zipfile.read() == function_config['lambda']['name'].encode()
+        return 0
+
+    exit_code = deploy_all(mock.Mock(), config, workers=2,
+                           deploy_func=_deploy, build_func=_build)
+
+    assert exit_code == 1
+    assert sorted(deployed) == ['first', 'third']
+    out, _ = capsys.readouterr()
+    assert 'failed (bundle)' in out
+    assert out.count('succeeded') == 2
+
+
+def test_deploy_all_deployment_exception():
+    config = {'functions': [_function('first'), _function('second')]}
+
+    def _build(function_configs, workers):
+        return dict([(c['lambda']['name'], BundleArtifact(data=b'bundle'))
+                     for c in function_configs])
+
+    def _deploy(awsclient, function_config, zipfile):
+        if function_config['lambda']['name'] == 'second':
+            raise Exception('deployment failed')
+        return 0
+
+    assert deploy_all(mock.Mock(), config, deploy_func=_deploy,
+                      build_func=_build) == 1
+    assert deploy_all(mock.Mock(), {'functions': [_function('first')]},
+                      deploy_func=_deploy, build_func=_build) == 0
+
+
+def test_deploy_all_duplicate_names():
+    config = {'functions': [_function('first'), _function('first')]}
+    build = mock.Mock()
+
+    assert deploy_all(mock.Mock(), config, build_func=build) == 1
+    assert build.call_count == 0
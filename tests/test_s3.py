@@ -1,14 +1,24 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals, print_function
+import datetime
 import logging
+import os
+import threading
+import time
 
+import mock
 import pytest
+from botocore.exceptions import ClientError
 
 from gcdt import utils
-from gcdt.s3 import bucket_exists, upload_file_to_s3, ls
+from gcdt.s3 import bucket_exists, upload_file_to_s3, ls, S3Uploader, \
+    TransferConfig, MB, iter_object_versions, delete_object_versions, \
+    select_expired_versions, cleanup_artifacts, get_object_info, \
+    get_indexed_artifact, add_indexed_artifact, remove_indexed_artifacts, \
+    ARTIFACT_INDEX_TTL, UPLOAD_STATE_TTL
 
 from gcdt_testtools.helpers_aws import awsclient, temp_bucket  # fixtures!
-from gcdt_testtools.helpers import random_file  # fixtures!
+from gcdt_testtools.helpers import random_file, temp_folder  # fixtures!
 from gcdt_testtools import helpers
 
 log = logging.getLogger(__name__)
@@ -27,3 +37,296 @@ def test_bucket_does_not_exist(awsclient):
 def test_upload_file_to_s3(awsclient, temp_bucket, random_file):
     upload_file_to_s3(awsclient, temp_bucket, 'content.txt', random_file)
     assert 'content.txt' in ls(awsclient, temp_bucket)
+
+
+def _create_file(filename, size):
+    with open(filename, 'wb') as f:
+        f.write(b'x' * size)
+
+
+def _uploader(client_s3):
+    config = TransferConfig(multipart_chunksize=5 * MB, max_concurrency=2,
+                            state_dir='state')
+    return S3Uploader(client_s3, config)
+
+
+def test_uploader_put_object(temp_folder):
+    _create_file('small.txt', 100)
+    client_s3 = mock.Mock()
+    client_s3.put_object.return_value = {'ETag': 'etag', 'VersionId': 'v1'}
+    callback = mock.Mock()
+
+    response = _uploader(client_s3).upload('small.txt', 'bucket', 'key',
+                                           callback=callback)
+    assert response == {'ETag': 'etag', 'VersionId': 'v1'}
+    assert client_s3.create_multipart_upload.call_count == 0
+    callback.assert_called_once_with(100)
+
+
+def test_uploader_multipart(temp_folder):
+    _create_file('large.bin', 11 * MB)
+    client_s3 = mock.Mock()
+    client_s3.create_multipart_upload.return_value = {'UploadId': 'upload'}
+    client_s3.upload_part.side_effect = \
+        lambda **kwargs: {'ETag': 'etag%d' % kwargs['PartNumber']}
+    client_s3.complete_multipart_upload.return_value = {
+        'ETag': 'etag', 'VersionId': 'v1'}
+
+    response = _uploader(client_s3).upload('large.bin', 'bucket', 'key')
+    assert response == {'ETag': 'etag', 'VersionId': 'v1'}
+    assert client_s3.upload_part.call_count == 3
+    client_s3.complete_multipart_upload.assert_called_once_with(
+        Bucket='bucket', Key='key', UploadId='upload',
+        MultipartUpload={'Parts': [
+            {'ETag': 'etag1', 'PartNumber': 1},
+            {'ETag': 'etag2', 'PartNumber': 2},
+            {'ETag': 'etag3', 'PartNumber': 3}]})
+    # state of finished uploads is removed
+    assert os.listdir('state') == []
+
+
+def test_uploader_multipart_resume(temp_folder):
+    _create_file('large.bin', 11 * MB)
+    client_s3 = mock.Mock()
+    client_s3.create_multipart_upload.return_value = {'UploadId': 'upload'}
+    client_s3.upload_part.side_effect = [
+        {'ETag': 'etag1'}, utils.GracefulExit('SIGTERM'),
+        utils.GracefulExit('SIGTERM')]
+
+    with pytest.raises(utils.GracefulExit):
+        _uploader(client_s3).upload('large.bin', 'bucket', 'key')
+    assert len(os.listdir('state')) == 1
+    assert client_s3.abort_multipart_upload.call_count == 0
+
+    # second run only uploads the missing parts
+    client_s3.upload_part.reset_mock()
+    client_s3.upload_part.side_effect = \
+        lambda **kwargs: {'ETag': 'etag%d' % kwargs['PartNumber']}
+    client_s3.list_parts.return_value = {
+        'Parts': [{'PartNumber': 1, 'ETag': 'etag1'}], 'IsTruncated': False}
+    _uploader(client_s3).upload('large.bin', 'bucket', 'key')
+
+    assert client_s3.create_multipart_upload.call_count == 1
+    assert sorted([c[1]['PartNumber'] for c in
+                   client_s3.upload_part.call_args_list]) == [2, 3]
+    client_s3.list_parts.assert_called_once_with(
+        Bucket='bucket', Key='key', UploadId='upload')
+    assert os.listdir('state') == []
+
+
+def test_uploader_multipart_resume_upload_gone(temp_folder):
+    _create_file('large.bin', 6 * MB)
+    client_s3 = mock.Mock()
+    client_s3.create_multipart_upload.side_effect = [
+        {'UploadId': 'upload1'}, {'UploadId': 'upload2'}]
+    client_s3.upload_part.side_effect = utils.GracefulExit('SIGTERM')
+    with pytest.raises(utils.GracefulExit):
+        _uploader(client_s3).upload('large.bin', 'bucket', 'key')
+
+    # the unfinished upload was aborted in the meantime
+    client_s3.list_parts.side_effect = ClientError(
+        {'Error': {'Code': 'NoSuchUpload'}}, 'ListParts')
+    client_s3.upload_part.side_effect = \
+        lambda **kwargs: {'ETag': 'etag%d' % kwargs['PartNumber']}
+    _uploader(client_s3).upload('large.bin', 'bucket', 'key')
+    assert client_s3.complete_multipart_upload.call_args[1]['UploadId'] == \
+        'upload2'
+
+
+def test_uploader_multipart_abort_stale_uploads(temp_folder):
+    _create_file('large.bin', 6 * MB)
+    client_s3 = mock.Mock()
+    client_s3.create_multipart_upload.side_effect = [
+        {'UploadId': 'upload1'}, {'UploadId': 'upload2'}]
+    client_s3.upload_part.side_effect = utils.GracefulExit('SIGTERM')
+    with pytest.raises(utils.GracefulExit):
+        _uploader(client_s3).upload('large.bin', 'bucket', 'key')
+    state_file = os.path.join('state', os.listdir('state')[0])
+
+    # the upload was not resumed in time
+    stale = time.time() - UPLOAD_STATE_TTL - 1
+    os.utime(state_file, (stale, stale))
+    client_s3.upload_part.side_effect = \
+        lambda **kwargs: {'ETag': 'etag%d' % kwargs['PartNumber']}
+    _uploader(client_s3).upload('large.bin', 'bucket', 'key')
+
+    client_s3.abort_multipart_upload.assert_called_once_with(
+        Bucket='bucket', Key='key', UploadId='upload1')
+    assert client_s3.list_parts.call_count == 0
+    assert client_s3.complete_multipart_upload.call_args[1]['UploadId'] == \
+        'upload2'
+    assert os.listdir('state') == []
+
+
+def test_uploader_multipart_abort_on_chunksize_change(temp_folder):
+    _create_file('large.bin', 11 * MB)
+    client_s3 = mock.Mock()
+    client_s3.create_multipart_upload.side_effect = [
+        {'UploadId': 'upload1'}, {'UploadId': 'upload2'}]
+    client_s3.upload_part.side_effect = utils.GracefulExit('SIGTERM')
+    with pytest.raises(utils.GracefulExit):
+        _uploader(client_s3).upload('large.bin', 'bucket', 'key')
+
+    client_s3.upload_part.reset_mock()
+    client_s3.upload_part.side_effect = \
+        lambda **kwargs: {'ETag': 'etag%d' % kwargs['PartNumber']}
+    config = TransferConfig(multipart_chunksize=6 * MB, state_dir='state')
+    S3Uploader(client_s3, config).upload('large.bin', 'bucket', 'key')
+
+    client_s3.abort_multipart_upload.assert_called_once_with(
+        Bucket='bucket', Key='key', UploadId='upload1')
+    assert client_s3.upload_part.call_count == 2
+
+
+def test_uploader_shutdown(temp_folder):
+    _create_file('large.bin', 6 * MB)
+    client_s3 = mock.Mock()
+    client_s3.create_multipart_upload.return_value = {'UploadId': 'upload'}
+    client_s3.upload_part.return_value = {'ETag': 'etag'}
+    uploader = _uploader(client_s3)
+    uploader.upload('large.bin', 'bucket', 'key')
+    executor = uploader._executor
+
+    uploader.shutdown()
+    assert uploader._executor is None
+    with pytest.raises(RuntimeError):
+        executor.submit(lambda: None)
+    # uploads after shutdown use a new executor
+    uploader.upload('large.bin', 'bucket', 'key')
+    uploader.shutdown()
+
+
+def _version(key, minute, version_id=None, delete_marker=False):
+    return {'Key': key, 'VersionId': version_id or '%s-%d' % (key, minute),
+            'LastModified': datetime.datetime(2017, 8, 1, 12, minute),
+            'IsDeleteMarker': delete_marker}
+
+
+def _s3_awsclient(pages):
+    awsclient = mock.Mock()
+    client_s3 = awsclient.get_client.return_value
+    client_s3.can_paginate.return_value = True
+    client_s3.get_paginator.return_value.paginate.return_value = pages
+    client_s3.delete_objects.return_value = {}
+    return awsclient, client_s3
+
+
+@pytest.mark.parametrize('code', ['403', '404', 'NoSuchKey'])
+def test_get_object_info_missing(code):
+    awsclient = mock.Mock()
+    awsclient.get_client.return_value.head_object.side_effect = ClientError(
+        {'Error': {'Code': code}}, 'HeadObject')
+    assert get_object_info(awsclient, 'bucket', 'key') is None
+
+
+def test_artifact_index(temp_folder):
+    index_file = os.path.join('.gcdt', 'artifact_index.json')
+    add_indexed_artifact('bucket', 'key', 'etag', 'version',
+                         index_file=index_file)
+    assert get_indexed_artifact('bucket', 'key', index_file=index_file) == \
+        ('etag', 'version')
+    assert get_indexed_artifact('bucket', 'other', index_file=index_file) \
+        is None
+
+    # expired entries are not trusted
+    with mock.patch('gcdt.s3.time.time',
+                    return_value=time.time() + ARTIFACT_INDEX_TTL + 1):
+        assert get_indexed_artifact('bucket', 'key',
+                                    index_file=index_file) is None
+
+    remove_indexed_artifacts('bucket', ['key'], index_file=index_file)
+    assert get_indexed_artifact('bucket', 'key', index_file=index_file) \
+        is None
+
+
+def test_artifact_index_concurrent_updates(temp_folder):
+    index_file = os.path.join('.gcdt', 'artifact_index.json')
+    keys = ['key%d' % i for i in range(20)]
+    threads = [threading.Thread(target=add_indexed_artifact,
+                                args=('bucket', key, 'etag', 'version'),
+                                kwargs={'index_file': index_file})
+               for key in keys]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # no update is lost
+    for key in keys:
+        assert get_indexed_artifact('bucket', key, index_file=index_file) == \
+            ('etag', 'version')
+
+
+def test_iter_object_versions():
+    pages = [
+        {'Versions': [_version('a', 2), _version('a', 1)],
+         'DeleteMarkers': [_version('a', 3)]},
+        {'Versions': [_version('b', 1)]}
+    ]
+    for v in pages[0]['Versions'] + pages[1]['Versions']:
+        del v['IsDeleteMarker']
+    awsclient, client_s3 = _s3_awsclient(pages)
+
+    versions = list(iter_object_versions(awsclient, 'bucket', 'ramuda/'))
+
+    assert [(v['VersionId'], v['IsDeleteMarker']) for v in versions] == [
+        ('a-3', True), ('a-2', False), ('a-1', False), ('b-1', False)]
+    client_s3.get_paginator.assert_called_once_with('list_object_versions')
+    client_s3.get_paginator.return_value.paginate.assert_called_once_with(
+        Bucket='bucket', Prefix='ramuda/')
+
+
+def test_delete_object_versions():
+    awsclient, client_s3 = _s3_awsclient([])
+    client_s3.delete_objects.side_effect = [
+        {}, {}, {'Errors': [{'Key': 'k', 'VersionId': 'v', 'Message': 'x'}]}]
+    versions = (_version('key%d' % i, 1) for i in range(25))
+    progress = mock.Mock()
+
+    assert delete_object_versions(awsclient, 'bucket', versions, workers=2,
+                                  batch_size=10, progress=progress) == (24, 1)
+    assert client_s3.delete_objects.call_count == 3
+    batch_sizes = sorted([len(c[1]['Delete']['Objects'])
+                          for c in client_s3.delete_objects.call_args_list])
+    assert batch_sizes == [5, 10, 10]
+    assert progress.call_count == 3
+
+
+def test_select_expired_versions():
+    versions = [
+        _version('kumo/eu-west-1/stack-cloudformation.json', 3),
+        _version('kumo/eu-west-1/stack-cloudformation.json', 2),
+        _version('kumo/eu-west-1/stack-cloudformation.json', 1),
+        _version('ramuda/eu-west-1/fn/aaa.zip', 5),
+        _version('ramuda/eu-west-1/fn/bbb.zip', 9, delete_marker=True),
+        _version('ramuda/eu-west-1/fn/bbb.zip', 1),
+        _version('ramuda/eu-west-1/fn/ccc.zip', 7),
+        _version('ramuda/eu-west-1/other/ddd.zip', 1),
+    ]
+
+    expired = list(select_expired_versions(iter(versions), keep=2))
+
+    assert sorted([v['VersionId'] for v in expired]) == [
+        'kumo/eu-west-1/stack-cloudformation.json-1',
+        'ramuda/eu-west-1/fn/bbb.zip-1',
+        'ramuda/eu-west-1/fn/bbb.zip-9'  # no version left
+    ]
+
+
+@mock.patch('gcdt.s3.remove_indexed_artifacts')
+def test_cleanup_artifacts(mocked_remove_indexed_artifacts):
+    pages = [{'Versions': [_version('ramuda/eu-west-1/fn/aaa.zip', 2),
+                           _version('ramuda/eu-west-1/fn/bbb.zip', 1)]}]
+    awsclient, client_s3 = _s3_awsclient(pages)
+
+    assert cleanup_artifacts(awsclient, 'bucket', keep=1,
+                             prefixes=['ramuda/'], dry_run=True) == (1, 0)
+    assert client_s3.delete_objects.call_count == 0
+
+    assert cleanup_artifacts(awsclient, 'bucket', keep=1,
+                             prefixes=['ramuda/']) == (1, 0)
+    client_s3.delete_objects.assert_called_once_with(
+        Bucket='bucket', Delete={'Objects': [
+            {'Key': 'ramuda/eu-west-1/fn/bbb.zip',
+             'VersionId': 'ramuda/eu-west-1/fn/bbb.zip-1'}], 'Quiet': True})
+    mocked_remove_indexed_artifacts.assert_called_once_with(
+        'bucket', set(['ramuda/eu-west-1/fn/bbb.zip']))
@@ -1,11 +1,104 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals, print_function
 from datetime import datetime
+import os
+import time
+import weakref
 
-from gcdt.servicediscovery import parse_ts
+import mock
 import pytest
 
+from gcdt import servicediscovery
+from gcdt.servicediscovery import parse_ts, get_outputs_for_stack, \
+    invalidate_outputs_for_stack
+from gcdt_testtools.helpers import temp_folder  # fixtures!
+
 
 def test_parse_ts():
     assert parse_ts('2016-06-22T06:51:59.000Z') == \
         datetime(2016, 6, 22, 6, 51, 59, 0)
+
+
+def _awsclient_describe_stacks(outputs, account_id='123456789012'):
+    # awsclient which returns the given outputs from describe_stacks
+    client_cf = mock.Mock()
+    client_cf.meta.region_name = 'eu-west-1'
+    client_cf.describe_stacks.return_value = {
+        'Stacks': [{'Outputs': [{'OutputKey': k, 'OutputValue': v}
+                                for k, v in outputs.items()]}]
+    }
+    awsclient = mock.Mock()
+    awsclient.get_client.return_value = client_cf
+    awsclient.get_account_id.return_value = account_id
+    return awsclient, client_cf
+
+
+@pytest.fixture(scope='function')
+def stack_outputs_cache(temp_folder, monkeypatch):
+    # use an empty cache located in the temp folder
+    monkeypatch.setattr(servicediscovery, '_stack_outputs_cache',
+                        weakref.WeakKeyDictionary())
+    monkeypatch.setattr(servicediscovery, 'STACK_OUTPUTS_CACHE_FILE',
+                        os.path.join(temp_folder[0], 'stack_outputs.json'))
+    monkeypatch.delenv('GCDT_STACK_OUTPUTS_CACHE_TTL', raising=False)
+
+
+def test_get_outputs_for_stack_memoized(stack_outputs_cache):
+    awsclient, client_cf = _awsclient_describe_stacks({'BucketName': 'b'})
+
+    assert get_outputs_for_stack(awsclient, 'stack') == {'BucketName': 'b'}
+    assert get_outputs_for_stack(awsclient, 'stack') == {'BucketName': 'b'}
+    assert client_cf.describe_stacks.call_count == 1
+    assert not os.path.isfile(servicediscovery.STACK_OUTPUTS_CACHE_FILE)
+
+    invalidate_outputs_for_stack(awsclient, 'stack')
+    get_outputs_for_stack(awsclient, 'stack')
+    assert client_cf.describe_stacks.call_count == 2
+
+    # the cache is per run (awsclient)
+    awsclient2, client_cf2 = _awsclient_describe_stacks({'BucketName': 'c'})
+    assert get_outputs_for_stack(awsclient2, 'stack') == {'BucketName': 'c'}
+
+
+def test_get_outputs_for_stack_returns_copy(stack_outputs_cache):
+    awsclient, client_cf = _awsclient_describe_stacks({'BucketName': 'b'})
+    get_outputs_for_stack(awsclient, 'stack')['BucketName'] = 'modified'
+    assert get_outputs_for_stack(awsclient, 'stack') == {'BucketName': 'b'}
+
+
+def test_get_outputs_for_stack_disk_cache(stack_outputs_cache, monkeypatch):
+    monkeypatch.setenv('GCDT_STACK_OUTPUTS_CACHE_TTL', '300')
+    awsclient, client_cf = _awsclient_describe_stacks({'BucketName': 'b'})
+    get_outputs_for_stack(awsclient, 'stack')
+    assert os.path.isfile(servicediscovery.STACK_OUTPUTS_CACHE_FILE)
+
+    # a new run (awsclient) uses the on-disk cache
+    awsclient2, client_cf2 = _awsclient_describe_stacks({'BucketName': 'c'})
+    assert get_outputs_for_stack(awsclient2, 'stack') == {'BucketName': 'b'}
+    assert client_cf2.describe_stacks.call_count == 0
+
+    # the on-disk cache is keyed by account
+    awsclient3, client_cf3 = _awsclient_describe_stacks(
+        {'BucketName': 'c'}, account_id='210987654321')
+    assert get_outputs_for_stack(awsclient3, 'stack') == {'BucketName': 'c'}
+    assert client_cf3.describe_stacks.call_count == 1
+
+    # invalidation removes the stack from the on-disk cache, too
+    invalidate_outputs_for_stack(awsclient, 'stack')
+    awsclient4, client_cf4 = _awsclient_describe_stacks({'BucketName': 'd'})
+    assert get_outputs_for_stack(awsclient4, 'stack') == {'BucketName': 'd'}
+    assert client_cf4.describe_stacks.call_count == 1
+
+
+def test_get_outputs_for_stack_disk_cache_expired(stack_outputs_cache,
+                                                  monkeypatch):
+    monkeypatch.setenv('GCDT_STACK_OUTPUTS_CACHE_TTL', '300')
+    awsclient, client_cf = _awsclient_describe_stacks({'BucketName': 'b'})
+    get_outputs_for_stack(awsclient, 'stack')
+
+    monkeypatch.setattr(servicediscovery, '_stack_outputs_cache',
+                        weakref.WeakKeyDictionary())
+    now = time.time()
+    monkeypatch.setattr(servicediscovery.time, 'time', lambda: now + 301)
+    get_outputs_for_stack(awsclient, 'stack')
+    assert client_cf.describe_stacks.call_count == 2
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, print_function
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from . import here
+
+
+# cold startup of `ramuda version` must not exceed this (seconds)
+STARTUP_BUDGET = 1.0
+
+# modules which are only needed by some commands
+HEAVY_MODULES = ['maya', 'troposphere', 'awacs', 'pybars', 'pip',
+                 'botocore.session', 'gcdt.event_source', 'banana']
+
+# run `python -m gcdt.<tool>_main version` and report the loaded modules
+STARTUP_SCRIPT = '''
+import atexit, json, runpy, sys
+
+def report():
+    print(json.dumps(list(sys.modules.keys())))
+
+atexit.register(report)
+sys.argv = ['%(tool)s', 'version']
+runpy.run_module('gcdt.%(tool)s_main', run_name='__main__', alter_sys=True)
+'''
+
+
+@pytest.fixture(scope='function')
+def startup_env(tmpdir):
+    # the update check is enabled but uses a fresh cached result so it does
+    # not start the background lookup
+    home = tmpdir.mkdir('home')
+    home.mkdir('.gcdt').join('update_check.json').write(json.dumps(
+        {'timestamp': time.time(), 'latest_version': '0.0.1'}))
+    env = dict(os.environ, HOME=str(home))
+    env.pop('GCDT_NO_UPDATE_CHECK', None)
+    return env
+
+
+def _run(args, env):
+    # note: `tenkai version` exits with 1
+    process = subprocess.Popen([sys.executable] + args, env=env,
+                               cwd=here('..'), stdout=subprocess.PIPE)
+    return process.communicate()[0]
+
+
+@pytest.mark.parametrize('tool', ['gcdt', 'kumo', 'ramuda', 'tenkai',
+                                  'yugen'])
+def test_startup_lazy_imports(tool, startup_env):
+    output = _run(['-c', STARTUP_SCRIPT % {'tool': tool}], startup_env)
+    modules = json.loads(output.decode('utf-8').strip().splitlines()[-1])
+    assert 'gcdt.gcdt_lifecycle' in modules
+    loaded = [m for m in HEAVY_MODULES if m in modules]
+    assert loaded == []
+
+
+def test_startup_budget(startup_env):
+    # wall clock of the real entry point (including the interpreter start)
+    # take the best of three runs to be robust against noisy neighbours
+    timings = []
+    for _ in range(3):
+        start = time.time()
+        output = _run(['-m', 'gcdt.ramuda_main', 'version'], startup_env)
+        timings.append(time.time() - start)
+        assert b'gcdt version' in output
+    assert min(timings) < STARTUP_BUDGET
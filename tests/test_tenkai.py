@@ -1,7 +1,12 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals, print_function
 
-from gcdt.tenkai_core import _build_bundle_key
+import mock
+
+from gcdt.tenkai_core import _build_bundle_key, \
+    get_deployment_instance_summaries, _get_deployment_instance_summary, \
+    _get_deployment_instance_diagnostics, output_deployment_summary, \
+    output_deployment_diagnostics, INSTANCE_BATCH_SIZE
 
 from gcdt_testtools.helpers import temp_folder  # fixtures!
 
@@ -10,3 +15,68 @@ def test_build_bundle_key():
     application_name = 'sample_name'
     expected = '%s/bundle.tar.gz' % application_name
     assert _build_bundle_key(application_name) == expected
+
+
+def _codedeploy_awsclient(instance_ids):
+    awsclient = mock.Mock()
+    client = awsclient.get_client.return_value
+    client.list_deployment_instances.return_value = {
+        'instancesList': instance_ids}
+
+    def _batch_get_deployment_instances(deploymentId, instanceIds):
+        assert len(instanceIds) <= INSTANCE_BATCH_SIZE
+        return {'instancesSummary': [
+            {'instanceId': 'arn:aws:ec2:eu-west-1:123456789012:instance/%s' %
+                           instance_id, 'status': 'Failed',
+             'lifecycleEvents': [
+                 {'lifecycleEventName': 'ApplicationStop',
+                  'status': 'Succeeded'},
+                 {'lifecycleEventName': 'ApplicationStart',
+                  'status': 'Failed',
+                  'diagnostics': {'errorCode': 'ScriptFailed',
+                                  'scriptName': 'appspec.sh',
+                                  'message': 'failed', 'logTail': ''}}]}
+            for instance_id in reversed(instanceIds)]}
+
+    client.batch_get_deployment_instances.side_effect = \
+        _batch_get_deployment_instances
+    return awsclient, client
+
+
+def test_get_deployment_instance_summaries():
+    instance_ids = ['i-%03d' % i for i in range(60)]
+    awsclient, client = _codedeploy_awsclient(instance_ids)
+
+    summaries = get_deployment_instance_summaries(awsclient, 'd-1')
+    assert [s['instanceId'].split('/')[-1] for s in summaries] == \
+        instance_ids
+    assert client.batch_get_deployment_instances.call_count == 3
+    assert client.get_deployment_instance.call_count == 0
+
+    assert _get_deployment_instance_summary(summaries[0]) == \
+        ('Failed', 'ApplicationStart')
+    assert _get_deployment_instance_diagnostics(summaries[0]) == \
+        ('ScriptFailed', 'appspec.sh', 'failed', '')
+
+
+def test_get_deployment_instance_summaries_no_instances():
+    awsclient, client = _codedeploy_awsclient([])
+    assert get_deployment_instance_summaries(awsclient, 'd-1') == []
+    assert client.batch_get_deployment_instances.call_count == 0
+
+
+@mock.patch('gcdt.tenkai_core.check_log_stream_exists', return_value=False)
+def test_output_deployment_with_shared_summaries(
+        mocked_check_log_stream_exists):
+    awsclient, client = _codedeploy_awsclient(['i-001', 'i-002'])
+    summaries = get_deployment_instance_summaries(awsclient, 'd-1')
+
+    output_deployment_summary(awsclient, 'd-1', summaries)
+    output_deployment_diagnostics(awsclient, 'd-1', 'log_group',
+                                  instance_summaries=summaries)
+    assert client.list_deployment_instances.call_count == 1
+    assert client.batch_get_deployment_instances.call_count == 1
+    assert mocked_check_log_stream_exists.call_count == 2
+    # the log streams are named by instance id
+    mocked_check_log_stream_exists.assert_called_with(
+        awsclient, 'log_group', 'i-002')
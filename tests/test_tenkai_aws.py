@@ -42,8 +42,9 @@ def cleanup_stack_tenkai(awsclient):
 
 
 @pytest.fixture(scope='function')  # 'function' or 'module'
-def sample_codedeploy_app(awsclient):
-    are_credentials_still_valid(awsclient)
+def sample_codedeploy_app(awsclient, tmpdir):
+    are_credentials_still_valid(
+        awsclient, str(tmpdir.join('credentials_check.json')))
     # Set up stack with an ec2 and deployment
     cloudformation, _ = load_cloudformation_template(
         here('resources/sample_codedeploy_app/cloudformation.py')
@@ -62,8 +63,9 @@ def sample_codedeploy_app(awsclient):
 
 @pytest.mark.aws
 @check_preconditions
-def test_tenkai_exit_codes(cleanup_stack_tenkai, awsclient):
-    are_credentials_still_valid(awsclient)
+def test_tenkai_exit_codes(cleanup_stack_tenkai, awsclient, tmpdir):
+    are_credentials_still_valid(
+        awsclient, str(tmpdir.join('credentials_check.json')))
     # Set up stack with an ec2 deployment
     cloudformation, _ = load_cloudformation_template(
         here('resources/sample_codedeploy_app/cloudformation.py')
@@ -113,9 +115,11 @@ def test_tenkai_exit_codes(cleanup_stack_tenkai, awsclient):
 
 @pytest.mark.aws
 @check_preconditions
-def test_output_deployment(cleanup_stack_tenkai, awsclient, logcapture):
+def test_output_deployment(cleanup_stack_tenkai, awsclient, logcapture,
+                           tmpdir):
     logcapture.level = logging.INFO
-    are_credentials_still_valid(awsclient)
+    are_credentials_still_valid(
+        awsclient, str(tmpdir.join('credentials_check.json')))
     # Set up stack with an ec2 deployment
     cloudformation, _ = load_cloudformation_template(
         here('resources/sample_codedeploy_app/cloudformation.py')
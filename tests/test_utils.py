@@ -5,15 +5,19 @@ import nose
 import os
 import sys
 import json
+import time
 from collections import OrderedDict
 
+import mock
 import pytest
 from nose.tools import assert_equal
 
 from gcdt import utils
 from gcdt.utils import retries,  \
     get_command, dict_merge, get_env, get_context, flatten, json2table, \
-    fix_old_kumo_config, dict_selective_merge
+    fix_old_kumo_config, dict_selective_merge, wait_until, WaitTimeoutError, \
+    check_gcdt_update, update_gcdt_version_info, read_json_cache, \
+    write_json_cache, are_credentials_still_valid, _is_newer_version
 from gcdt_testtools.helpers import create_tempfile, preserve_env  # fixtures!
 from gcdt_testtools.helpers import logcapture  # fixtures!
 
@@ -297,5 +301,196 @@ def test_random_string_length10():
     nose.tools.assert_not_equal(ts, utils.random_string())
 
 
+def test_wait_until(monkeypatch):
+    delays = []
+    monkeypatch.setattr('time.sleep', lambda s: delays.append(s))
+    results = iter([None, False, 0, 'ready'])
+
+    assert wait_until(lambda: next(results), delay=1, backoff=2) == 'ready'
+    assert len(delays) == 3
+    # exponential backoff with (equal) jitter
+    for delay, max_delay in zip(delays, [1, 2, 4]):
+        assert max_delay / 2.0 <= delay <= max_delay
+
+
+def test_wait_until_max_delay(monkeypatch):
+    delays = []
+    monkeypatch.setattr('time.sleep', lambda s: delays.append(s))
+    results = iter([False] * 10 + [True])
+
+    assert wait_until(lambda: next(results), max_delay=3, max_wait=1000)
+    assert max(delays) <= 3
+
+
+def test_wait_until_timeout(monkeypatch):
+    delays = []
+    monkeypatch.setattr('time.sleep', lambda s: delays.append(s))
+
+    with pytest.raises(WaitTimeoutError) as einfo:
+        wait_until(lambda: False, max_wait=30, name='my_resource')
+    assert str(einfo.value) == \
+        'Waiting for my_resource timed out after 30 seconds'
+    assert abs(sum(delays) - 30) < 1
+
+
+@pytest.fixture
+def update_check_file(tmpdir, monkeypatch):
+    filename = str(tmpdir.join('update_check.json'))
+    monkeypatch.setattr(utils, 'UPDATE_CHECK_FILE', filename)
+    monkeypatch.delenv('GCDT_NO_UPDATE_CHECK', raising=False)
+    return filename
+
+
+@mock.patch('gcdt.utils._start_update_check')
+def test_check_gcdt_update(mocked_start, update_check_file, logcapture):
+    write_json_cache(update_check_file, {'timestamp': time.time(),
+                                         'latest_version': '99.0.1'})
+
+    check_gcdt_update()
+
+    assert mocked_start.call_count == 0
+    logcapture.check(('gcdt.utils', 'WARNING',
+                      'Please consider an update to gcdt version: 99.0.1'))
+
+
+@mock.patch('gcdt.utils._start_update_check')
+def test_check_gcdt_update_expired(mocked_start, update_check_file,
+                                   logcapture):
+    write_json_cache(update_check_file, {'timestamp': 0,
+                                         'latest_version': '0.0.1'})
+
+    check_gcdt_update()
+    check_gcdt_update()
+
+    # only one background check is started
+    assert mocked_start.call_count == 1
+    assert read_json_cache(update_check_file)['timestamp'] > 0
+    logcapture.check()
+
+
+@mock.patch('gcdt.utils._start_update_check')
+def test_check_gcdt_update_disabled(mocked_start, update_check_file,
+                                    monkeypatch):
+    monkeypatch.setenv('GCDT_NO_UPDATE_CHECK', '1')
+
+    check_gcdt_update()
+
+    assert mocked_start.call_count == 0
+    assert read_json_cache(update_check_file) == {}
+
+
+@mock.patch('gcdt.package_utils.get_package_versions',
+            return_value=('0.0.77', '0.0.88'))
+def test_update_gcdt_version_info(mocked_versions, update_check_file):
+    update_gcdt_version_info()
+
+    state = read_json_cache(update_check_file)
+    assert state['latest_version'] == '0.0.88'
+    assert state['timestamp'] > 0
+
+
+@mock.patch('gcdt.package_utils.get_package_versions',
+            side_effect=Exception('index unreachable'))
+def test_update_gcdt_version_info_offline(mocked_versions, update_check_file):
+    write_json_cache(update_check_file, {'timestamp': 1,
+                                         'latest_version': '0.0.88'})
+
+    update_gcdt_version_info()
+
+    assert read_json_cache(update_check_file) == {'timestamp': 1,
+                                                  'latest_version': '0.0.88'}
+
+
+@pytest.fixture
+def credentials_check_file(tmpdir, monkeypatch):
+    filename = str(tmpdir.join('credentials_check.json'))
+    monkeypatch.setattr(utils, 'CREDENTIALS_CHECK_FILE', filename)
+    return filename
+
+
+def _awsclient_with_credentials():
+    awsclient = mock.Mock()
+    credentials = awsclient.get_credentials.return_value
+    credentials.access_key = 'AKIAEXAMPLE'
+    awsclient.get_profile.return_value = 'my_profile'
+    return awsclient
+
+
+def test_are_credentials_still_valid(credentials_check_file):
+    awsclient = _awsclient_with_credentials()
+    client_sts = awsclient.get_client.return_value
+
+    assert are_credentials_still_valid(awsclient) == 0
+    assert are_credentials_still_valid(awsclient) == 0
+
+    # the second check uses the cached result
+    awsclient.get_client.assert_called_once_with('sts')
+    assert client_sts.get_caller_identity.call_count == 1
+    cache = read_json_cache(credentials_check_file)
+    assert list(cache.keys())[0].startswith('my_profile:')
+    # the access key is not stored
+    assert 'AKIAEXAMPLE' not in json.dumps(cache)
+    entry = list(cache.values())[0]
+    assert abs(entry['valid_until'] - time.time() -
+               utils.CREDENTIALS_CHECK_TTL) < 10
+
+
+def test_are_credentials_still_valid_cache_file(tmpdir):
+    cache_file = str(tmpdir.join('check.json'))
+    awsclient = _awsclient_with_credentials()
+
+    assert are_credentials_still_valid(awsclient, cache_file) == 0
+    assert len(read_json_cache(cache_file)) == 1
+
+
+def test_are_credentials_still_valid_ttl(credentials_check_file):
+    awsclient = _awsclient_with_credentials()
+    client_sts = awsclient.get_client.return_value
+
+    assert are_credentials_still_valid(awsclient) == 0
+    with mock.patch('gcdt.utils.time.time',
+                    return_value=time.time() +
+                    utils.CREDENTIALS_CHECK_TTL + 1):
+        assert are_credentials_still_valid(awsclient) == 0
+    assert client_sts.get_caller_identity.call_count == 2
+
+
+def test_are_credentials_still_valid_new_access_key(credentials_check_file):
+    awsclient = _awsclient_with_credentials()
+    client_sts = awsclient.get_client.return_value
+
+    assert are_credentials_still_valid(awsclient) == 0
+    # e.g. refreshed temporary credentials
+    awsclient.get_credentials.return_value.access_key = 'ASIAEXAMPLE'
+    assert are_credentials_still_valid(awsclient) == 0
+    assert client_sts.get_caller_identity.call_count == 2
+
+
+def test_are_credentials_still_valid_invalid(credentials_check_file):
+    awsclient = _awsclient_with_credentials()
+    client_sts = awsclient.get_client.return_value
+    client_sts.get_caller_identity.side_effect = Exception('invalid token')
+
+    assert are_credentials_still_valid(awsclient) == 1
+    assert are_credentials_still_valid(awsclient) == 1
+    assert client_sts.get_caller_identity.call_count == 2
+    assert read_json_cache(credentials_check_file) == {}
+
+
 # TODO get_outputs_for_stack
 # TODO test_make_command
+
+
+@pytest.mark.parametrize('version_a, version_b, expected', [
+    ('0.1.437', '0.1.436', True),
+    ('0.1.436', '0.1.436', False),
+    ('0.1.436', '0.1.437', False),
+    ('0.2', '0.1.999', True),
+    ('0.1.10', '0.1.9', True),
+    ('1.0', '1.0.0', False),
+    ('0.1.436', '0.1.436.dev0', True),
+    ('0.1.436.dev0', '0.1.436', False),
+    ('0.1.436', 'unknown', False),
+])
+def test_is_newer_version(version_a, version_b, expected):
+    assert _is_newer_version(version_a, version_b) is expected
@@ -1,12 +1,19 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals, print_function
+import json
 import os
 import textwrap
 
+import mock
+from botocore.exceptions import ClientError
 from nose.tools import assert_equal
 
+from gcdt import yugen_core
 from gcdt.yugen_core import _compile_template, _arn_to_uri, \
-    _get_region_and_account_from_lambda_arn
+    _get_region_and_account_from_lambda_arn, _api_by_name, \
+    _import_from_swagger, get_lambdas, _update_from_swagger, \
+    _get_swagger_hash, _create_deployment, SWAGGER_HASH_VARIABLE, \
+    _ensure_lambdas_permissions
 from gcdt_testtools.helpers import create_tempfile, cleanup_tempfiles
 
 
@@ -66,3 +73,176 @@ def test_arn_to_uri():
     lambda_arn = 'arn:aws:lambda:eu-west-1:644239850139:function:dp-dev-process-keyword-extraction'
     uri = _arn_to_uri(lambda_arn, 'ACTIVE')
     assert_equal(uri, 'arn:aws:apigateway:eu-west-1:lambda:path/2015-03-31/functions/arn:aws:lambda:eu-west-1:644239850139:function:dp-dev-process-keyword-extraction:ACTIVE/invocations')
+
+
+def _apigateway_awsclient(apis):
+    awsclient = mock.Mock()
+    client = awsclient.get_client.return_value
+    client.meta.region_name = 'eu-west-1'
+    client.can_paginate.return_value = True
+    client.get_paginator.return_value.paginate.side_effect = \
+        lambda **kwargs: iter([{'items': apis}])
+    return awsclient, client
+
+
+def test_api_by_name_is_looked_up_once_per_run():
+    awsclient, client = _apigateway_awsclient([
+        {'id': 'id1', 'name': 'api1'}, {'id': 'id2', 'name': 'api2'}])
+
+    assert _api_by_name(awsclient, 'api2') == {'id': 'id2', 'name': 'api2'}
+    assert _api_by_name(awsclient, 'api2') == {'id': 'id2', 'name': 'api2'}
+    assert _api_by_name(awsclient, 'api3') is None
+    assert _api_by_name(awsclient, 'api3') is None
+    assert client.get_paginator.call_count == 2
+
+    # a new run looks up again
+    other_awsclient, other_client = _apigateway_awsclient([])
+    assert _api_by_name(other_awsclient, 'api2') is None
+
+
+def test_api_by_name_updated_by_import():
+    awsclient, client = _apigateway_awsclient([])
+    client.import_rest_api.return_value = {
+        'id': 'id3', 'name': 'api3', 'ResponseMetadata': {}}
+
+    assert _api_by_name(awsclient, 'api3') is None
+    with mock.patch('gcdt.yugen_core._compile_template', return_value='{}'):
+        _import_from_swagger(awsclient, 'api3', 'description', 'dev', [])
+    assert _api_by_name(awsclient, 'api3') == {'id': 'id3', 'name': 'api3'}
+    assert client.get_paginator.call_count == 1
+
+
+def test_get_lambdas_resolves_arns():
+    awsclient = mock.Mock()
+    client_lambda = awsclient.get_client.return_value
+    client_lambda.get_function.side_effect = lambda FunctionName: {
+        'Configuration': {'FunctionArn': 'arn:%s' % FunctionName}}
+    config = {'lambda': {'entries': [
+        {'name': 'fn%d' % i, 'alias': 'ACTIVE', 'swaggerRef': 'ref%d' % i}
+        for i in range(20)
+    ]}}
+
+    lambdas = get_lambdas(awsclient, config, add_arn=True)
+    assert [l['arn'] for l in lambdas] == ['arn:fn%d' % i for i in range(20)]
+    assert client_lambda.get_function.call_count == 20
+
+    # cached for the run
+    get_lambdas(awsclient, config, add_arn=True)
+    assert client_lambda.get_function.call_count == 20
+
+
+def test_compile_template_is_cached(cleanup_tempfiles):
+    swagger_template_file = create_tempfile('title: {{apiName}}')
+    cleanup_tempfiles.append(swagger_template_file)
+
+    with mock.patch.dict(yugen_core._template_cache, clear=True), \
+            mock.patch('gcdt.yugen_core.Compiler',
+                       wraps=yugen_core.Compiler) as mocked_compiler:
+        assert _compile_template(swagger_template_file,
+                                 {'apiName': 'api1'}) == 'title: api1'
+        assert _compile_template(swagger_template_file,
+                                 {'apiName': 'api2'}) == 'title: api2'
+    assert mocked_compiler.call_count == 1
+
+
+def test_update_from_swagger_unchanged():
+    awsclient, client = _apigateway_awsclient([{'id': 'id1', 'name': 'api1'}])
+    swagger_hash = _get_swagger_hash('swagger', 'dev')
+    client.get_stage.return_value = {
+        'variables': {SWAGGER_HASH_VARIABLE: swagger_hash}}
+
+    with mock.patch('gcdt.yugen_core._compile_template',
+                    return_value='swagger'):
+        assert _update_from_swagger(awsclient, 'api1', 'description', 'dev',
+                                    []) == (False, swagger_hash)
+        assert client.put_rest_api.call_count == 0
+        client.get_stage.assert_called_once_with(restApiId='id1',
+                                                 stageName='dev')
+
+        # changed swagger
+        client.put_rest_api.return_value = {'id': 'id1', 'name': 'api1'}
+        assert _update_from_swagger(awsclient, 'api1', 'description', 'prod',
+                                    []) == \
+            (True, _get_swagger_hash('swagger', 'prod'))
+        assert client.put_rest_api.call_count == 1
+
+
+def test_update_from_swagger_stage_settings_changed():
+    awsclient, client = _apigateway_awsclient([{'id': 'id1', 'name': 'api1'}])
+    settings = {'apiKey': 'key1',
+                'customDomain': {'domainName': 'api.example.com',
+                                 'basePath': 'v1'}}
+    client.get_stage.return_value = {'variables': {
+        SWAGGER_HASH_VARIABLE: _get_swagger_hash('swagger', 'dev', settings)}}
+    client.put_rest_api.return_value = {'id': 'id1', 'name': 'api1'}
+
+    with mock.patch('gcdt.yugen_core._compile_template',
+                    return_value='swagger'):
+        assert _update_from_swagger(awsclient, 'api1', 'description', 'dev',
+                                    [], settings)[0] is False
+
+        # only the base path changed
+        settings['customDomain']['basePath'] = 'v2'
+        assert _update_from_swagger(awsclient, 'api1', 'description', 'dev',
+                                    [], settings) == \
+            (True, _get_swagger_hash('swagger', 'dev', settings))
+        assert client.put_rest_api.call_count == 1
+
+
+def test_create_deployment_stores_swagger_hash():
+    awsclient, client = _apigateway_awsclient([{'id': 'id1', 'name': 'api1'}])
+    client.create_deployment.return_value = {}
+
+    _create_deployment(awsclient, 'api1', 'dev', 'abc')
+    client.create_deployment.assert_called_once_with(
+        restApiId='id1', stageName='dev', description='TO BE FILLED',
+        variables={SWAGGER_HASH_VARIABLE: 'abc'})
+
+
+def _policy(*source_arns):
+    return {'Policy': json.dumps({'Statement': [{
+        'Effect': 'Allow',
+        'Action': 'lambda:InvokeFunction',
+        'Principal': {'Service': 'apigateway.amazonaws.com'},
+        'Condition': {'ArnLike': {'AWS:SourceArn': source_arn}}
+    } for source_arn in source_arns]})}
+
+
+def test_ensure_lambdas_permissions(capsys):
+    awsclient = mock.Mock()
+    client_lambda = awsclient.get_client.return_value
+    source_arn = 'arn:aws:execute-api:eu-west-1:123456789012:id1/*/*'
+    policies = {
+        'arn:aws:lambda:eu-west-1:123456789012:function:fn1:ACTIVE':
+            _policy(source_arn),
+        'arn:aws:lambda:eu-west-1:123456789012:function:fn2:ACTIVE':
+            _policy('arn:aws:execute-api:eu-west-1:123456789012:id2/*/*')
+    }
+
+    def _get_policy(FunctionName):
+        if FunctionName not in policies:
+            raise ClientError({'Error': {'Code': 'ResourceNotFoundException'}},
+                              'GetPolicy')
+        return policies[FunctionName]
+
+    client_lambda.get_policy.side_effect = _get_policy
+    lambdas = [
+        {'name': 'fn%d' % i, 'alias': 'ACTIVE', 'swagger_ref': 'ref%d' % i,
+         'arn': 'arn:aws:lambda:eu-west-1:123456789012:function:fn%d' % i}
+        for i in range(1, 4)
+    ]
+    lambdas.append({'name': 'fn4', 'alias': 'ACTIVE', 'swagger_ref': 'ref4'})
+
+    _ensure_lambdas_permissions(awsclient, lambdas, {'id': 'id1'})
+
+    assert client_lambda.get_policy.call_count == 3
+    assert sorted([c[1]['FunctionName'] for c in
+                   client_lambda.add_permission.call_args_list]) == \
+        ['fn2', 'fn3']
+    for c in client_lambda.add_permission.call_args_list:
+        assert c[1]['SourceArn'] == source_arn
+        assert c[1]['Qualifier'] == 'ACTIVE'
+    out = capsys.readouterr()[0]
+    assert 'Lambda function fn4 could not be found' in out
+    assert out.count('added') == 2
+    assert out.count('exists') == 1